@@ -6,6 +6,9 @@ import os
 import asyncio, uvloop, json
 
 from src.IR_Ensemble.QA_Assistant.bucket_monitor import BucketMonitor
+from src.IR_Ensemble.QA_Assistant.metrics_server import MetricsServer
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics
+from src.IR_Ensemble.QA_Assistant.evidence_index import drop_topic_index
 from src.IR_Ensemble.QA_Assistant.Searcher import cohere_client
 from src.IR_Ensemble.QA_Assistant.daemon_wrapper import JVMDaemon 
 from src.IR_Ensemble.context_builder import ContextProctor
@@ -14,21 +17,22 @@ from src.ReportEvaluator.report_evaluator import ReportEvaluator, EvalStatus
 
 load_dotenv()
 MAX_ROUNDS = 3
+MAX_TOPICS = int(os.getenv("MAX_TOPICS", "0"))  # topics in flight at once (0 = all); see Simulation/planner
 
-async def get_context(client: AsyncAzureOpenAI, questions: list[dict[str,str]], num: int) -> str:
+async def get_context(client: AsyncAzureOpenAI, questions: list[dict[str,str]], num: int,
+                      seen: set[str], topic_id: str | None = None) -> str:
     """
     Get search results for a set of questions.
+    *seen* carries the questions already answered in earlier rounds of the topic;
+    *topic_id* is the topic's docid, which scopes the answer cache across runs.
     """
-    proc = ContextProctor(client, questions, num)
+    proc = ContextProctor(client, questions, num, seen=seen, topic_id=topic_id)
     try: 
-        await proc.create_context()
-        # clear mem
-        with open(proc.context_path, "r") as f: return f.read()
-        del proc
+        result = await proc.create_context()
+        return result.render()
     except Exception as e:
         print(e)
         traceback.print_exc()
-        del proc
         raise RuntimeError("Failed to get context")
 
 async def _main(gen_client: AsyncAzureOpenAI,
@@ -51,19 +55,25 @@ async def _main(gen_client: AsyncAzureOpenAI,
     rounds = 0
     note,context = [None]*2
     questions = []
+    seen: set[str] = set()   # questions whose answers earlier rounds already delivered
     evaluation = "No evaluation yet"
 
     # run loop
-    while rounds < MAX_ROUNDS:
-        if rounds == 0:
-            pass
-        else:
-            context = await get_context(client = ir_client, questions = questions, num = num)
-        report,note = await gen.generate_report(context, note, evaluation)
-        note,questions,evaluation = await eval_.evaluate(report = report, generator_comment = note, ir_context = context)
-        if eval_.status == EvalStatus.PASS:
-            break
-        rounds += 1
+    try:
+        while rounds < MAX_ROUNDS:
+            if rounds == 0:
+                pass
+            else:
+                context = await get_context(client = ir_client, questions = questions, num = num, seen = seen,
+                                            topic_id = id)
+            report,note = await gen.generate_report(context, note, evaluation)
+            note,questions,evaluation = await eval_.evaluate(report = report, generator_comment = note, ir_context = context)
+            if eval_.status == EvalStatus.PASS:
+                break
+            rounds += 1
+    finally:
+        drop_topic_index(num)   # even a failed topic frees its evidence index
+    call_metrics.add("topics_completed")
     return {"id":id,"report":eval_.best['report'], "score": eval_.best['score']}
 
 async def main(topics: list[dict[str,str]]) -> None:
@@ -73,7 +83,7 @@ async def main(topics: list[dict[str,str]]) -> None:
         api_key=os.environ["AZURE_OPENAI_KEY"],
         api_version=API_VER,
         timeout=120,
-        max_retries=5,
+        max_retries=0,  # retries are re-gated through the buckets (QA_Assistant/retry.py)
     )
 
     ir_client = AsyncAzureOpenAI(
@@ -81,17 +91,19 @@ async def main(topics: list[dict[str,str]]) -> None:
         api_key=os.environ["IR_AZURE_OPENAI_KEY"],
         api_version=API_VER,
         timeout=120,
-        max_retries=5,
+        max_retries=0,  # retries are re-gated through the buckets (QA_Assistant/retry.py)
     )
 
     bm = BucketMonitor()
+    ms = MetricsServer.from_env()  # optional Prometheus endpoint (METRICS_PORT)
     try: 
         await bm.start()
-        tasks = [_main(gen_client=gen_client,
-                           ir_client=ir_client,
-                           topic=topic,
-                           num=num)
-                    for num,topic in enumerate(topics)]
+        if ms: await ms.start()
+        gate = asyncio.Semaphore(MAX_TOPICS or len(topics) or 1)
+        async def _gated(topic, num):
+            async with gate:
+                return await _main(gen_client=gen_client, ir_client=ir_client, topic=topic, num=num)
+        tasks = [_gated(topic, num) for num,topic in enumerate(topics)]
         results = await asyncio.gather(*tasks)
         # write results to file
         with open("RES.txt","a", encoding="utf-8") as f:
@@ -105,6 +117,7 @@ async def main(topics: list[dict[str,str]]) -> None:
         await cohere_client.aclose()
         await JVMDaemon.stop()
         await bm.stop()
+        if ms: await ms.stop()
 
 if __name__ == "__main__":
     count = 0
@@ -14,46 +14,98 @@ import os
 from  pathlib import Path
 from functools import partial
 from dotenv import load_dotenv; load_dotenv()
-from typing import List
+from typing import Container, List, Optional
 from uuid import uuid4
 
 from src.IR_Ensemble.QA_Assistant.rate_limits import gated_cohere_rerank_call
+from src.IR_Ensemble.QA_Assistant.admission import AdmissionRejected
 from src.IR_Ensemble.QA_Assistant.daemon_wrapper import JVMDaemon
+from src.IR_Ensemble.QA_Assistant.evidence_index import terms, topic_index
 
 cohere_client = httpx.AsyncClient(timeout=80.0) 
+RERANK_MAX_WAIT: Optional[float] = None   # seconds a rerank may queue before BM25 order is used (None = no cap)
+TOP_K: int = 15
 
-async def search(queries: List[str], master_query, agentId) -> List[dict]:
+async def search(queries: List[str], master_query, agentId, deadline=None, topic=None,
+                 exclude: Container[str] = ()) -> List[dict]:
     """
     Perform full search pipeline
+    Segments in *exclude* (already read by the agent) never reach the reranker.
     """
     results = os.getenv("BM25_RESULTS_PATH")
     path = Path(f"{results}/{agentId}/results-{uuid4()}.jsonl")
     await JVMDaemon.run_bm25_search(queries, path)
-    return await rerank_jsonl(path, master_query)
+    return await rerank_jsonl(path, master_query, deadline=deadline, topic=topic, exclude=exclude)
 
 JAVA_CLASSPATH = "src/QA_Assistant/Search/lib/*:."
 
-async def rerank_jsonl(jsonl_path: Path, master_query: str) -> List[dict]:
+# ───────────────────────────── speculative queries ─────────────────────────────
+SPECULATIVE_TERMS: int = 12     # content words per locally built BM25 query
+
+def keyword_query(text: str, max_terms: int = SPECULATIVE_TERMS) -> str:
+    """Content words of *text* in order of first appearance – a BM25 query built locally."""
+    return " ".join(list(dict.fromkeys(terms(text)))[:max_terms])
+
+
+def speculative_searches(questions: str, limit: Optional[int] = 2) -> List[dict]:
+    """`search` kwargs for up to *limit* questions of a `<questions>` block (JSON lines).
+
+    Keyword queries come from each item's ``question`` and ``context`` /
+    ``doc_context`` fields; the question itself is the rerank master query.
+    """
+    calls = []
+    for line in questions.splitlines():
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            item = {"question": line}
+        if not isinstance(item, dict):
+            continue
+        question = str(item.get("question") or "").strip()
+        context = str(item.get("context") or item.get("doc_context") or "")
+        queries = list(dict.fromkeys(q for q in (keyword_query(question), keyword_query(context)) if q))
+        if question and queries:
+            calls.append({"queries": queries, "master_query": question})
+    return calls[:limit]
+
+async def rerank_jsonl(jsonl_path: Path, master_query: str, deadline=None, topic=None,
+                       exclude: Container[str] = ()) -> List[dict]:
     """
     Async: Reads a JSONL file at `jsonl_path` (output from your Java Searcher),
     extracts each record's 'segment' text, sends them to Cohere's v2 rerank API
     against `master_query`, and returns a list of the top 75 results
-    with only 'title', 'url', 'headings', and 'segmentId'.
+    with only 'title', 'url', 'headings', 'segmentId' and the rerank
+    'relevance_score' (absent on the BM25 fallback).
+    If the rerank cannot be admitted before *deadline* / RERANK_MAX_WAIT the
+    BM25 order is kept instead.
+    Segments whose id is in *exclude* are dropped before the rerank, so the
+    top slots go to evidence the caller has not read yet.
+    Every segment read is also added to *topic*'s `evidence_index`.
     """
 
     # 1) Read and buffer all segments + metadata
     segments = []
     meta     = []
+    index = topic_index(topic) if topic is not None else None   # every fetched segment
     async with aiofiles.open(jsonl_path, mode="r", encoding="utf-8") as f:
         async for line in f:
             obj = json.loads(line)
-            segments.append(obj.get("segment", ""))
-            meta.append({
+            m = {
                 "title":     obj.get("title"),
                 "url":       obj.get("url"),
                 "headings":  obj.get("headings"),  
                 "segment_id": obj.get("docid")
-            })
+            }
+            if index is not None:
+                index.add(m["segment_id"],
+                          f"{m['title'] or ''} {m['headings'] or ''} {obj.get('segment', '')}", m)
+            if m["segment_id"] in exclude:
+                continue
+            segments.append(obj.get("segment", ""))
+            meta.append(m)
+
+    if not segments:
+        return []
 
     # 2) Call Cohere v2 Rerank endpoint
     payload = {
@@ -67,10 +119,18 @@ async def rerank_jsonl(jsonl_path: Path, master_query: str) -> List[dict]:
         cohere_client.post,
         "https://api.cohere.com/v2/rerank"
     )
-    resp = await gated_cohere_rerank_call(     
-        cohere_call,
-        json=payload
-    )
+    try:
+        resp = await gated_cohere_rerank_call(     
+            cohere_call,
+            deadline=deadline,
+            max_wait=RERANK_MAX_WAIT,
+            topic=topic,
+            json=payload
+        )
+    except AdmissionRejected as exc:
+        # Overloaded – skip the rerank, BM25 already ranked the segments
+        print(f"Skipping rerank: {exc}")
+        return [meta[i] for i in range(min(TOP_K, len(meta)))]
     resp.raise_for_status()
     body = resp.json()
 
@@ -79,7 +139,7 @@ async def rerank_jsonl(jsonl_path: Path, master_query: str) -> List[dict]:
         body.get("results", []),
         key=lambda x: x["relevance_score"],
         reverse=True
-    )[:15] 
+    )[:TOP_K] 
 
     # 4) Build output list with only the requested metadata
     out_list = []
@@ -90,7 +150,8 @@ async def rerank_jsonl(jsonl_path: Path, master_query: str) -> List[dict]:
             "title":     m["title"],
             "url":       m["url"],
             "headings":  m["headings"],
-            "segment_id": m["segment_id"]
+            "segment_id": m["segment_id"],
+            "relevance_score": round(r["relevance_score"], 4),
         })
     return out_list
 
@@ -0,0 +1,173 @@
+"""
+adaptive_limits.py
+~~~~~~~~~~~~~~~~~~
+Header‑driven feedback control for `AsyncTokenBucket` capacities.
+
+The configured caps (`quotas.QUOTAS`, `COHERE_RERANK_CAP`, …) are only a
+starting point.  After every gated call the wrapper hands the response
+headers to `observe_headers`, which nudges the bucket capacity toward what
+the server says is really available:
+
+* ``x-ratelimit-remaining-*`` → estimate = local load + server remaining,
+  smoothed with an EWMA and clamped to ``[floor, ceiling]``.
+* ``x-ratelimit-limit-*``     → becomes the ceiling (the real quota).
+* 429 / ``retry-after``       → multiplicative decrease and the bucket is
+  paused until the server's retry time has passed.
+
+Usage
+-----
+````python
+raw = await client.responses.with_raw_response.create(...)
+observe_headers(raw.headers, req=req_bucket, tok=tok_bucket)
+...
+except Exception as exc:
+    observe_error(exc, req=req_bucket, tok=tok_bucket)
+    raise
+````
+"""
+from __future__ import annotations
+
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional, Sequence
+
+from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics
+
+# ───────────────────────────────────────── config ────────────────────────────
+ALPHA: float = 0.2          # EWMA weight of each new header observation
+DECREASE: float = 0.7       # multiplicative decrease on 429
+FLOOR_FRAC: float = 0.25    # never shrink below this share of the configured cap
+MAX_GROWTH: float = 2.0     # without a limit header, never grow past this × configured cap
+
+# Header names per bucket kind (first match wins)
+REMAINING_HEADERS: Dict[str, Sequence[str]] = {
+    "requests": ("x-ratelimit-remaining-requests", "x-trial-endpoint-call-remaining"),
+    "tokens":   ("x-ratelimit-remaining-tokens",),
+}
+LIMIT_HEADERS: Dict[str, Sequence[str]] = {
+    "requests": ("x-ratelimit-limit-requests", "x-trial-endpoint-call-limit"),
+    "tokens":   ("x-ratelimit-limit-tokens",),
+}
+
+
+# ───────────────────────────────────────── helpers ───────────────────────────
+
+def _header(headers: Mapping[str, str], names: Sequence[str]) -> Optional[float]:
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def retry_after_seconds(headers: Mapping[str, str] | None) -> Optional[float]:
+    """Parse ``retry-after-ms`` / ``retry-after`` (seconds or HTTP date)."""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms is not None:
+        try:
+            return max(0.0, float(ms) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+# ───────────────────────────────────────── controller ────────────────────────
+
+class AdaptiveLimit:
+    """EWMA / multiplicative‑decrease controller for a single bucket."""
+
+    def __init__(self, bucket: AsyncTokenBucket, kind: str) -> None:
+        self.bucket = bucket
+        self.kind = kind
+        self.configured = bucket.base_capacity
+        self.floor = max(1, int(self.configured * FLOOR_FRAC))
+        self.ceiling = int(self.configured * MAX_GROWTH)
+        self._estimate = float(bucket.capacity)
+
+    def _apply(self) -> None:
+        self._estimate = min(max(self._estimate, self.floor), self.ceiling)
+        self.bucket.set_capacity(int(self._estimate))
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Track the server's view of the quota from a successful response."""
+        limit = _header(headers, LIMIT_HEADERS[self.kind])
+        if limit:
+            self.ceiling = int(limit)
+            self.floor = min(self.floor, self.ceiling)
+        remaining = _header(headers, REMAINING_HEADERS[self.kind])
+        if remaining is None:
+            return
+        target = self.bucket.current_load() + remaining
+        self._estimate = (1 - ALPHA) * self._estimate + ALPHA * target
+        self._apply()
+
+    def throttled(self, retry_after: Optional[float]) -> None:
+        """Back off after a 429: shrink capacity and pause for *retry_after*."""
+        self._estimate *= DECREASE
+        self._apply()
+        if retry_after:
+            self.bucket.pause(retry_after)
+
+
+_controllers: Dict[int, AdaptiveLimit] = {}
+
+
+def controller(bucket: AsyncTokenBucket, kind: str) -> AdaptiveLimit:
+    """Return the (lazily created) controller attached to *bucket*."""
+    ctl = _controllers.get(id(bucket))
+    if ctl is None or ctl.bucket is not bucket:
+        ctl = _controllers[id(bucket)] = AdaptiveLimit(bucket, kind)
+    return ctl
+
+
+# ─────────────────────────────────── public hooks ────────────────────────────
+
+def observe_headers(
+    headers: Mapping[str, str] | None,
+    *,
+    req: AsyncTokenBucket | None = None,
+    tok: AsyncTokenBucket | None = None,
+) -> None:
+    """Feed response headers to the request / token bucket controllers."""
+    if not headers:
+        return
+    if req is not None:
+        controller(req, "requests").observe(headers)
+    if tok is not None:
+        controller(tok, "tokens").observe(headers)
+
+
+def observe_error(
+    exc: BaseException | Any,
+    *,
+    req: AsyncTokenBucket | None = None,
+    tok: AsyncTokenBucket | None = None,
+) -> None:
+    """Back off the controllers if *exc* (or an httpx response) is a 429."""
+    response = getattr(exc, "response", exc)
+    status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return
+    headers = getattr(response, "headers", None)
+    wait = retry_after_seconds(headers)
+    named = req if req is not None else tok
+    call_metrics.add("throttled", bucket=getattr(named, "name", None) or "cohere")
+    for bucket, kind in ((req, "requests"), (tok, "tokens")):
+        if bucket is not None:
+            controller(bucket, kind).throttled(wait)
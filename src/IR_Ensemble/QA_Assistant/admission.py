@@ -0,0 +1,69 @@
+"""
+admission.py
+~~~~~~~~~~~~
+Deadline‑aware admission control for the gated wrappers.
+
+A caller may pass an absolute *deadline* (``time.monotonic()`` seconds)
+and/or a *max_wait* (seconds it is willing to queue) to `gated_response`,
+`gated_call_gen` or `gated_cohere_rerank_call`.  Before anything is reserved
+the gate asks every bucket it needs how long the reservation would wait
+(`AsyncTokenBucket.predict_wait`).  Work that cannot start in time is
+rejected with `AdmissionRejected` instead of queueing, and a bucket that is
+already waiting gives up as soon as its next sleep would cross the deadline.
+
+Callers downgrade on rejection (skip rerank, auto‑select, cut the round
+short) so tail latency stays bounded under overload.
+
+Usage
+-----
+````python
+try:
+    resp = await gated_response(..., max_wait=30)
+except AdmissionRejected:
+    ...  # cheaper fallback
+````
+"""
+from __future__ import annotations
+
+import time
+from typing import Iterable, Optional, Tuple
+
+
+class AdmissionRejected(Exception):
+    """The gate predicted (or hit) a queue wait beyond the caller's deadline."""
+
+    def __init__(self, label: str, predicted_wait: float, budget: float) -> None:
+        super().__init__(
+            f"{label}: predicted wait {predicted_wait:.1f}s exceeds budget {max(budget, 0):.1f}s"
+        )
+        self.label = label
+        self.predicted_wait = predicted_wait
+        self.budget = budget
+
+
+def resolve_deadline(deadline: Optional[float] = None,
+                     max_wait: Optional[float] = None) -> Optional[float]:
+    """Combine an absolute *deadline* and a relative *max_wait* (earliest wins)."""
+    if max_wait is not None:
+        relative = time.monotonic() + max_wait
+        deadline = relative if deadline is None else min(deadline, relative)
+    return deadline
+
+
+def admit(reservations: Iterable[Tuple[object, int]],
+          deadline: Optional[float],
+          *,
+          label: str = "call") -> float:
+    """Raise `AdmissionRejected` if any (bucket, weight) cannot start by *deadline*.
+
+    Returns the largest predicted wait (0 when there is no deadline).  The
+    prediction ignores other waiters, so it is a lower bound; buckets enforce
+    the deadline again while they wait.
+    """
+    if deadline is None:
+        return 0.0
+    budget = deadline - time.monotonic()
+    wait = max((bucket.predict_wait(weight) for bucket, weight in reservations), default=0.0)
+    if wait > budget:
+        raise AdmissionRejected(label, wait, budget)
+    return wait
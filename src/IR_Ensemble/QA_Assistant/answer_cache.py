@@ -0,0 +1,185 @@
+"""
+answer_cache.py
+~~~~~~~~~~~~~~~
+Persistent cache of finished evaluator‑question answers.
+
+`ReportEvaluator` asks the same – or nearly the same – questions again in
+later rounds of a topic and in later runs over the same topics, and every
+one used to cost a full search / select / update agent loop.  Every question
+an agent marks ``finished`` is stored here with its answer, citations and
+cited segment ids; `ContextProctor` answers hits directly and only sends the
+misses to agents.
+
+Lookup is exact on the normalised question first: together with its
+document ``context`` that match holds across topics, without one it only
+holds within the same topic.  Then a TF‑IDF cosine over the cached questions
+of the **same topic** (sparse postings over `evidence_index.terms`) catches
+near‑duplicates scoring at least *threshold* – a context‑free question
+researched against another topic document is never handed out.
+
+The store is an append‑only JSONL file (a later entry for the same key wins),
+loaded once per process and appended to through aiofiles.
+
+Environment
+-----------
+``ANSWER_CACHE_PATH=DerivedData/ContextBuilder/answer_cache.jsonl``
+``ANSWER_CACHE_SIMILARITY=0.85`` (optional)
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+import aiofiles
+
+from src.IR_Ensemble.QA_Assistant.evidence_index import terms
+from src.IR_Ensemble.QA_Assistant.metrics_server import register_cache
+
+SIMILARITY: float = 0.85
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalise(question: str) -> str:
+    """Case, punctuation and whitespace‑insensitive cache key."""
+    return " ".join(_PUNCT_RE.sub(" ", question.lower()).split())
+
+
+def question_context(item: Dict[str, Any]) -> str:
+    """The document snippet an evaluator question was asked against (``context``, or legacy ``doc_context``)."""
+    return str(item.get("context") or item.get("doc_context") or "")
+
+
+def cache_key(question: str, context: str = "", topic: Optional[Any] = None) -> str:
+    """
+    Exact‑match key: the normalised question and its document *context*; a
+    question without context is only the same question within *topic*.
+    """
+    context = normalise(context)
+    return normalise(question) + "\x1f" + (context or "\x1f" + str(topic))
+
+
+class AnswerCache:
+    """Exact + near‑duplicate lookup over finished answers, backed by a JSONL file."""
+
+    def __init__(self, path: str, *, threshold: float = SIMILARITY) -> None:
+        self.path = path
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, Dict[str, Any]] = {}          # key → entry
+        self._tf: Dict[str, Dict[str, int]] = {}               # key → term counts
+        self._postings: Dict[str, set] = {}                    # term → keys
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._index(json.loads(line))
+                    except (json.JSONDecodeError, KeyError, AttributeError):
+                        continue  # a torn last line from an interrupted run
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Tuple[int, int]:
+        return self.hits, self.misses
+
+    # ───────────────────────────────── lookup ───────────────────────────────
+    def get(self, question: str, context: str = "", *,
+            topic: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+        """The cached entry answering *question* about *context*, or ``None``.
+
+        Without a *context* – and for near‑duplicates always – only *topic*'s
+        entries are considered; with no *topic* either there is no such match.
+        """
+        entry = None
+        if normalise(context) or topic is not None:
+            entry = self._entries.get(cache_key(question, context, topic))
+        if entry is None and topic is not None:
+            entry = self._nearest(normalise(question), topic)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def _nearest(self, question: str, topic: Any) -> Optional[Dict[str, Any]]:
+        """Best TF‑IDF cosine match of *topic* at or above the threshold."""
+        query = self._counts(question)
+        if not query or not self._entries:
+            return None
+        n = len(self._entries)
+        idf: Dict[str, float] = {}
+
+        def vector(counts: Dict[str, int]) -> Dict[str, float]:
+            for t in counts:
+                if t not in idf:
+                    idf[t] = math.log((n + 1) / (len(self._postings.get(t, ())) + 1)) + 1
+            return {t: c * idf[t] for t, c in counts.items()}
+
+        q_vec = vector(query)
+        q_norm = math.sqrt(sum(w * w for w in q_vec.values()))
+        best, best_score = None, self.threshold
+        for cand in set().union(*(self._postings.get(t, ()) for t in query)):
+            if self._entries[cand].get("topic") != topic:
+                continue
+            c_vec = vector(self._tf[cand])
+            c_norm = math.sqrt(sum(w * w for w in c_vec.values()))
+            score = sum(w * c_vec.get(t, 0.0) for t, w in q_vec.items()) / (q_norm * c_norm)
+            if score >= best_score:
+                best, best_score = cand, score
+        return self._entries[best] if best else None
+
+    # ───────────────────────────────── store ────────────────────────────────
+    async def put(self, item: Dict[str, Any], *, topic: Optional[Any] = None) -> None:
+        """Store a finished question item (``question``, ``context``, ``answer`` …) and append it to the file."""
+        question = item.get("question")
+        if not question:
+            return
+        answer = item.get("answer") or {}
+        citations = (answer.get("citations") or []) if isinstance(answer, dict) else []
+        entry = {
+            "question": question,
+            "doc_context": question_context(item),
+            "answer": answer,
+            "segment_ids": [c["citation"] for c in citations if isinstance(c, dict) and c.get("citation")],
+            "topic": topic,
+            "ts": time.time(),
+        }
+        self._index(entry)
+        async with aiofiles.open(self.path, "a", encoding="utf-8") as f:
+            await f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    # ─────────────────────────────── internals ──────────────────────────────
+    @staticmethod
+    def _counts(question: str) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for t in terms(question):
+            counts[t] = counts.get(t, 0) + 1
+        return counts
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        key = cache_key(str(entry["question"]), question_context(entry), entry.get("topic"))
+        if key in self._tf:
+            for t in self._tf[key]:
+                self._postings[t].discard(key)
+        self._entries[key] = entry
+        self._tf[key] = self._counts(normalise(str(entry["question"])))
+        for t in self._tf[key]:
+            self._postings.setdefault(t, set()).add(key)
+
+
+@lru_cache(maxsize=None)
+def answer_cache() -> Optional[AnswerCache]:
+    """The process‑wide cache on ``ANSWER_CACHE_PATH``, or ``None`` when it is unset."""
+    path = os.getenv("ANSWER_CACHE_PATH")
+    if not path:
+        return None
+    cache = AnswerCache(path, threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", SIMILARITY)))
+    register_cache("answers", cache.stats)
+    return cache
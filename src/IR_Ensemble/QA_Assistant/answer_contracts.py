@@ -53,12 +53,15 @@ Make sure to use commas to separate the segment_ids and close all brackets.
 
 UPDATE_CONTRACT = \
 """
-You are a **Information Retrieval Assistant** -- updating an answer to a question.
-Given the previous context and the search results given below update your answer status
-*DO NOT* remove any existing citations, but you may add new ones.
-Immediately upon marking a question as true it will be removed from the next round.
+You are a **Information Retrieval Assistant** -- updating the answers to your questions.
+Given the previous context and the search results given below return **only the changes** to the answers, as keyed upserts.
+Every question carries an "id" ("q1", "q2", ...); copy it verbatim to name the question a change applies to.
+*Omit* every question whose answer did not change this round.
+"text" replaces the question's previous answer text, so always write the full updated text.
+"citations" holds *only* the citations new this round – every existing citation is kept automatically, never repeat or remove one.
+Immediately upon marking a question as finished it will be removed from the next round.
 > Since this is a fact checking assignment the document context is any relevant information from the document we are fact checking that you may need in your answer.
-> Do **NOT** cite anything other than a Marco segment id, leave blank citations array if no citations exist.
+> Do **NOT** cite anything other than a Marco segment id, leave blank citations array if no new citations exist.
 IN YOUR COT YOU MUST REAFFIRM THAT YOUR ANSWER WILL BE VALID JSON.
 
 > You *MUST* answer with the following format
@@ -66,14 +69,13 @@ IN YOUR COT YOU MUST REAFFIRM THAT YOUR ANSWER WILL BE VALID JSON.
 <cot> Brief cot summary, REAFFIRM HERE THAT YOUR ANSWER WILL BE VALID JSON</cot> 
 <answer>
 {
-"questions": [
+"upserts": [ # *ONLY* the questions that changed this round, may be empty
         {
-            "question": <verbatim user question>,
-            "doc_context": <verbatim doc context>,
+            "id": <question id, e.g. "q1">,
             "answer": 
                 {
-                    "text": <text>,
-                    "citations": [
+                    "text": <full updated answer text>,
+                    "citations": [ # *ONLY* citations new this round
                         {
                             "summary": <summarize the info used from the citation>,
                             "citation": <segment_id>, # exact segment_id from the IR context
@@ -85,25 +87,14 @@ IN YOUR COT YOU MUST REAFFIRM THAT YOUR ANSWER WILL BE VALID JSON.
         },
         ...
     ],
-"rounds": [
-        {
-            "summary": <Brief summary of the round and different kw queries you tried that did not yield results to avoid in the future>,
-            "seen_ids": [ # A list of seen search results that way they can be avoided in the future
-                <segment_id1>,
-                <segment_id2>,
-                ...
-            ]
-        },
-        {
-            "summary": <Next rounds summary>,
-            "seen_ids": [ # *ONLY* the seen ids from this round no repeat ids from previous rounds
-                <segment_id3>,
-                <segment_id4>,
-                ...
-            ]
-        },
-        ...
-    ]
+"round": {
+        "summary": <Brief summary of the round and different kw queries you tried that did not yield results to avoid in the future>,
+        "seen_ids": [ # *ONLY* the seen ids from this round, no repeat ids from previous rounds
+            <segment_id1>,
+            <segment_id2>,
+            ...
+        ]
+    }
 }
 ```
 </answer>
@@ -146,3 +137,29 @@ AGAIN: **do not** use Markdown, code fences, or any other formatting that would
 YOU MUST REAFFIRM IN YOUR COT THAT YOUR ANSWER WILL BE VALID JSON.
 YOU MUST REAFFIRM IN YOUR COT THAT YOUR ANSWER WILL BE VALID JSON.
 """
+
+# ── Prompt‑cache layout ──────────────────────────────────────────────────────
+# Every contract lives in the instructions, which are byte‑identical for every
+# agent, stage and round – one long stable prefix the provider's automatic
+# prompt cache can serve.  A turn only names its contract in a short header
+# and carries the per‑round payload after it.
+
+SEARCH_TURN = "<contract>SEARCH</contract>\n"
+SELECT_TURN = "<contract>SELECT</contract>\n"
+UPDATE_TURN = "<contract>UPDATE</contract>\n"
+FINAL_TURN = "<contract>FINAL</contract>\n"
+
+INSTRUCTIONS = GLOBAL_FORMAT + \
+"""
+### 3 - Contracts
+
+Every user turn starts with `<contract>NAME</contract>`. Answer that turn following the contract of that NAME below, and only that contract.
+""" + "".join(
+    f"\n#### Contract {name}\n{contract}"
+    for name, contract in (
+        ("SEARCH", SEARCH_CONTRACT),
+        ("SELECT", SELECT_CONTRACT),
+        ("UPDATE", UPDATE_CONTRACT),
+        ("FINAL", FINAL_CONTRACT),
+    )
+)
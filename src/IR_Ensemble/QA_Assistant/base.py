@@ -8,12 +8,28 @@ High‑level lifecycle (orchestrated externally)
    thread.
 2. Up to **MAX_TOOL_ROUNDS**
    a. `await get_info(first_round)` →
-      • asks model for **search** tool calls
+      • asks model for **search** tool calls (first round: speculative
+        searches built from the questions run while it answers) – the
+        answer is streamed and each search dispatched as soon as it is complete
       • dispatches them and feeds back meta
-      • asks model for **select_documents** tool call
+      • asks model for **select_documents** tool call (skipped when the
+        rerank scores already make the choice – see `_score_select`)
       • dispatches it and returns the selected‑segment JSON
-   b. `await update_answer(selected_segments)` → updates structured answer.
-3. Caller ends when every question is marked `finished:true` or after 5 rounds.
+   b. `await update_answer(selected_segments)` → model returns keyed upserts of
+      the changed questions only, merged into the structured answer.
+3. Caller ends when every question is marked `finished:true`, after
+   MAX_TOOL_ROUNDS, or once the answer has **converged** (see `_track_convergence`).
+
+By default every call queues at the rate‑limit gate.  Given an agent
+*deadline* (``CONTEXT_BUDGET_SEC``) or a **MAX_QUEUE_WAIT**, a call that
+cannot start in time downgrades instead of queueing: SELECT falls back to the
+top reranked segments, and a rejected SEARCH / UPDATE raises
+`AdmissionRejected` so the caller can cut the round short.  The first‑round
+SEARCH is never dropped – if it is rejected it is retried once, queued.
+
+Prompt layout: every contract lives in the byte‑identical `INSTRUCTIONS`
+(the provider‑side cached prefix); each turn only opens with a short
+``<contract>NAME</contract>`` header followed by its payload.
 
 `run()` orchestration is intentionally left for subclasses.
 """
@@ -22,8 +38,9 @@ from __future__ import annotations
 import os
 import json
 import uuid
+from difflib import SequenceMatcher
 from enum import Enum
-from typing import Any, Awaitable, Dict, List, Optional
+from typing import Any, Awaitable, Container, Dict, FrozenSet, List, Optional, Tuple
 import traceback
 
 import aiofiles, asyncio
@@ -32,14 +49,25 @@ from openai import AsyncAzureOpenAI
 from openai.types.responses import Response
 
 from src.IR_Ensemble.QA_Assistant.answer_contracts import (
-    SEARCH_CONTRACT,
-    SELECT_CONTRACT,
-    UPDATE_CONTRACT,
-    FINAL_CONTRACT
+    SEARCH_TURN,
+    SELECT_TURN,
+    UPDATE_TURN,
+    FINAL_TURN,
+    INSTRUCTIONS,
 )
 from src.IR_Ensemble.QA_Assistant.daemon_wrapper import JVMDaemon
-from src.IR_Ensemble.QA_Assistant.Searcher import search
-from src.IR_Ensemble.QA_Assistant.rate_limits import gated_response, LoopStage
+from src.IR_Ensemble.QA_Assistant.Searcher import search, speculative_searches
+from src.IR_Ensemble.QA_Assistant.rate_limits import (
+    gated_response,
+    LoopStage,
+    count_static_tokens,
+)
+from src.IR_Ensemble.QA_Assistant.token_estimator import estimate_tokens
+from src.IR_Ensemble.QA_Assistant.admission import AdmissionRejected
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics
+from src.IR_Ensemble.QA_Assistant.stream_parser import SearchStreamParser, search_key, search_kwargs
+from src.IR_Ensemble.QA_Assistant.evidence_index import topic_index
+from src.IR_Ensemble.QA_Assistant.answer_cache import answer_cache
 
 # ───────────────────────────────────────── constants ──────────────────────────
 
@@ -67,23 +95,58 @@ class BaseAgent:
     Plan / search / answer‑update skeleton.
     """
     MAX_TOOL_ROUNDS: int = 3
+    MAX_QUEUE_WAIT: Optional[float] = None  # seconds any single call may queue at the gate (None = no cap)
+    AUTO_SELECT_K: int = 6         # segments kept when SELECT is shed
+    SPECULATIVE_SEARCHES: int = 2  # first‑round searches started before SEARCH_CALL returns (0 = off)
+    MAX_SEARCHES: int = 2          # model‑written searches run per round
+    STREAM_SEARCH: bool = True     # dispatch each search as soon as SEARCH_CALL streams it
+    SCORE_SELECT: bool = True      # skip SELECT_CALL when the rerank scores are decisive
+    SCORE_FLOOR: float = 0.35      # every auto‑selected segment scores at least this
+    SCORE_GAP: float = 0.15        # … and the cut sits on a drop at least this large
+    INDEX_HITS: int = 8            # topic evidence‑index hits pooled per question (0 = off)
+    INDEX_MIN_SCORE: float = 0.4   # normalised BM25 score a hit needs
+    INDEX_ENOUGH: int = 5          # hits that make a question's speculative search unnecessary
+    CONVERGE_ROUNDS: int = 1       # stale rounds in a row that end the loop early (0 = off)
+    CONVERGE_SIMILARITY: float = 0.9  # answer‑text similarity below which a question still moved
 
     async def __init__(
         self,
-        questions: List[str],
+        questions: str,
         client: AsyncAzureOpenAI,
-        num: int = 0
+        num: int = 0,
+        deadline: Optional[float] = None,
+        topic_id: Optional[str] = None,
     ) -> None:
-        self.questions = questions
+        # Structured answer: question id → open question item; UPDATE_CALL
+        # only returns the items that changed (see `_apply_patch`)
+        self.answer_items: Dict[str, dict] = self._seed_answer(questions)
+        self.answer_rounds: List[dict] = []
+        self.questions = "\n".join(
+            json.dumps({k: v for k, v in item.items() if k not in ("answer", "finished", "duplicates")},
+                       ensure_ascii=False)
+            for item in self.answer_items.values()
+        )
         self.client = client
         self.num = num
+        self.topic_id = topic_id  # stable topic id (docid) the answer cache is scoped by
+        self.deadline = deadline  # time.monotonic() by which the agent must be done
         # Responses API chains via response‑id
 
         self.history: List[Dict[str, str]] = []  # mirrors message list for token‑estimation
+        self.history_tokens: int = 0             # running token ledger over self.history
+        # Evidence ledger: segment ids already fetched by a SELECT (and so sent
+        # to an UPDATE); survives logical‑thread resets so later rounds only
+        # pay for new evidence
+        self.read_segments: set[str] = set()
+        self.new_segments: int = 0               # segment ids first read this round
+        # Convergence: question → (answer text, cited ids) after the last UPDATE
+        self._answer_snapshot: Optional[Dict[str, Tuple[str, FrozenSet[str]]]] = None
+        self.stale_rounds: int = 0
         self.agent_id = str(uuid.uuid4())
         self.status: QAStatus = QAStatus.NO_ANSWER
 
         self.full_answer: Optional[str] = None
+        self.finished_items: List[dict] = []     # answered question items, returned to ContextProctor
         self.summary: Optional[str] = None
         self.prev_id: Optional[str] = None
 
@@ -102,9 +165,37 @@ class BaseAgent:
         async with aiofiles.open(_file or self.convo_path, "a", encoding="utf-8") as f:
             await f.write(msg)
 
-    def _record(self, role: str, content: str) -> None:
-        """Mirror a message in local history for token counting."""
+    def _record(self, role: str, content: str, *, static: str = "") -> int:
+        """Mirror a message in local history and add it to the token ledger.
+
+        Each message is counted exactly once, here, with the fast calibrated
+        estimator (exact tiktoken runs off the loop).  *static* is a constant
+        prefix of *content* (a contract header) whose count is memoised.
+        Returns the message's token count.
+        """
         self.history.append({"role": role, "content": content})
+        tokens = self._message_tokens(role, content, static=static)
+        self.history_tokens += tokens
+        return tokens
+
+    @staticmethod
+    def _message_tokens(role: str, content: str, *, static: str = "") -> int:
+        """Tokens of `<|role|>\ncontent\n`, encoding only the non‑static part."""
+        if static and content.startswith(static):
+            dynamic = content[len(static):]
+        else:
+            static, dynamic = "", content
+        return (count_static_tokens(f"<|{role}|>\n")
+                + count_static_tokens(static)
+                + estimate_tokens(dynamic + "\n"))
+
+    def _prompt_tokens(self, extra: int = 0) -> int:
+        """Reservation size of `INSTRUCTIONS + history (+ extra)` from the ledger."""
+        return count_static_tokens(INSTRUCTIONS) + self.history_tokens + extra
+
+    def _gate(self) -> Dict[str, Any]:
+        """Gate kwargs for `gated_response`: per‑call wait, agent deadline, metrics topic."""
+        return {"deadline": self.deadline, "max_wait": self.MAX_QUEUE_WAIT, "topic": self.num}
 
     def _serialise_history(self) -> str:
         """Return *exact* plain‑text mirror of what the backend tokenises.
@@ -131,19 +222,59 @@ class BaseAgent:
         else:
             context_block = "<current_answer>" + (self.full_answer or "") + "</current_answer>"
             
+        # ── Speculative searches from the questions themselves ───────────
+        # BM25 + rerank run while the model writes its own queries
+        # … after looking in what earlier rounds of the topic already fetched
+        local = self._index_lookup() if first_round and self.INDEX_HITS else []
+        covered = {res["master_query"] for res in local if len(res["results"]) >= self.INDEX_ENOUGH}
+        speculative: Optional[asyncio.Task] = None
+        if first_round and self.SPECULATIVE_SEARCHES:
+            speculative = asyncio.create_task(self._speculative_search(skip=covered),
+                                              name=f"speculative-{self.agent_id}")
+
         # ── Ask for SEARCH tool calls ────────────────────────────────────
-        content = SEARCH_CONTRACT + context_block
-        self._record("user", content)
-        anchor: Response = await gated_response(assistant_id=self.agent_id,
-                                      client=self.client,
-                                      prompt=content,
-                                      stage = LoopStage.SEARCH_CALL)
+        content = SEARCH_TURN + context_block
+        self._record("user", content, static=SEARCH_TURN)
+        # Streamed: every search object starts as soon as its closing brace arrives
+        streamed: List[asyncio.Task] = []
+        parser = SearchStreamParser(
+            lambda call: streamed.append(asyncio.create_task(self._dispatch_tool(search, **search_kwargs(call)))),
+            limit=self.MAX_SEARCHES,
+        ) if self.STREAM_SEARCH else None
+        try:
+            try:
+                anchor: Response = await gated_response(assistant_id=self.agent_id,
+                                              client=self.client,
+                                              prompt=content,
+                                              stage = LoopStage.SEARCH_CALL,
+                                              prompt_tokens=self._prompt_tokens(),
+                                              stream=parser,
+                                              **self._gate())
+            except AdmissionRejected as exc:
+                if not first_round:
+                    raise
+                # Without a first SEARCH the agent has nothing to answer from – queue for it
+                await self._log(f"\n-FIRST SEARCH REJECTED ({exc}) – queueing-\n")
+                anchor = await gated_response(assistant_id=self.agent_id,
+                                              client=self.client,
+                                              prompt=content,
+                                              stage = LoopStage.SEARCH_CALL,
+                                              prompt_tokens=self._prompt_tokens(),
+                                              stream=parser,
+                                              topic=self.num)
+        except BaseException:
+            for task in (speculative, *streamed):
+                if task:
+                    task.cancel()
+            raise
         self.prev_id = anchor.id # update for next tool call 
         search_calls = anchor.output_text
         self._record("assistant",search_calls)
         await self._log(f"\n------- SEARCH CALLS------\n{self._serialise_history()}")
 
         # Parse & dispatch each search call
+        results: List[Dict[str, Any]] = []
+        failed = False
         try:
             # Search calls answer contract 
             # """
@@ -165,28 +296,54 @@ class BaseAgent:
             # """
             search_calls = self._extract_tag(search_calls, "answer")
             search_calls = json.loads(search_calls)
-            search_calls = search_calls["searches"][:2]
-            tasks = [self._dispatch_tool(search, 
-                                        **{"queries": call["queries"],
-                                        "master_query": call["master_query"]}) 
+            search_calls = search_calls["searches"][:self.MAX_SEARCHES]
+            # Whatever the stream already dispatched is not run again
+            done = {search_key(call) for call in parser.emitted} if parser else set()
+            search_calls = [call for call in search_calls
+                            if search_key(call) not in done][:self.MAX_SEARCHES - len(streamed)]
+            tasks = [self._dispatch_tool(search, **search_kwargs(call))
                                          for call in search_calls]
                      
-            search_results = "\n".join([json.dumps(result) 
-                                        for result in await asyncio.gather(*tasks)])
+            results = await asyncio.gather(*tasks)
         except Exception as e:  # noqa: BLE001 – log & rethrow
             traceback.print_exc()
+            failed = True
+        if streamed:
+            early = await asyncio.gather(*streamed, return_exceptions=True)
+            results = [r for r in early if not isinstance(r, BaseException)] + list(results)
+        if speculative:
+            results = self._merge_results(list(results), await speculative)
+        if local:
+            results = self._merge_results(list(results), local)
+        if results or not failed:
+            search_results = "\n".join([json.dumps(result) for result in results])
+        else:
             search_results = "Error performing search, produce an empty selections array"
 
         # ── Ask for SELECT_DOCUMENTS tool call ───────────────────────────
-        content = SELECT_CONTRACT + "\n\n<search_metadata>" + search_results + "</search_metadata>"
+        content = SELECT_TURN + "<search_metadata>" + search_results + "</search_metadata>"
         await self._log(f"\n------TOOL RESULTS-------\n{content}")
-        resp_select: Response = await gated_response(assistant_id=self.agent_id,
-                                            client=self.client,
-                                            prompt=content,
-                                            stage = LoopStage.SELECT_CALL,
-                                            context = self._serialise_history(),
-                                            prev_id=self.prev_id)
-        select_calls = resp_select.output_text
+        select_tokens = self._message_tokens("user", content, static=SELECT_TURN)
+        decisive = self._score_select(results) if self.SCORE_SELECT else None
+        if decisive:
+            # Clear gap in the rerank scores – the model would pick the same ids
+            select_calls = f"<answer>{json.dumps({'selections': decisive})}</answer>"
+            call_metrics.add("select_skipped", topic=self.num)
+            await self._log("\n-SELECT SKIPPED – rerank scores decisive-\n")
+        else:
+            try:
+                resp_select: Response = await gated_response(assistant_id=self.agent_id,
+                                                    client=self.client,
+                                                    prompt=content,
+                                                    stage = LoopStage.SELECT_CALL,
+                                                    prev_id=self.prev_id,
+                                                    prompt_tokens=self._prompt_tokens(select_tokens),
+                                                    **self._gate())
+                select_calls = resp_select.output_text
+            except AdmissionRejected as exc:
+                # Overloaded – take the best reranked segments instead of asking the model
+                select_calls = self._auto_select(results)
+                await self._log(f"\n-SELECT SHED ({exc}) – auto‑selected-\n")
         await self._log(f"\n-SELECT CALLS (NOT PERSISTED IN LOGICAL THREAD)-\n{select_calls}")
 
         # Dispatch select_documents will vanish from run context because selection will
@@ -205,13 +362,19 @@ class BaseAgent:
             # """
             select_calls = self._extract_tag(select_calls, "answer")
             select_calls = json.loads(select_calls)
-            select_calls = select_calls["selections"][:6]
+            select_calls = [seg for seg in select_calls["selections"]
+                            if seg not in self.read_segments][:6]
             if not select_calls:
                 print("WARNING: Empty select_calls list, using dummy ID")
                 select_calls = ["dummy_id"]
+            self.new_segments = 0
             selected_segments = json.dumps(await self._dispatch_tool(JVMDaemon.select_documents,
                                           **{"segment_ids": select_calls, "is_segment": True}))
+            fresh = [seg for seg in select_calls if seg != "dummy_id"]
+            self.read_segments.update(fresh)
+            self.new_segments = len(fresh)
         except Exception as e:  # noqa: BLE001 - log & rethrow
+            self.new_segments = 0
             traceback.print_exc()
             selected_segments = f"Error performing document retrieval: instead of attempting to update the answer just rewrite the previous answer."
             print("Error performing document retrieval")
@@ -226,36 +389,42 @@ class BaseAgent:
     # ─────────────────────── public API: ANSWER update ───────────────────────
 
     async def update_answer(self, tool_outputs: str) -> str:
-        content = UPDATE_CONTRACT + "\n\n<selected_segments>" + tool_outputs + "</selected_segments>"
-        self._record("user", content)
+        content = UPDATE_TURN + "<selected_segments>" + tool_outputs + "</selected_segments>"
+        update_tokens = self._record("user", content, static=UPDATE_TURN)
 
         resp: Response = await gated_response(assistant_id=self.agent_id,
                                     client=self.client,
                                     prompt=content,
                                     stage = LoopStage.UPDATE_CALL,
-                                    context = self._serialise_history(),
-                                    prev_id=self.prev_id)
+                                    prev_id=self.prev_id,
+                                    prompt_tokens=self._prompt_tokens(update_tokens),
+                                    **self._gate())
         raw = resp.output_text
         self._record("assistant", raw)
-        self.full_answer = self._extract_tag(raw, "answer") or raw
         # Set the previous response for final call
         # If it is not the final call the logical thread will be reset, making all stages previous id none
         self.prev_id = resp.id
 
         await self._log(f"\n==== UPDATE PROMPT ====\n{content}\n==== ANSWER UPDATE ====\n{raw}\n")
-        await self._update_status()
+        await self._update_status(patch=self._extract_tag(raw, "answer") or raw)
         return raw
 
     async def force_final_prompt(self) -> str:
-        self._record("user", FINAL_CONTRACT)
-        await self._log(f"\n-----FORCED FINAL-----\n{FINAL_CONTRACT}")
-        resp: Response = await gated_response(assistant_id=self.agent_id,
-                                    client=self.client,
-                                    prompt=FINAL_CONTRACT,
-                                    stage = LoopStage.FINAL_CALL,
-                                    context = self._serialise_history(),
-                                    prev_id=self.prev_id
-                                    )
+        final_tokens = self._record("user", FINAL_TURN, static=FINAL_TURN)
+        await self._log(f"\n-----FORCED FINAL-----\n{FINAL_TURN}")
+        try:
+            resp: Response = await gated_response(assistant_id=self.agent_id,
+                                        client=self.client,
+                                        prompt=FINAL_TURN,
+                                        stage = LoopStage.FINAL_CALL,
+                                        prev_id=self.prev_id,
+                                        prompt_tokens=self._prompt_tokens(final_tokens),
+                                        **self._gate()
+                                        )
+        except AdmissionRejected as exc:
+            # The structured answer is already persisted – only the summary is lost
+            await self._log(f"\n==== FINAL SUMMARY SHED ====\n{exc}\n")
+            return
         answer = resp.output_text
         await self._log("\n==== FINAL SUMMARY ====\n" + answer + "\n")
         await self._update_status(is_summary=True, content=answer)
@@ -265,13 +434,135 @@ class BaseAgent:
     async def reset_logical_thread(self) -> None:
         print("Resetting logical thread")
         self.history.clear()
+        self.history_tokens = 0
         await self._log("\n―――― Logical thread reset ――――\n")
         self.prev_id = None
 
 
+    @property
+    def converged(self) -> bool:
+        """True once CONVERGE_ROUNDS UPDATEs in a row changed nothing worth another round."""
+        return bool(self.CONVERGE_ROUNDS) and self.stale_rounds >= self.CONVERGE_ROUNDS
+
+    @staticmethod
+    def _answer_state(questions: List[dict]) -> Dict[str, Tuple[str, FrozenSet[str]]]:
+        """question → (answer text, cited segment ids) of an UPDATE payload."""
+        state = {}
+        for q in questions:
+            answer = q.get("answer") or {}
+            if not isinstance(answer, dict):
+                answer = {"text": answer}
+            cited = frozenset(str(c.get("citation")) for c in answer.get("citations") or []
+                              if isinstance(c, dict) and c.get("citation"))
+            state[str(q.get("question"))] = (str(answer.get("text") or ""), cited)
+        return state
+
+    def _track_convergence(self, questions: List[dict]) -> None:
+        """
+        Compare this UPDATE's payload with the previous one.
+
+        A round is *stale* when no question finished and either no new segment
+        was read, or every open question kept its citations and (near‑)
+        identical answer text.  Any progress resets the count.
+        """
+        state = self._answer_state(questions)
+        previous, self._answer_snapshot = self._answer_snapshot, state
+        if previous is None:
+            return
+        if any(q.get("finished") is True for q in questions):
+            self.stale_rounds = 0
+            return
+        moved = 0
+        for question, (text, cited) in state.items():
+            before = previous.get(question)
+            if (before is None or cited - before[1]
+                    or SequenceMatcher(None, before[0], text).ratio() < self.CONVERGE_SIMILARITY):
+                moved += 1
+        if self.new_segments and moved:
+            self.stale_rounds = 0
+        else:
+            self.stale_rounds += 1
+
+    async def _speculative_search(self, skip: Container[str] = ()) -> List[Dict[str, Any]]:
+        """Searches built locally from `<questions>` (minus *skip* master queries); failures are dropped."""
+        calls = [call for call in speculative_searches(self.questions, limit=None)
+                 if call["master_query"] not in skip][:self.SPECULATIVE_SEARCHES]
+        done = await asyncio.gather(*(self._dispatch_tool(search, **call) for call in calls),
+                                    return_exceptions=True)
+        return [r for r in done if not isinstance(r, BaseException)]
+
+    def _index_lookup(self) -> List[Dict[str, Any]]:
+        """Per question, the topic evidence index's hits on segments fetched in earlier rounds."""
+        index = topic_index(self.num)
+        if not len(index):
+            return []
+        found: List[Dict[str, Any]] = []
+        for call in speculative_searches(self.questions, limit=None):
+            hits = index.search(" ".join(call["queries"]), k=self.INDEX_HITS,
+                                min_score=self.INDEX_MIN_SCORE, exclude=self.read_segments)
+            if hits:
+                found.append({"search": f"topic index: {call['master_query'][:120]}",
+                              "master_query": call["master_query"], "source": "topic_index",
+                              "results": [{**meta, "index_score": round(score, 3)}
+                                          for meta, score in hits]})
+        return found
+
+    @staticmethod
+    def _merge_results(results: List[Dict[str, Any]],
+                       extra: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Append *extra* searches to the candidate pool, minus segments already in it."""
+        seen = {r.get("segment_id") for res in results for r in res.get("results", [])}
+        for res in extra:
+            fresh = [r for r in res.get("results", []) if r.get("segment_id") not in seen]
+            seen.update(r.get("segment_id") for r in fresh)
+            if fresh:
+                results.append({**res, "results": fresh})
+        return results
+
+    def _score_select(self, results: List[Dict[str, Any]]) -> Optional[List[str]]:
+        """Segment ids to take without asking the model, or None when the scores are ambiguous.
+
+        Scores are pooled across searches (best score per segment).  The cut
+        goes at the largest drop within the first `AUTO_SELECT_K`; it is
+        decisive when that drop is at least `SCORE_GAP` and everything above
+        it scores at least `SCORE_FLOOR`.  Unscored (BM25 fallback) results
+        are always ambiguous.
+        """
+        best: Dict[str, float] = {}
+        for res in results:
+            if res.get("source") == "topic_index":
+                continue            # BM25‑scored, not comparable with the rerank
+            for r in res.get("results", []):
+                score, seg = r.get("relevance_score"), r.get("segment_id")
+                if score is None:
+                    return None
+                if seg and score > best.get(seg, -1.0):
+                    best[seg] = score
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        if len(ranked) < 2:
+            return None
+        scores = [score for _, score in ranked] + [0.0]
+        k = max(range(1, min(self.AUTO_SELECT_K, len(ranked)) + 1),
+                key=lambda i: scores[i - 1] - scores[i])
+        if scores[k - 1] - scores[k] < self.SCORE_GAP or scores[k - 1] < self.SCORE_FLOOR:
+            return None
+        return [seg for seg, _ in ranked[:k]]
+
+    def _auto_select(self, results: List[Dict[str, Any]]) -> str:
+        """SELECT fallback: interleave the top reranked ids of each search."""
+        ranked = [[r.get("segment_id") for r in res.get("results", [])] for res in results]
+        picked: List[str] = []
+        for rank in range(max(map(len, ranked), default=0)):
+            for ids in ranked:
+                if rank < len(ids) and ids[rank] and ids[rank] not in picked:
+                    picked.append(ids[rank])
+        picked = picked[: self.AUTO_SELECT_K]
+        return f"<answer>{json.dumps({'selections': picked})}</answer>"
+
     async def _dispatch_tool(self, tool: Awaitable, **kwargs) -> str:
         if tool.__name__ == "search":
-            results = await search(**kwargs,agentId=self.agent_id)
+            results = await search(**kwargs,agentId=self.agent_id,deadline=self.deadline,
+                                   topic=self.num, exclude=self.read_segments)
             payload = {"call":"search","kwargs": kwargs,"results":results}
             await self._log(f"\n----TOOL CALL----\n{payload}", _file=self.tools_path)
             return {"search": json.dumps(kwargs)[:150], "results":results}
@@ -287,17 +578,81 @@ class BaseAgent:
             return text.split(start, 1)[1].split(end, 1)[0].strip()
         return None
 
+    @staticmethod
+    def _seed_answer(questions: str) -> Dict[str, dict]:
+        """One empty answer item per `<questions>` line, keyed "q1", "q2", …"""
+        items: Dict[str, dict] = {}
+        for line in (q for q in questions.split("\n") if q.strip()):
+            try:
+                question = json.loads(line)
+            except json.JSONDecodeError:
+                question = None
+            if not isinstance(question, dict):
+                question = {"question": line}
+            qid = f"q{len(items) + 1}"
+            items[qid] = {"id": qid, **question,
+                          "answer": {"text": "", "citations": []}, "finished": False}
+        return items
+
+    def _render_answer(self) -> str:
+        """The open questions and round log as the `<current_answer>` JSON (merged paraphrases left out)."""
+        questions = [{k: v for k, v in item.items() if k != "duplicates"} for item in self.answer_items.values()]
+        return json.dumps({"questions": questions, "rounds": self.answer_rounds}, ensure_ascii=False)
+
+    def _apply_patch(self, patch: str) -> None:
+        """
+        Merge an UPDATE answer into `answer_items`.
+
+        Upserts are matched by id (or verbatim question text): "text" replaces
+        the answer text, "citations" are appended unless already cited and
+        "finished" is taken as given.  A full ``{"questions": [...]}`` rewrite
+        is accepted as an upsert of every question.
+        """
+        payload: dict = json.loads(patch)
+        upserts = payload.get("upserts")
+        if upserts is None:
+            upserts = payload.get("questions", [])
+        if isinstance(payload.get("round"), dict):
+            self.answer_rounds.append(payload["round"])
+        elif isinstance(payload.get("rounds"), list):
+            self.answer_rounds = payload["rounds"]
+
+        by_question = {item.get("question"): item for item in self.answer_items.values()}
+        for upsert in upserts:
+            if not isinstance(upsert, dict):
+                continue
+            item = self.answer_items.get(str(upsert.get("id"))) or by_question.get(upsert.get("question"))
+            if item is None:
+                continue  # unknown or already finished
+            answer = upsert.get("answer")
+            if isinstance(answer, str):
+                answer = {"text": answer}
+            if isinstance(answer, dict):
+                if answer.get("text") is not None:
+                    item["answer"]["text"] = answer["text"]
+                cited = {c.get("citation") for c in item["answer"]["citations"]}
+                for citation in answer.get("citations") or []:
+                    if isinstance(citation, dict) and citation.get("citation") not in cited:
+                        item["answer"]["citations"].append(citation)
+                        cited.add(citation.get("citation"))
+            if "finished" in upsert:
+                item["finished"] = upsert["finished"] is True
+
     async def _update_status(
         self,
         is_summary: bool = False,
         content: str | None = None,
+        patch: str | None = None,
     ) -> None:
         """
         • If is_summary=True → update self.summary only.
         • Otherwise:
-            – append each finished question item to the file at CONTEXT_PATH
-            – remove finished items from payload["questions"]
-            – update self.full_answer
+            – merge the UPDATE *patch* into the open answer items
+            – add each finished question item, and a copy per merged
+              duplicate, to self.finished_items (and to the answer cache,
+              when one is configured)
+            – drop finished items from the open ones
+            – re-render self.full_answer
             – set self.status according to the rules you specified
         """
         # ───────────────────── summary branch ─────────────────────────────
@@ -306,29 +661,32 @@ class BaseAgent:
             return
 
         # ─────────────────── initial NO‑ANSWER check ─────────────────────
-        if not self.full_answer:
+        if not patch:
             self.status = QAStatus.NO_ANSWER
             return
 
         prev_status = self.status  # remember incoming status
+        finished_copies: List[dict] = []
 
         try:
-            payload: dict        = json.loads(self.full_answer)
-            questions: List[dict] = payload.get("questions", [])
+            self._apply_patch(patch)
+            questions: List[dict] = list(self.answer_items.values())
 
+            self._track_convergence(questions)
             finished_items = [q for q in questions if q.get("finished") is True]
             remaining      = [q for q in questions if q.get("finished") is not True]
 
-            # ─────────────── persist finished items (append) ──────────────
-            if finished_items:
-                ctx_path = f"{os.getenv('CONTEXT_PATH')}{self.num}.txt"            # points to Context.txt
-                async with aiofiles.open(ctx_path, mode="a") as f:
-                    for item in finished_items:
-                        await f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            # ─────────────── hand finished items back (in memory) ──────────
+            for item in finished_items:
+                persisted = {k: v for k, v in item.items() if k not in ("id", "duplicates")}
+                # Fan the answer back out to the paraphrases merged into this item
+                finished_copies += [persisted] + [{**persisted, **dup} for dup in item.get("duplicates") or []]
 
             # ────────────────── update in‑memory answer ──────────────────
-            payload["questions"] = remaining
-            self.full_answer = json.dumps(payload, ensure_ascii=False)
+            for item in finished_items:
+                del self.answer_items[item["id"]]
+            self.finished_items.extend(finished_copies)
+            self.full_answer = self._render_answer()
 
             # ───────────────────── set QAStatus ──────────────────────────
             if not remaining:                      # all questions done
@@ -343,10 +701,23 @@ class BaseAgent:
                         else QAStatus.PARTIAL
                     )
 
-        except Exception:
+        except Exception as exc:
+            # Unreadable (e.g. truncated) patch – keep the answer as it was, but say so
             self.status = QAStatus.PARTIAL
+            self.full_answer = self._render_answer()
+            call_metrics.add("update_unreadable", topic=self.num)
+            await self._log(f"\n==== UPDATE PATCH UNREADABLE – answer unchanged ====\n{exc!r}\n")
             traceback.print_exc()
 
+        # ─────────────── answer cache (best effort) ────────────────────
+        cache = answer_cache()
+        if cache is not None:
+            for copy in finished_copies:
+                try:
+                    await cache.put(copy, topic=self.topic_id)
+                except Exception as exc:  # noqa: BLE001 – the answer is already handed back
+                    await self._log(f"\n==== ANSWER CACHE WRITE FAILED ====\n{exc!r}\n")
+
 
     # ───────────────────────────── placeholder hooks ─────────────────────────
 
@@ -1,141 +1,147 @@
 from __future__ import annotations
 
-import asyncio, aiofiles
-from datetime import datetime
-from typing import Mapping,Optional,Dict
-import os
+import asyncio
+from typing import Optional,Dict
+import os, time
 from pathlib import Path
 from dotenv import load_dotenv
 
 from src.IR_Ensemble.QA_Assistant.rate_limits import (
-    plan_req_limiter,
-    plan_tok_limiter,
-    global_req_limiter,
-    global_tok_limiter,
+    quota_registry,
     assistant_tok_limiters,
     cohere_bucket
 )
+from src.IR_Ensemble.QA_Assistant.quotas import QuotaRegistry
+from src.IR_Ensemble.QA_Assistant.bucket_pool import AssistantBucketPool
 from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
+from src.IR_Ensemble.QA_Assistant.telemetry import JsonlSink
+from src.IR_Ensemble.QA_Assistant.call_metrics import CallMetrics, call_metrics
 
 class BucketMonitor:
+    """Poll every bucket and append long‑format rows to a JSONL sink.
+
+    One row per bucket per poll (``ts, bucket, load, capacity``); buckets
+    that appear later simply start showing up, so nothing is ever rewritten.
+    Pivot afterwards with ``python -m src.IR_Ensemble.QA_Assistant.telemetry``.
+
+    Every *hist_every* seconds the rolling `call_metrics` histograms (queue
+    wait, reserved / used / refunded tokens per stage, model and topic) are
+    appended to a second sink, *hist_path*.
+
+    Every raw `call_metrics` event (one per gated call, daemon round trip,
+    429 …) goes to a third sink, *events_path* – the input of
+    ``python -m src.Simulation.planner``.
+    """
     # ─────────────────────────────── initialisation ──────────────────────────
     def __init__(
         self,
         *,
-        plan_req_bucket:AsyncTokenBucket = plan_req_limiter,
-        plan_tok_bucket:AsyncTokenBucket = plan_tok_limiter,
-        global_req_bucket:AsyncTokenBucket = global_req_limiter,
-        global_tok_bucket:AsyncTokenBucket = global_tok_limiter,
-        assistant_buckets:Dict[str,AsyncTokenBucket] = assistant_tok_limiters,
+        quotas: QuotaRegistry = quota_registry,
+        assistant_buckets:AssistantBucketPool = assistant_tok_limiters,
         cohere: AsyncTokenBucket = cohere_bucket[0],
         interval: float = 1,
-        csv_path: str | os.PathLike[str] = "bucket_usage.csv",
+        path: str | os.PathLike[str] = "bucket_usage.jsonl",
         overwrite: bool = True,
+        metrics: CallMetrics = call_metrics,
+        hist_path: str | os.PathLike[str] = "call_metrics.jsonl",
+        hist_every: float = 30.0,
+        events_path: str | os.PathLike[str] = "call_events.jsonl",
     ) -> None:
         load_dotenv()
         # Core buckets
         self._buckets_static: Dict[str, AsyncTokenBucket] = {
-            "Plan_req": plan_req_bucket,
-            "Plan_tok": plan_tok_bucket,
-            "Global_req": global_req_bucket,
-            "Global_tok": global_tok_bucket,
             "Cohere": cohere,
         }
 
-        # The per‑assistant dict (may grow while running)
-        self._assistant_buckets: Mapping[str, AsyncTokenBucket] = assistant_buckets
+        # Per‑deployment RPM / TPM buckets (may grow while running)
+        self._quotas = quotas
+
+        # The per‑assistant pool – reported as one aggregate row per poll
+        self._assistant_buckets: AssistantBucketPool = assistant_buckets
 
         # IO / scheduling
         self._interval = interval
-        base =os.getenv("BUCKET_MONITOR_OUT")
-        self._csv_path = Path(base+csv_path)
+        base =os.getenv("BUCKET_MONITOR_OUT", "")
+        self._path = Path(base+str(path))
         self._overwrite = overwrite
+        self._sink: Optional[JsonlSink] = None
+        self._metrics = metrics
+        self._hist_path = Path(base+str(hist_path))
+        self._hist_every = hist_every
+        self._hist_sink: Optional[JsonlSink] = None
+        self._events_path = Path(base+str(events_path))
+        self._events_sink: Optional[JsonlSink] = None
         self._task: Optional[asyncio.Task[None]] = None
         self._stop_evt = asyncio.Event()
 
-        # Build the (mutable) column list
-        self._columns: list[str] = ["time_iso"] + list(self._buckets_static.keys())
-        self._columns += self._assistant_columns()  # any assistants already present
-
     # ─────────────────────────────── public API ──────────────────────────────
     async def start(self) -> None:
         """Begin polling in the background."""
         if self._task:
             raise RuntimeError("BucketMonitor already running")
 
-        # (Re)create file with CSV header if overwrite or file missing
-        if self._overwrite or not self._csv_path.exists():
-            async with aiofiles.open(self._csv_path, "w") as f:
-                await f.write(",".join(self._columns) + "\n")
-
+        self._sink = JsonlSink(self._path, overwrite=self._overwrite)
+        self._hist_sink = JsonlSink(self._hist_path, overwrite=self._overwrite, flush_rows=1)
+        self._events_sink = JsonlSink(self._events_path, overwrite=self._overwrite)
+        self._metrics.record_events()
         self._stop_evt.clear()
         self._task = asyncio.create_task(self._poll_loop(), name="BucketMonitor")
 
     async def stop(self) -> None:
-        """Stop polling. Waits until the background task exits."""
+        """Stop polling and flush what is buffered. Waits until the background task exits."""
         if not self._task:
             return
         self._stop_evt.set()
         await self._task
         self._task = None
+        self._dump_histograms(round(time.time(), 3))
+        self._events_sink.write(self._metrics.drain_events())
+        await self._sink.close()
+        await self._hist_sink.close()
+        await self._events_sink.close()
+        self._sink = self._hist_sink = self._events_sink = None
 
     # ────────────────────────────── internals ───────────────────────────────
+    def _rows(self, ts: float) -> list[dict]:
+        """One long row per bucket (plus the assistant pool aggregate)."""
+        rows = [self._row(ts, name, bucket) for name, bucket in self._buckets_static.items()]
+
+        # Per‑deployment buckets
+        for label, req, tok in self._quotas.items():
+            rows.append(self._row(ts, f"{label}:req", req))
+            rows.append(self._row(ts, f"{label}:tok", tok))
+
+        # Per‑assistant buckets (evict drained ones, report aggregates)
+        pool = self._assistant_buckets
+        pool.sweep()
+        rows.append({"ts": ts, "bucket": "Assistants", "load": pool.live_load(),
+                     "capacity": len(pool) * pool.capacity,
+                     "live": len(pool), "evicted": pool.aggregate["evicted"]})
+        return rows
+
+    def _dump_histograms(self, ts: float) -> bool:
+        return self._hist_sink.write({"ts": ts, **row} for row in self._metrics.snapshot())
+
     async def _poll_loop(self) -> None:
+        last_hist = time.monotonic()
         while not self._stop_evt.is_set():
-            # Expand column set if new assistants appeared
-            new_cols = self._assistant_columns()
-            if any(col not in self._columns for col in new_cols):
-                await self._extend_header(new_cols)
-
-            # Compose one CSV row
-            now_iso = datetime.now().isoformat(timespec="seconds")
-            row_values = {"time_iso": now_iso}
-
-            # Static buckets
-            for name, bucket in self._buckets_static.items():
-                row_values[name] = self._remaining(bucket)
-
-            # Per‑assistant buckets
-            for col in new_cols:
-                aid = col.removeprefix("Assistant_").removesuffix("_tok")
-                row_values[col] = self._remaining(self._assistant_buckets[aid])
-
-            # Ensure column order matches header
-            row = [str(row_values.get(col, "")) for col in self._columns]
-            async with aiofiles.open(self._csv_path, "a") as f:
-                await f.write(",".join(row) + "\n")
+            ts = round(time.time(), 3)
+            if self._sink.write(self._rows(ts)):
+                await self._sink.flush()
+            if self._events_sink.write(self._metrics.drain_events()):
+                await self._events_sink.flush()
+            if time.monotonic() - last_hist >= self._hist_every:
+                last_hist = time.monotonic()
+                if self._dump_histograms(ts):
+                    await self._hist_sink.flush()
 
             try:
                 await asyncio.wait_for(self._stop_evt.wait(), timeout=self._interval)
             except asyncio.TimeoutError:
                 pass  # periodic wake‑up
 
-    # ───────────────────────── header / helpers ─────────────────────────────
-    def _assistant_columns(self) -> list[str]:
-        """Return list of 'Assistant_<id>_tok' cols, sorted for stability."""
-        return [f"Assistant_{aid}_tok" for aid in sorted(self._assistant_buckets.keys())]
-
-    async def _extend_header(self, new_cols: list[str]) -> None:
-        """Add new assistant columns to the CSV header (rewrites the file)."""
-        added = [col for col in new_cols if col not in self._columns]
-        if not added:
-            return
-        self._columns += added
-
-        # Read existing contents (if any) ➜ prepend new header ➜ rewrite
-        if self._csv_path.exists():
-            async with aiofiles.open(self._csv_path, "r") as f:
-                existing = await f.read()
-        else:
-            existing = ""
-
-        async with aiofiles.open(self._csv_path, "w") as f:
-            await f.write(",".join(self._columns) + "\n")
-            if existing:
-                # Skip the old header line (everything after first '\n')
-                await f.write(existing.split("\n", 1)[-1])
-
     @staticmethod
-    def _remaining(bucket: AsyncTokenBucket) -> int:
-        """Tokens/requests left in the current sliding window."""
-        return max(0, bucket.capacity - bucket.current_load())
+    def _row(ts: float, name: str, bucket: AsyncTokenBucket) -> dict:
+        """Units in the current sliding window against the bucket's capacity."""
+        return {"ts": ts, "bucket": name, "load": bucket.current_load(),
+                "capacity": bucket.capacity}
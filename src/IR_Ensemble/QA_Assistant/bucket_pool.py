@@ -0,0 +1,88 @@
+"""
+bucket_pool.py
+~~~~~~~~~~~~~~
+Per‑assistant token buckets with idle eviction.
+
+Every `BaseAgent` gets a fresh uuid, so a plain ``defaultdict`` of buckets
+grows by one entry per agent for the whole run.  `AssistantBucketPool`
+creates buckets on demand like before, but once an agent is *released*
+(its run finished) and its window has drained, the bucket is dropped and
+its lifetime stats are folded into `aggregate`.  Memory and monitoring cost
+then depend on the number of *live* agents only.
+
+Usage
+-----
+````python
+bucket = pool.bucket(agent_id)    # create or fetch
+...
+pool.release(agent_id)            # agent finished – evict once drained
+````
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterator, Mapping, Set
+
+from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
+
+
+class AssistantBucketPool(Mapping[str, AsyncTokenBucket]):
+    """Read‑only mapping of *live* assistant buckets + an evicted‑stats rollup."""
+
+    def __init__(self, capacity: int, window: float) -> None:
+        self.capacity = capacity
+        self.window = window
+        self._buckets: Dict[str, AsyncTokenBucket] = {}
+        self._released: Set[str] = set()
+        self.aggregate: Dict[str, int] = {
+            "evicted": 0,
+            "reserved_total": 0,
+            "refunded_total": 0,
+            "peak_load": 0,
+        }
+
+    # ───────────────────────────── mapping API ───────────────────────────
+    def __getitem__(self, assistant_id: str) -> AsyncTokenBucket:
+        return self._buckets[assistant_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._buckets))
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    # ───────────────────────────── lifecycle ─────────────────────────────
+    def bucket(self, assistant_id: str) -> AsyncTokenBucket:
+        """Return the assistant's bucket, creating it on first use."""
+        self.sweep()
+        if assistant_id not in self._buckets:
+            self._buckets[assistant_id] = AsyncTokenBucket(self.capacity, self.window)
+        return self._buckets[assistant_id]
+
+    def release(self, assistant_id: str) -> None:
+        """Mark the assistant as finished; its bucket goes once the window drains."""
+        if assistant_id in self._buckets:
+            self._released.add(assistant_id)
+        self.sweep()
+
+    def sweep(self) -> int:
+        """Evict released buckets whose window has drained.  Returns how many."""
+        evicted = 0
+        for aid in list(self._released):
+            bucket = self._buckets.get(aid)
+            if bucket is not None and not bucket.drained():
+                continue
+            self._released.discard(aid)
+            if bucket is None:
+                continue
+            del self._buckets[aid]
+            agg = self.aggregate
+            agg["evicted"] += 1
+            agg["reserved_total"] += bucket.reserved_total
+            agg["refunded_total"] += bucket.refunded_total
+            agg["peak_load"] = max(agg["peak_load"], bucket.peak_load)
+            evicted += 1
+        return evicted
+
+    def live_load(self) -> int:
+        """Units currently reserved across all live assistant buckets."""
+        return sum(b.current_load() for b in list(self._buckets.values()))
@@ -0,0 +1,215 @@
+"""
+call_metrics.py
+~~~~~~~~~~~~~~~
+Rolling histograms of what every gated call waited for and spent.
+
+The gated wrappers record, per attempt and tagged by stage, model and
+topic:
+
+* ``queue_wait_s``     – seconds from entering the gate until every bucket admitted the call
+* ``reserved_tokens``  – tokens reserved up front
+* ``used_tokens``      – ``usage.total_tokens`` actually spent
+* ``refunded_tokens``  – tokens handed back (surplus, or the whole reservation on failure)
+* ``overrun_tokens``   – tokens charged on top of an undershot reservation
+* ``output_tokens``    – ``usage.output_tokens``
+* ``cached_tokens``    – input tokens served from the provider's prompt cache
+
+and every `AsyncTokenBucket` records ``bucket_wait_s`` tagged by bucket name.
+``call_latency_s`` (the API call itself), ``first_token_s`` (streamed calls)
+and ``daemon_latency_s`` (JVM daemon round trips, tagged by call) complete
+the picture.
+
+Plain gauges / counters (``agents_active`` per topic, ``topics_completed``)
+are kept alongside with `add`.
+
+Each series is a fixed‑bound histogram kept twice: cumulative (for
+scraping) and rolling over the last ``SLOTS × SLOT_SEC`` seconds (for
+"where is the time going right now").
+
+With `record_events` on, every observation is also kept as a raw event
+(``ts, metric, value`` plus tags) until `drain_events` hands it to a sink –
+`BucketMonitor` writes them out so `Simulation.planner` can fit per‑stage
+distributions after the run.
+
+Usage
+-----
+````python
+call_metrics.observe("queue_wait_s", 3.2, stage="UPDATE_CALL", model="gpt-4.1-mini", topic=4)
+call_metrics.snapshot()   # rolling view: count / sum / p50 / p95 per series
+````
+"""
+from __future__ import annotations
+
+import bisect
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# ───────────────────────────────────────── config ────────────────────────────
+SLOT_SEC: float = 30.0     # width of one rolling slot
+SLOTS: int = 10            # rolling horizon = SLOTS × SLOT_SEC (5 min)
+EVENTS_MAX: int = 100_000  # raw events buffered between drains (oldest dropped)
+
+SECONDS_BOUNDS: Tuple[float, ...] = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BOUNDS: Tuple[float, ...] = (100, 250, 500, 1_000, 2_500, 5_000, 10_000,
+                                   25_000, 50_000, 100_000, 150_000)
+
+Tags = Tuple[Tuple[str, str], ...]
+
+
+def _bounds_for(metric: str) -> Tuple[float, ...]:
+    return SECONDS_BOUNDS if metric.endswith("_s") else TOKEN_BOUNDS
+
+
+class RollingHistogram:
+    """Fixed‑bound histogram, cumulative plus a sliding window of time slots."""
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts: List[int] = [0] * (len(bounds) + 1)   # last bin = +Inf
+        self.total: float = 0.0
+        self.n: int = 0
+        # (slot index, bin counts, [sum, n]) – newest last
+        self._slots: Deque[Tuple[int, List[int], List[float]]] = deque()
+
+    def _slot(self, now: float) -> Tuple[int, List[int], List[float]]:
+        idx = int(now // SLOT_SEC)
+        while self._slots and self._slots[0][0] <= idx - SLOTS:
+            self._slots.popleft()
+        if not self._slots or self._slots[-1][0] != idx:
+            self._slots.append((idx, [0] * (len(self.bounds) + 1), [0.0, 0]))
+        return self._slots[-1]
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        self.counts[i] += 1
+        self.total += value
+        self.n += 1
+        _, counts, agg = self._slot(time.monotonic())
+        counts[i] += 1
+        agg[0] += value
+        agg[1] += 1
+
+    def rolling(self) -> Tuple[List[int], float, int]:
+        """(bin counts, sum, n) over the rolling horizon."""
+        self._slot(time.monotonic())  # age out stale slots
+        counts = [0] * (len(self.bounds) + 1)
+        total, n = 0.0, 0
+        for _, slot_counts, agg in self._slots:
+            counts = [a + b for a, b in zip(counts, slot_counts)]
+            total += agg[0]
+            n += agg[1]
+        return counts, total, n
+
+    def quantile(self, q: float, counts: Optional[List[int]] = None) -> float:
+        """Linear interpolation inside the bin holding the *q* quantile."""
+        counts = self.counts if counts is None else counts
+        n = sum(counts)
+        if not n:
+            return 0.0
+        rank, seen = q * n, 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                lo = self.bounds[i - 1] if i else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+
+def _key(metric: str, tags: Dict[str, object]) -> Tuple[str, Tags]:
+    return metric, tuple(sorted((k, str(v)) for k, v in tags.items() if v is not None))
+
+
+class CallMetrics:
+    """(metric, tags) → `RollingHistogram` registry, plus simple gauges."""
+
+    def __init__(self) -> None:
+        self._series: Dict[Tuple[str, Tags], RollingHistogram] = {}
+        self._values: Dict[Tuple[str, Tags], float] = {}
+        self._events: Optional[Deque[Dict[str, object]]] = None
+
+    def record_events(self, maxlen: int = EVENTS_MAX) -> None:
+        """Keep every observation as a raw event until `drain_events`."""
+        if self._events is None:
+            self._events = deque(maxlen=maxlen)
+
+    def drain_events(self) -> List[Dict[str, object]]:
+        """Hand over (and forget) the raw events recorded so far."""
+        if not self._events:
+            return []
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def _event(self, key: Tuple[str, Tags], value: float) -> None:
+        if self._events is not None:
+            self._events.append({"ts": round(time.time(), 3), "metric": key[0],
+                                 "value": value, **dict(key[1])})
+
+    def add(self, name: str, delta: float = 1, **tags) -> None:
+        """Move the gauge / counter *name* by *delta*."""
+        key = _key(name, tags)
+        self._values[key] = self._values.get(key, 0) + delta
+        self._event(key, delta)
+
+    def values(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Every (name, tags, value) gauge / counter, for exporters."""
+        return [(name, dict(tags), v) for (name, tags), v in list(self._values.items())]
+
+    def observe(self, metric: str, value: float | None, **tags) -> None:
+        if value is None:
+            return
+        key = _key(metric, tags)
+        hist = self._series.get(key)
+        if hist is None:
+            hist = self._series[key] = RollingHistogram(_bounds_for(metric))
+        hist.observe(value)
+        self._event(key, value)
+
+    def series(self) -> List[Tuple[str, Dict[str, str], RollingHistogram]]:
+        """Every (metric, tags, histogram), for exporters."""
+        return [(metric, dict(tags), hist) for (metric, tags), hist in list(self._series.items())]
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        """Rolling view of every series that saw a call within the horizon."""
+        rows: List[Dict[str, object]] = []
+        for metric, tags, hist in self.series():
+            counts, total, n = hist.rolling()
+            if not n:
+                continue
+            rows.append({"metric": metric, **tags, "count": n, "sum": round(total, 3),
+                         "p50": round(hist.quantile(0.5, counts), 3),
+                         "p95": round(hist.quantile(0.95, counts), 3)})
+        return rows
+
+
+# Process‑wide registry shared by the buckets and every gated wrapper
+call_metrics = CallMetrics()
+
+
+def cached_tokens(usage) -> int | None:
+    """Cached input tokens of a Responses (or Chat Completions) ``usage``, if reported."""
+    details = (getattr(usage, "input_tokens_details", None)
+               or getattr(usage, "prompt_tokens_details", None))
+    return getattr(details, "cached_tokens", None)
+
+
+def record_call(*, reserved: int, used: int | None, output: int | None = None,
+                cached: int | None = None, **tags) -> None:
+    """Record one attempt's reservation and what came back of it.
+
+    ``used=None`` means the attempt failed and its whole reservation was refunded.
+    *output* (``usage.output_tokens``) is what sizes ``max_output_tokens``;
+    *cached* is the prompt‑cache hit (see `cached_tokens`).
+    """
+    call_metrics.observe("reserved_tokens", reserved, **tags)
+    call_metrics.observe("output_tokens", output, **tags)
+    call_metrics.observe("cached_tokens", cached, **tags)
+    if used is None:
+        call_metrics.observe("refunded_tokens", reserved, **tags)
+        return
+    call_metrics.observe("used_tokens", used, **tags)
+    call_metrics.observe("refunded_tokens", max(0, reserved - used), **tags)
+    if used > reserved:
+        call_metrics.observe("overrun_tokens", used - reserved, **tags)
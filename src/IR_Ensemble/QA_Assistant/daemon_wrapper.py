@@ -2,6 +2,8 @@ import asyncio, json, os, re, signal, secrets, time
 from pathlib import Path
 from typing import List, Any, Dict, Optional
 
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics
+
 
 JAVA_CLASSPATH = "src/IR_Ensemble/QA_Assistant/Search/lib/*:."
 
@@ -100,11 +102,20 @@ class JVMDaemon:
                           ).encode()
         frame = _encode_frame(body)
 
+        started = time.monotonic()
         async with self._lock:
             self._proc.stdin.write(frame)
             await self._proc.stdin.drain()
 
-        return await fut   # resolves when the reader sees the matching id
+        try:
+            return await fut   # resolves when the reader sees the matching id
+        finally:
+            call_metrics.observe("daemon_latency_s", time.monotonic() - started, call=call)
+
+    @classmethod
+    def inflight(cls) -> int:
+        """Requests submitted to the JVM and not yet answered."""
+        return len(cls._instance._pending) if cls._instance else 0
 
     # ───────── background reader ──────────
     def _start_reader(self) -> None:
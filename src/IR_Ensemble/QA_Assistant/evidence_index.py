@@ -0,0 +1,125 @@
+"""
+evidence_index.py
+~~~~~~~~~~~~~~~~~
+Per‑topic in‑memory inverted index over every segment already fetched.
+
+Each evaluator round builds a fresh `ContextProctor` with fresh agents, but
+the evidence a follow‑up question needs has often been pulled from MS MARCO
+by an earlier round of the same topic.  `rerank_jsonl` adds every segment it
+reads to the topic's `TopicIndex`; new agents score their questions against
+it first (BM25 over sparse postings) and put the hits in the candidate pool
+next to the JVM results – a question well covered locally skips its
+speculative corpus search.
+
+The index lives until the topic is done (`drop_topic_index`).
+
+Usage
+-----
+````python
+topic_index(num).add(docid, text, meta)
+hits = topic_index(num).search("wildfire smoke health effects", k=10, min_score=0.4)
+````
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import re
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+K1: float = 1.2
+B: float = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can could did do does for from had has have how "
+    "if in into is it its may might not of on or should so than that the their there these "
+    "they this those to was were what when where which while who whom why will with would "
+    "about after any all also between both during each more most other over some such "
+    "under until very".split()
+)
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9'\-]*")
+
+
+def terms(text: str) -> List[str]:
+    """Lower‑cased content words of *text* (stop words and single characters dropped)."""
+    return [w for w in _WORD_RE.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+class TopicIndex:
+    """Incremental BM25 index: term → {doc: term frequency} postings."""
+
+    def __init__(self) -> None:
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: List[int] = []
+        self._meta: List[Dict[str, Any]] = []
+        self._ids: Dict[str, int] = {}
+        self._total = 0
+
+    def __len__(self) -> int:
+        return len(self._meta)
+
+    def add(self, segment_id: Optional[str], text: str, meta: Dict[str, Any]) -> bool:
+        """Index one segment; False if it is already in (or has no id)."""
+        if not segment_id or segment_id in self._ids:
+            return False
+        doc = self._ids[segment_id] = len(self._meta)
+        words = terms(text)
+        tf: Dict[str, int] = {}
+        for w in words:
+            tf[w] = tf.get(w, 0) + 1
+        for w, n in tf.items():
+            self._postings.setdefault(w, {})[doc] = n
+        self._meta.append(meta)
+        self._lengths.append(len(words))
+        self._total += len(words)
+        return True
+
+    def search(self, query: str, *, k: int = 10, min_score: float = 0.0,
+               exclude: Collection[str] = ()) -> List[Tuple[Dict[str, Any], float]]:
+        """Top *k* (meta, score) for *query*.
+
+        Scores are BM25 divided by what a segment of average length holding
+        every query term once would score, so *min_score* is a roughly 0–1
+        threshold on query coverage.
+        """
+        n = len(self._meta)
+        if not n:
+            return []
+        avg = self._total / n or 1.0
+        scores: Dict[int, float] = {}
+        ceiling = 0.0
+        for t in set(terms(query)):
+            postings = self._postings.get(t, {})
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            ceiling += idf               # unmatched terms count against the score too
+            for doc, tf in postings.items():
+                norm = K1 * (1 - B + B * self._lengths[doc] / avg)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        if not ceiling:
+            return []
+        hits = []
+        for doc, score in heapq.nlargest(k + len(exclude), scores.items(), key=lambda kv: kv[1]):
+            score /= ceiling
+            if score < min_score or len(hits) >= k:
+                break
+            meta = self._meta[doc]
+            if meta.get("segment_id") not in exclude:
+                hits.append((meta, score))
+        return hits
+
+
+# ───────────────────────────────────────── registry ───────────────────────────
+_indexes: Dict[int, TopicIndex] = {}
+
+
+def topic_index(topic: int) -> TopicIndex:
+    """The evidence index of *topic* (created on first use)."""
+    index = _indexes.get(topic)
+    if index is None:
+        index = _indexes[topic] = TopicIndex()
+    return index
+
+
+def drop_topic_index(topic: int) -> None:
+    """Free a finished topic's index."""
+    _indexes.pop(topic, None)
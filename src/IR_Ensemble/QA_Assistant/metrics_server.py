@@ -0,0 +1,175 @@
+"""
+metrics_server.py
+~~~~~~~~~~~~~~~~~
+Optional local ``/metrics`` endpoint in Prometheus text format.
+
+Started next to `BucketMonitor` when ``METRICS_PORT`` is set, it renders on
+every scrape:
+
+* ``ir_bucket_load`` / ``ir_bucket_capacity`` / ``ir_bucket_waiters`` per bucket
+* ``ir_assistant_buckets_live`` / ``ir_assistant_buckets_evicted_total``
+* every `call_metrics` histogram (queue wait, call latency, reserved / used /
+  refunded tokens, daemon latency …) as a cumulative Prometheus histogram
+* ``ir_daemon_inflight`` – JVM daemon requests awaiting an answer
+* ``ir_cache_hits_total`` / ``ir_cache_misses_total`` per registered cache
+* every `call_metrics` gauge / counter (``ir_agents_active{topic}``,
+  ``ir_topics_completed_total``, ``ir_throttled_total{bucket}``,
+  ``ir_converged_total{topic}``, ``ir_update_unreadable_total{topic}`` …)
+
+Plain ``asyncio.start_server`` – no dependency, bound to localhost.
+
+Environment
+-----------
+``METRICS_PORT=9464``
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.IR_Ensemble.QA_Assistant import rate_limits
+from src.IR_Ensemble.QA_Assistant.call_metrics import CallMetrics, call_metrics
+from src.IR_Ensemble.QA_Assistant.daemon_wrapper import JVMDaemon
+
+PREFIX = "ir_"
+COUNTERS = {"topics_completed", "throttled", "select_skipped", "converged", "update_unreadable"}   # `call_metrics.add` names exported as *_total
+
+# name → () -> (hits, misses); register more with `register_cache`
+CACHES: Dict[str, Callable[[], Tuple[int, int]]] = {
+    "static_tokens": lambda: rate_limits.count_static_tokens.cache_info()[:2],
+}
+
+
+def register_cache(name: str, stats: Callable[[], Tuple[int, int]]) -> None:
+    """Expose a cache's (hits, misses) on the endpoint."""
+    CACHES[name] = stats
+
+
+# ───────────────────────────────────────── rendering ──────────────────────────
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(tags: Dict[str, object]) -> str:
+    if not tags:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(tags.items())) + "}"
+
+
+class _Writer:
+    """Collects samples grouped per metric family (the text format requires it)."""
+
+    def __init__(self) -> None:
+        self._families: Dict[str, Tuple[str, List[str]]] = {}
+
+    def sample(self, name: str, kind: str, value: float, tags: Dict[str, object] | None = None,
+               *, family: Optional[str] = None) -> None:
+        _, lines = self._families.setdefault(family or name, (kind, []))
+        lines.append(f"{name}{_labels(tags or {})} {value:g}")
+
+    def text(self) -> str:
+        out: List[str] = []
+        for family, (kind, lines) in self._families.items():
+            out.append(f"# TYPE {family} {kind}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
+
+
+def _buckets() -> Iterable[Tuple[str, object]]:
+    for label, req, tok in rate_limits.quota_registry.items():
+        yield f"{label}:req", req
+        yield f"{label}:tok", tok
+    yield "cohere:rerank", rate_limits.cohere_bucket[0]
+
+
+def render(metrics: CallMetrics = call_metrics) -> str:
+    """Current state of the pipeline in Prometheus text exposition format."""
+    w = _Writer()
+
+    for name, bucket in _buckets():
+        tags = {"bucket": name}
+        w.sample(f"{PREFIX}bucket_load", "gauge", bucket.current_load(), tags)
+        w.sample(f"{PREFIX}bucket_capacity", "gauge", bucket.capacity, tags)
+        w.sample(f"{PREFIX}bucket_waiters", "gauge", bucket.waiters, tags)
+
+    pool = rate_limits.assistant_tok_limiters
+    w.sample(f"{PREFIX}assistant_buckets_live", "gauge", len(pool))
+    w.sample(f"{PREFIX}assistant_buckets_load", "gauge", pool.live_load())
+    w.sample(f"{PREFIX}assistant_buckets_evicted_total", "counter", pool.aggregate["evicted"])
+    w.sample(f"{PREFIX}daemon_inflight", "gauge", JVMDaemon.inflight())
+
+    for cache, stats in CACHES.items():
+        hits, misses = stats()
+        w.sample(f"{PREFIX}cache_hits_total", "counter", hits, {"cache": cache})
+        w.sample(f"{PREFIX}cache_misses_total", "counter", misses, {"cache": cache})
+
+    for name, tags, value in sorted(metrics.values(), key=lambda t: t[0]):
+        if name in COUNTERS:
+            w.sample(f"{PREFIX}{name}_total", "counter", value, tags)
+        else:
+            w.sample(f"{PREFIX}{name}", "gauge", value, tags)
+
+    for metric, tags, hist in sorted(metrics.series(), key=lambda t: t[0]):
+        family = f"{PREFIX}{metric}"
+        cumulative = 0
+        for bound, count in zip(list(hist.bounds) + ["+Inf"], hist.counts):
+            cumulative += count
+            w.sample(f"{family}_bucket", "histogram", cumulative, {**tags, "le": bound},
+                     family=family)
+        w.sample(f"{family}_sum", "histogram", hist.total, tags, family=family)
+        w.sample(f"{family}_count", "histogram", hist.n, tags, family=family)
+
+    return w.text()
+
+
+# ───────────────────────────────────────── server ─────────────────────────────
+
+class MetricsServer:
+    """Serve `render()` at ``GET /metrics`` on *host*:*port*."""
+
+    def __init__(self, port: int, host: str = "127.0.0.1",
+                 metrics: CallMetrics = call_metrics) -> None:
+        self.port = port
+        self.host = host
+        self._metrics = metrics
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["MetricsServer"]:
+        """A server on ``METRICS_PORT``, or ``None`` when it is unset."""
+        port = os.getenv("METRICS_PORT")
+        return cls(int(port)) if port else None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # skip headers
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", render(self._metrics).encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
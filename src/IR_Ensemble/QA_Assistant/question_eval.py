@@ -2,7 +2,9 @@ import traceback
 from typing import List,Dict,Any
 from openai import AsyncAzureOpenAI
 from src.IR_Ensemble.QA_Assistant.base import BaseAgent, QAStatus
-from src.IR_Ensemble.QA_Assistant.rate_limits import LoopStage
+from src.IR_Ensemble.QA_Assistant.rate_limits import LoopStage, release_assistant
+from src.IR_Ensemble.QA_Assistant.admission import AdmissionRejected
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics
 
 class QuestionEvalAgent(BaseAgent):
     """
@@ -12,30 +14,52 @@ class QuestionEvalAgent(BaseAgent):
         # loop until finished
         rounds = 0
         while self.status != QAStatus.FINISHED:
-            segments = await self.get_info(first_round= (rounds == 0))
-            await self.update_answer(segments)
+            try:
+                segments = await self.get_info(first_round= (rounds == 0))
+                await self.update_answer(segments)
+            except AdmissionRejected as exc:
+                # Overloaded – cut the round short and keep the answer so far
+                await self._log(f"\n―――― Round shed: {exc} ――――\n")
+                if self.prev_id is not None:
+                    await self.force_final_prompt()
+                break
             rounds += 1
+            if self.converged and self.status != QAStatus.FINISHED:
+                # Answers stopped moving – more rounds would only re‑read the same evidence
+                await self._log(f"\n―――― Converged after {rounds} rounds ――――\n")
+                call_metrics.add("converged", topic=self.num)
+                await self.force_final_prompt()
+                break
             if rounds >= self.MAX_TOOL_ROUNDS:
                 await self.force_final_prompt()
                 break
             await self.reset_logical_thread()
-        return {"summary": self.summary,  "status": self.status.name, "answer": self.full_answer}
+        return {"summary": self.summary,  "status": self.status.name, "answer": self.full_answer,
+                "finished": self.finished_items}
 
 async def assess_questions(
     questions: str,
     client: AsyncAzureOpenAI,
-    num: int
+    num: int,
+    deadline: float | None = None,
+    topic_id: str | None = None,
 ) -> List[Dict[str, Any]]:
     """
     Evaluate questions for relevance to the document set.
+    *deadline* (``time.monotonic()``) bounds how long the agent may queue;
+    *topic_id* is the topic's stable id the answer cache is scoped by.
     """
-    agent = await QuestionEvalAgent(questions, client, num=num)
+    agent = await QuestionEvalAgent(questions, client, num=num, deadline=deadline, topic_id=topic_id)
+    call_metrics.add("agents_active", 1, topic=num)
     try :
         return await agent.run()
     except Exception as e:
         print(traceback.format_exc())
     finally:
-        return {"summary": agent.summary, "status": agent.status.name, "answer": agent.full_answer}
+        call_metrics.add("agents_active", -1, topic=num)
+        release_assistant(agent.agent_id)
+        return {"summary": agent.summary, "status": agent.status.name, "answer": agent.full_answer,
+                "finished": agent.finished_items}
     
     
 
@@ -0,0 +1,97 @@
+"""
+question_triage.py
+~~~~~~~~~~~~~~~~~~
+Lexical pre‑pass over the evaluator's questions before `ContextProctor`
+batches them.
+
+* **Merge** – questions whose TF‑IDF cosine (over `evidence_index.terms`) is
+  at least *merge_at* are paraphrases: the first becomes the research item and
+  the rest ride along in its ``duplicates`` list.  When the item is finished,
+  `BaseAgent._update_status` writes the answer once per duplicate too.
+* **Group** – batches are filled greedily with the most similar remaining
+  items (at least *related_at*), so questions that want the same evidence share
+  one agent's searches and read ledger.
+
+Everything runs locally on a handful of short strings.
+
+Usage
+-----
+````python
+items = merge_duplicates(questions)
+batches = related_batches(items, size=2)
+````
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List
+
+from src.IR_Ensemble.QA_Assistant.evidence_index import terms
+
+MERGE_AT: float = 0.8       # cosine at which two questions are one research item
+RELATED_AT: float = 0.25    # cosine at which two items are worth one agent
+
+
+def _vectors(questions: List[Dict[str, Any]]) -> List[Dict[str, float]]:
+    """Unit TF‑IDF vectors of the ``question`` texts, idf taken over *questions*."""
+    counts = []
+    df: Dict[str, int] = {}
+    for q in questions:
+        tf: Dict[str, int] = {}
+        for t in terms(str(q.get("question", ""))):
+            tf[t] = tf.get(t, 0) + 1
+        counts.append(tf)
+        for t in tf:
+            df[t] = df.get(t, 0) + 1
+    n = len(questions)
+    vectors = []
+    for tf in counts:
+        vec = {t: c * (math.log((n + 1) / (df[t] + 1)) + 1) for t, c in tf.items()}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        vectors.append({t: w / norm for t, w in vec.items()})
+    return vectors
+
+
+def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(t, 0.0) for t, w in a.items())
+
+
+def merge_duplicates(questions: List[Dict[str, Any]], *, merge_at: float = MERGE_AT) -> List[Dict[str, Any]]:
+    """One item per cluster of paraphrases, in first‑seen order; the others go in ``duplicates``."""
+    vectors = _vectors(questions)
+    items: List[Dict[str, Any]] = []
+    heads: List[int] = []                     # question index each item was built from
+    for i, q in enumerate(questions):
+        for item, head in zip(items, heads):
+            if _cosine(vectors[i], vectors[head]) >= merge_at:
+                item.setdefault("duplicates", []).append(q)
+                break
+        else:
+            items.append(dict(q))
+            heads.append(i)
+    return items
+
+
+def related_batches(items: List[Dict[str, Any]], size: int, *,
+                    related_at: float = RELATED_AT) -> List[List[Dict[str, Any]]]:
+    """
+    Batches of at most *size* items.  Each batch starts at the earliest item
+    left and takes the most similar remaining ones at or above *related_at*;
+    it is topped up in the original order when nothing related is left.
+    """
+    vectors = _vectors(items)
+    left = list(range(len(items)))
+    batches = []
+    while left:
+        batch = [left.pop(0)]
+        while left and len(batch) < size:
+            closeness = {j: max(_cosine(vectors[j], vectors[b]) for b in batch) for j in left}
+            pick = max(left, key=lambda j: (closeness[j], -j))
+            if closeness[pick] < related_at:
+                pick = left[0]
+            left.remove(pick)
+            batch.append(pick)
+        batches.append([items[i] for i in batch])
+    return batches
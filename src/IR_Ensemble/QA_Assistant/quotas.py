@@ -0,0 +1,97 @@
+"""
+quotas.py
+~~~~~~~~~
+Declarative per‑deployment quota registry.
+
+Azure OpenAI enforces RPM / TPM per *deployment* on a given *endpoint*, so
+every (endpoint, deployment) pair gets its own request and token bucket.
+Callers gate on the buckets of the deployment they actually hit instead of
+one shared global cap.
+
+Endpoints are declared by the name of the environment variable that holds
+them (the same variables used to build the clients in `main.py`) and are
+matched on host name, so the registry lines up with `client.base_url`.
+
+Usage
+-----
+````python
+req, tok = quota_registry.for_client(client, "gpt-4.1-mini")
+async with tok.acquire(reserve) as tok_id, req.acquire(1):
+    ...
+````
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterator, Tuple
+from urllib.parse import urlparse
+
+from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
+
+# ───────────────────────────────────────── config ────────────────────────────
+# (endpoint env var, deployment) → per‑minute quota of that deployment
+QUOTAS: Dict[Tuple[str, str], Dict[str, int]] = {
+    # IR agents – SEARCH on gpt‑4.1, SELECT / UPDATE / FINAL on gpt‑4.1‑mini
+    ("IR_AZURE_OPENAI_ENDPOINT", "gpt-4.1"):      {"rpm": 50,  "tpm": 50_000},
+    ("IR_AZURE_OPENAI_ENDPOINT", "gpt-4.1-mini"): {"rpm": 200, "tpm": 200_000},
+    # Report generator / evaluator
+    ("AZURE_OPENAI_ENDPOINT", "gpt-4.1"):         {"rpm": 50,  "tpm": 50_000},
+}
+
+# Used for any (endpoint, deployment) pair that is not declared above
+DEFAULT_QUOTA: Dict[str, int] = {"rpm": 50, "tpm": 50_000}
+
+
+# ───────────────────────────────────────── helpers ───────────────────────────
+
+def _host(endpoint: str | None) -> str:
+    """Normalise an endpoint URL (or bare host) to its lower‑case host name."""
+    if not endpoint:
+        return ""
+    endpoint = str(endpoint)
+    parsed = urlparse(endpoint if "//" in endpoint else f"//{endpoint}")
+    return (parsed.hostname or endpoint).lower()
+
+
+# ───────────────────────────────────────── registry ──────────────────────────
+
+class QuotaRegistry:
+    """Lazily built (endpoint host, deployment) → (req_bucket, tok_bucket) map."""
+
+    def __init__(
+        self,
+        quotas: Dict[Tuple[str, str], Dict[str, int]] = QUOTAS,
+        *,
+        window: float = 60.0,
+        default: Dict[str, int] = DEFAULT_QUOTA,
+    ) -> None:
+        self.window = window
+        self.default = default
+        self._declared: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._buckets: Dict[Tuple[str, str], Tuple[AsyncTokenBucket, AsyncTokenBucket]] = {}
+
+        for (endpoint_env, deployment), quota in quotas.items():
+            key = (_host(os.getenv(endpoint_env, endpoint_env)), deployment)
+            self._declared[key] = quota
+            self.buckets(*key)  # declared deployments are visible from the start
+
+    def buckets(self, endpoint: str, deployment: str) -> Tuple[AsyncTokenBucket, AsyncTokenBucket]:
+        """Return (req_bucket, tok_bucket) for *deployment* on *endpoint*."""
+        key = (_host(endpoint), deployment)
+        if key not in self._buckets:
+            quota = self._declared.get(key, self.default)
+            label = f"{deployment}@{key[0]}"
+            self._buckets[key] = (
+                AsyncTokenBucket(quota["rpm"], self.window, name=f"{label}:req"),
+                AsyncTokenBucket(quota["tpm"], self.window, name=f"{label}:tok"),
+            )
+        return self._buckets[key]
+
+    def for_client(self, client, deployment: str) -> Tuple[AsyncTokenBucket, AsyncTokenBucket]:
+        """Buckets for the deployment *client* will hit when called with *deployment*."""
+        return self.buckets(str(client.base_url), deployment)
+
+    def items(self) -> Iterator[Tuple[str, AsyncTokenBucket, AsyncTokenBucket]]:
+        """Yield (label, req_bucket, tok_bucket) for every known deployment."""
+        for (host, deployment), (req, tok) in list(self._buckets.items()):
+            yield f"{deployment}@{host}", req, tok
@@ -3,15 +3,21 @@ rate_limits.py
 ~~~~~~~~~~~~~~
 Centralised async rate‑limiting for
 
-• OpenAI GPT‑4.x (≤ 50 requests/min shared, ≤ 50 000 tokens/min shared,
-  and ≤ 10 000 tokens/min per Assistant)
-• Cohere *rerank* endpoint (≤ 20 requests/min)
+• Azure OpenAI Responses calls (`gated_response`) – every call takes one
+  slot of the request bucket and its token reservation from the token
+  bucket of the deployment it hits (endpoint × model, limits from
+  `quotas`); all but SEARCH_CALL also take the reservation from the calling
+  assistant's personal bucket (`bucket_pool`).  Deployment buckets follow
+  the server's rate‑limit headers (`adaptive_limits`).
+• Cohere *rerank* endpoint (`gated_cohere_rerank_call`, ≤ 20 requests/min)
+
+A reservation holds for the bucket's window, not for the call; unused
+tokens are refunded to it by event id once the real usage is known.
 
 Install once:
-    pip install aiolimiter tiktoken
+    pip install tiktoken
 """
 from __future__ import annotations
-from collections import defaultdict
 from typing import Any, Awaitable, Callable, Dict
 from enum import Enum
 from functools import lru_cache
@@ -21,10 +27,18 @@ import os, time
 
 from openai import AsyncAzureOpenAI
 from openai.types.responses import Response, ResponseUsage
-import tiktoken
 
 from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
-from src.IR_Ensemble.QA_Assistant.answer_contracts import GLOBAL_FORMAT
+from src.IR_Ensemble.QA_Assistant.quotas import QuotaRegistry
+from src.IR_Ensemble.QA_Assistant.bucket_pool import AssistantBucketPool
+from src.IR_Ensemble.QA_Assistant.answer_contracts import INSTRUCTIONS
+from src.IR_Ensemble.QA_Assistant.usage_estimator import output_estimator
+from src.IR_Ensemble.QA_Assistant.adaptive_limits import observe_headers, observe_error
+from src.IR_Ensemble.QA_Assistant.retry import with_retries, reached_server, TRANSIENT_STATUS
+from src.IR_Ensemble.QA_Assistant.admission import admit, resolve_deadline
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics, record_call, cached_tokens
+from src.IR_Ensemble.QA_Assistant.token_estimator import ENCODER, estimate_tokens
+from src.IR_Ensemble.QA_Assistant.stream_parser import StreamSink
 
 load_dotenv()
 
@@ -56,14 +70,9 @@ class LoopStage(Enum):
                    "temperature":0.4,
                    "top_p":0.95}, 100_000,4]
 
-# Assumes three assistants at work
 # ───────────────────────────────────────── config ────────────────────────────
 WINDOW: float = 62.0  # seconds
-# Global OpenAI limits
-PLAN_REQ_CAP: int = 50  # requests / minute (global)
-PLAN_TOK_CAP: int = 50_000     # tokens   / minute (global)
-GLOBAL_REQ_CAP: int = 200      # requests / minute (global)
-GLOBAL_TOK_CAP: int = 200_000     # tokens   / minute (global)
+# Per‑deployment OpenAI limits live in quotas.QUOTAS
 
 # Per‑assistant token budget (soft fairness / runaway protection)
 PERSONAL_TOK_CAP: int = 100_000  # tokens / minute 
@@ -73,35 +82,37 @@ COHERE_RERANK_CAP: int = 500     # requests / minute (global)
 
 PROMPT_BUFFER = lambda max_out: int(max_out * 0.025) #safety buffer for tokens
 
-@lru_cache
-def ENCODER():
-    return tiktoken.get_encoding("o200k_base")
-
 # ───────────────────────────────────── limiters ──────────────────────────────
-# Requests – *global only* (all Assistants share this)
-plan_req_limiter = AsyncTokenBucket(PLAN_REQ_CAP, WINDOW)
-plan_tok_limiter = AsyncTokenBucket(PLAN_TOK_CAP, WINDOW)
-global_tok_limiter = AsyncTokenBucket(GLOBAL_TOK_CAP, WINDOW)
-global_req_limiter = AsyncTokenBucket(GLOBAL_REQ_CAP, WINDOW)
+# Requests + tokens – one pair of buckets per (endpoint, deployment)
+quota_registry = QuotaRegistry(window=WINDOW)
 
-# Tokens – lazy‑initialised per‑assistant buckets
-assistant_tok_limiters: Dict[str, AsyncTokenBucket] = defaultdict(
-    lambda: AsyncTokenBucket(PERSONAL_TOK_CAP, WINDOW)
-)
+# Tokens – lazy‑initialised per‑assistant buckets, evicted once the agent is done
+assistant_tok_limiters = AssistantBucketPool(PERSONAL_TOK_CAP, WINDOW)
 
 # Cohere limiters
-cohere_bucket = [AsyncTokenBucket(COHERE_RERANK_CAP, WINDOW), os.getenv("COHERE_API_KEY")]
+cohere_bucket = [AsyncTokenBucket(COHERE_RERANK_CAP, WINDOW, name="cohere:rerank"),
+                 os.getenv("COHERE_API_KEY")]
 
 
 # ───────────────────────────────────────── helpers ───────────────────────────
 
 def _count_tokens(text: str | None) -> int:
-    """Fast GPT‑4/GPT‑4o token estimator."""
+    """Exact GPT‑4/GPT‑4o token count (blocking – keep off hot paths, see estimate_tokens)."""
     return 0 if not text else len(ENCODER().encode(text))
 
-def _get_token_buckets(assistant_id: str):
-    """Return (personal_bucket, global_bucket,global_req_bucket) for the assistant."""
-    return assistant_tok_limiters[assistant_id], global_tok_limiter, global_req_limiter
+@lru_cache(maxsize=256)
+def count_static_tokens(text: str | None) -> int:
+    """Memoised `_count_tokens` for static strings (contract headers, INSTRUCTIONS, role tags)."""
+    return _count_tokens(text)
+
+def _get_token_buckets(assistant_id: str, client: AsyncAzureOpenAI, model: str):
+    """Return (personal_bucket, deployment_tok_bucket, deployment_req_bucket)."""
+    req, tok = quota_registry.for_client(client, model)
+    return assistant_tok_limiters.bucket(assistant_id), tok, req
+
+def release_assistant(assistant_id: str) -> None:
+    """Agent finished – let its personal bucket be evicted once its window drains."""
+    assistant_tok_limiters.release(assistant_id)
 
 # ─────────────────────────────────── public wrappers ─────────────────────────
 async def gated_response(
@@ -112,22 +123,60 @@ async def gated_response(
     stage: LoopStage,
     context: str = "",
     prev_id: str | None = None,
+    prompt_tokens: int | None = None,
+    deadline: float | None = None,
+    max_wait: float | None = None,
+    topic: int | None = None,
+    stream: StreamSink | None = None,
 ) -> Response:
     """
     Throttle an OpenAI Responses API call with hierarchical token buckets
-    (per‑assistant + global).  Now uses *event IDs* so refunds target the
-    exact reservation that was made.
+    (per‑assistant + the RPM/TPM buckets of the deployment the call hits).
+    Uses *event IDs* so refunds target the exact reservation that was made.
+
+    The output share of the reservation is predicted from the output tokens
+    actually used by earlier calls of the same stage/model (see
+    `usage_estimator`); an overrun is charged back once the call returns.
+    The deployment buckets track the server's ``x-ratelimit-*`` headers
+    (see `adaptive_limits`).  Transient failures are retried by `retry`;
+    each retry is re‑gated and a failed attempt's reservation is refunded
+    immediately.
+
+    Callers that keep their own token ledger pass *prompt_tokens* (the size
+    of ``INSTRUCTIONS + context + prompt``) so nothing is re‑encoded here.
+    ``usage.input_tokens_details.cached_tokens`` is recorded per stage as
+    ``cached_tokens`` – how much of the stable prefix the provider served
+    from its prompt cache.
+
+    With *stream* the call is made with ``stream=True`` and every output‑text
+    delta is fed to it as it arrives (see `stream_parser`); the returned
+    `Response` is the one carried by the final ``response.completed`` event,
+    so usage, refunds and overrun charges are reconciled exactly as without.
+
+    *deadline* (``time.monotonic()``) / *max_wait* (seconds) bound the queue
+    wait: if the buckets predict a longer wait the call is rejected with
+    `AdmissionRejected` before anything is reserved (see `admission`).
+
+    Queue wait, reservation, used and refunded tokens are recorded in
+    `call_metrics`, tagged by stage, model and *topic*.
     """
-    personal_tok, global_tok, global_req = _get_token_buckets(assistant_id)
+    params = stage.value[0]
+    personal_tok, deploy_tok, deploy_req = _get_token_buckets(
+        assistant_id, client, params["model"]
+    )
 
-    m = {"role": "user", "content": prompt}
-    prompt_tokens = _count_tokens(
-        GLOBAL_FORMAT + context + f"<|{m['role']}|>\n{m['content']}\n"
+    if prompt_tokens is None:
+        m = {"role": "user", "content": prompt}
+        prompt_tokens = count_static_tokens(INSTRUCTIONS) + estimate_tokens(
+            context + f"<|{m['role']}|>\n{m['content']}\n"
+        )
+    expected_out = output_estimator.reserve_for(
+        stage.name, params["model"], params["max_output_tokens"]
     )
     reserve = (
         prompt_tokens
-        + stage.value[0]["max_output_tokens"]
-        + PROMPT_BUFFER(prompt_tokens + stage.value[0]["max_output_tokens"])
+        + expected_out
+        + PROMPT_BUFFER(prompt_tokens + expected_out)
     )
 
     if reserve > stage.value[1]:
@@ -136,56 +185,101 @@ async def gated_response(
             f"which exceeds the cap of {stage.value[1]:,}/min."
         )
 
-    result: Response | None = None
-    ids: dict[str, str] = {}
-    is_search_call = stage == LoopStage.SEARCH_CALL
-
-    try:
-        if is_search_call:
-            # Planner uses its own global bucket 
-            # Note: Planner is deprecated, the search query generation now uses the plan token bucket
-            async with plan_tok_limiter.acquire(reserve) as plan_id, \
-                       plan_req_limiter.acquire(1):
-                ids["plan"] = plan_id
-                result = await client.responses.create(
-                    input=prompt,
-                    instructions=GLOBAL_FORMAT,
-                    **stage.value[0],
-                    previous_response_id=prev_id,
-                )
-        else:
-            # Ordinary call – personal + global buckets
-            async with global_tok.acquire(reserve) as global_id, \
-                       personal_tok.acquire(reserve) as personal_id, \
-                       global_req.acquire(1):
-                ids["global"] = global_id
-                ids["personal"] = personal_id
-                result = await client.responses.create(
-                    input=prompt,
-                    instructions=GLOBAL_FORMAT,
-                    **stage.value[0],
-                    previous_response_id=prev_id,
-                )
-    except Exception:
-        # Let the caller handle/log – reservation stays until it ages out
-        raise
-
-    if result is None:
-        raise ValueError("No response from OpenAI")
-
-    # Refund any surplus
-    await refund_tokens(
-        assistant_id=assistant_id,
-        used_tokens=result.usage.total_tokens,
-        reserved=reserve,
-        is_plan_call=is_search_call,
-        ids=ids,
-    )
-    return result
+    deadline = resolve_deadline(deadline, max_wait)
+    if stage == LoopStage.SEARCH_CALL:
+        # Query generation is exempt from the per‑assistant budget
+        gates = [(deploy_tok, reserve), (deploy_req, 1)]
+    else:
+        gates = [(deploy_tok, reserve), (personal_tok, reserve), (deploy_req, 1)]
+    tags = {"stage": stage.name, "model": params["model"], "topic": topic}
+
+    sent = False   # whether the current attempt's request went out
+
+    async def _create() -> Response | None:
+        nonlocal sent
+        started = time.monotonic()
+        sent = True
+        try:
+            raw = await client.responses.with_raw_response.create(
+                input=prompt,
+                instructions=INSTRUCTIONS,
+                **params,
+                previous_response_id=prev_id,
+                **({"stream": True} if stream is not None else {}),
+            )
+            observe_headers(raw.headers, req=deploy_req, tok=deploy_tok)
+            if stream is None:
+                return raw.parse()
+            return await _consume_stream(raw.parse(), stream, started, tags)
+        finally:
+            call_metrics.observe("call_latency_s", time.monotonic() - started, **tags)
+
+    async def _attempt() -> Response:
+        # Every attempt is gated on its own; a failed one is refunded at once
+        entered = time.monotonic()
+        admit(gates, deadline, label=stage.name)
+        nonlocal sent
+        sent = False
+        held: list[tuple[AsyncTokenBucket, str]] = []
+        try:
+            for bucket, weight in gates:
+                # Taken for the bucket's window, not for the call – refunds go by event id
+                held.append((bucket, await bucket.reserve(weight, deadline=deadline)))
+            call_metrics.observe("queue_wait_s", time.monotonic() - entered, **tags)
+            result = await _create()
+        except Exception as exc:
+            observe_error(exc, req=deploy_req, tok=deploy_tok)
+            if sent and reached_server(exc):
+                # The server counted the request – only the tokens come back
+                await release_reservation([(b, eid) for b, eid in held if b is not deploy_req])
+            else:
+                await release_reservation(held)
+            if held:
+                record_call(reserved=reserve, used=None, **tags)
+            raise
+
+        if result is None:
+            raise ValueError("No response from OpenAI")
+
+        output_estimator.observe(stage.name, params["model"], result.usage.output_tokens)
+        record_call(reserved=reserve, used=result.usage.total_tokens,
+                    output=result.usage.output_tokens, cached=cached_tokens(result.usage), **tags)
+
+        # Refund any surplus / charge any overrun (token buckets only)
+        await refund_tokens(
+            used_tokens=result.usage.total_tokens,
+            reserved=reserve,
+            held=[(b, eid) for b, eid in held if b is not deploy_req],
+        )
+        return result
+
+    return await with_retries(_attempt, label=stage.name, deadline=deadline)
                 
 
+async def _consume_stream(events, sink: StreamSink, started: float, tags: dict) -> Response:
+    """Feed output‑text deltas to *sink*; return the final event's full `Response`."""
+    sink.reset()
+    first = True
+    async for event in events:
+        kind = getattr(event, "type", "")
+        if kind == "response.output_text.delta":
+            if first:
+                call_metrics.observe("first_token_s", time.monotonic() - started, **tags)
+                first = False
+            sink.feed(event.delta)
+        elif kind in ("response.completed", "response.incomplete"):
+            return event.response
+        elif kind in ("response.failed", "error"):
+            raise RuntimeError(f"Response stream failed: {getattr(event, 'response', event)}")
+    raise RuntimeError("Response stream ended without a completed response")
+
+
 async def gated_cohere_rerank_call(
     send_fn: Callable[..., Awaitable[Any]],
+    *,
+    deadline: float | None = None,
+    max_wait: float | None = None,
+    topic: int | None = None,
     **kwargs,
 ):
     bucket,key = cohere_bucket          
@@ -193,36 +287,61 @@ async def gated_cohere_rerank_call(
         "Authorization": f"Bearer {key}",
         "Content-Type":  "application/json"
     }
-    """Throttle Cohere’s `/rerank` so we issue ≤ 20 calls per minute."""
-    async with bucket.acquire(1):
-        return await send_fn(headers = headers,**kwargs)
+    """Throttle Cohere’s `/rerank` so we issue ≤ 20 calls per minute."""
+    deadline = resolve_deadline(deadline, max_wait)
+    tags = {"stage": "COHERE_RERANK", "model": kwargs.get("json", {}).get("model"), "topic": topic}
+
+    async def _attempt():
+        entered = time.monotonic()
+        admit([(bucket, 1)], deadline, label="cohere rerank")
+        req_id = await bucket.reserve(1, deadline=deadline)
+        call_metrics.observe("queue_wait_s", time.monotonic() - entered, **tags)
+        started = time.monotonic()
+        try:
+            resp = await send_fn(headers = headers,**kwargs)
+            call_metrics.observe("call_latency_s", time.monotonic() - started, **tags)
+            # Track Cohere's rate‑limit headers; a 429 is backed off on once,
+            # as the HTTPStatusError raised here
+            observe_headers(resp.headers, req=bucket)
+            if resp.status_code in TRANSIENT_STATUS:
+                resp.raise_for_status()
+        except Exception as exc:
+            observe_error(exc, req=bucket)
+            if not reached_server(exc):
+                await bucket.credit_by_id(req_id)
+            raise
+        return resp
+
+    return await with_retries(_attempt, label="cohere rerank", deadline=deadline)
 
 # ───────────────────────────────── token refund helper ───────────────────────
 
+async def release_reservation(held: list[tuple[AsyncTokenBucket, str]]) -> None:
+    """Give back the *whole* reservation of a failed attempt right away."""
+    for bucket, event_id in held:
+        await bucket.credit_by_id(event_id)
+
 async def refund_tokens(
     *,
-    assistant_id: str,
     used_tokens: int,
     reserved: int,
-    is_plan_call: bool,
-    ids: dict[str, str],
+    held: list[tuple[AsyncTokenBucket, str]],
 ) -> None:
     """
-    Return **(reserved − used)** tokens to the *specific* reservation event(s).
+    Return **(reserved - used)** tokens to the *specific* reservation event(s)
+    in *held* (pairs of bucket and event id).
     If the event has already expired from the sliding window, credit_by_id is
     a no‑op, so we never over‑refund.
+    A negative difference (predicted reservation undershot) is charged to the
+    same events with debit_by_id.
     """
     diff = reserved - used_tokens
-    if diff <= 0:
-        return  # nothing to refund
+    if diff == 0:
+        return  # exact reservation
 
-    if is_plan_call:
-        # Planner bucket only
-        await plan_tok_limiter.credit_by_id(ids["plan"], diff)
-        return
-
-    personal_tok, global_tok, _ = _get_token_buckets(assistant_id)
-
-    # Refund exactly to the caller's own events
-    await personal_tok.credit_by_id(ids["personal"], diff)
-    await global_tok.credit_by_id(ids["global"], diff)
+    # Refund / charge exactly the caller's own events
+    for bucket, event_id in held:
+        if diff > 0:
+            await bucket.credit_by_id(event_id, diff)
+        else:
+            await bucket.debit_by_id(event_id, -diff)
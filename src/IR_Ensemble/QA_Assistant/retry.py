@@ -0,0 +1,115 @@
+"""
+retry.py
+~~~~~~~~
+Single, bucket‑aware retry layer for every gated call.
+
+The SDK clients are built with ``max_retries=0`` so retries no longer run
+invisibly inside one reservation.  Instead each *attempt* passed to
+`with_retries` gates itself through the buckets, and refunds its token
+reservation as soon as it fails – its request slot only when the request
+never reached the server (`reached_server`), since the server counts the
+rest.  Between attempts we sleep with exponential backoff + full jitter,
+never less than the server's ``retry-after``.
+With a *deadline* no retry is scheduled that would start past it.
+
+Usage
+-----
+````python
+async def _attempt():
+    event_id = await bucket.reserve(n)
+    try:
+        return await call()
+    except Exception:
+        await bucket.credit_by_id(event_id)   # give the tokens back now
+        raise
+
+result = await with_retries(_attempt)
+````
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import openai
+
+from src.IR_Ensemble.QA_Assistant.adaptive_limits import retry_after_seconds
+
+T = TypeVar("T")
+
+# ───────────────────────────────────────── config ────────────────────────────
+MAX_ATTEMPTS: int = 5         # first try + 4 retries
+BASE_DELAY: float = 1.0       # seconds, doubled every attempt
+MAX_DELAY: float = 30.0       # cap on the exponential term
+TRANSIENT_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+# ───────────────────────────────────────── helpers ───────────────────────────
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for errors worth retrying: timeouts, dropped connections, 429 / 5xx."""
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return _status(exc) in TRANSIENT_STATUS
+
+
+def reached_server(exc: BaseException) -> bool:
+    """True when a failed request was (or may have been) counted by the server.
+
+    HTTP errors (429, 5xx …) and read timeouts reached it; a request that
+    never connected did not, so only that one's request slot is given back.
+    """
+    if isinstance(exc, httpx.ConnectTimeout):
+        return False
+    if isinstance(exc, (openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, (openai.APIConnectionError, httpx.TransportError)):
+        return False
+    return True
+
+
+def backoff_delay(attempt: int, exc: BaseException | None = None) -> float:
+    """Full‑jitter exponential backoff, floored at the server's retry‑after."""
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    retry_after = retry_after_seconds(headers)
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+# ─────────────────────────────────── public API ──────────────────────────────
+
+async def with_retries(
+    attempt: Callable[[], Awaitable[T]],
+    *,
+    attempts: int = MAX_ATTEMPTS,
+    label: str = "call",
+    deadline: Optional[float] = None,
+) -> T:
+    """Run *attempt* until it succeeds, a non‑transient error or *attempts* runs out.
+
+    *deadline* (``time.monotonic()`` seconds): the last error is re‑raised
+    instead of sleeping past it.
+    """
+    for n in range(attempts):
+        try:
+            return await attempt()
+        except Exception as exc:
+            if n == attempts - 1 or not is_transient(exc):
+                raise
+            delay = backoff_delay(n, exc)
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise
+            print(f"Retrying {label} in {delay:.1f}s after {type(exc).__name__} "
+                  f"(attempt {n + 1}/{attempts})")
+            await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")  # pragma: no cover
@@ -0,0 +1,181 @@
+"""
+shared_state.py
+~~~~~~~~~~~~~~~
+Optional cross‑process backend for `AsyncTokenBucket`.
+
+Every bucket normally lives in one asyncio process.  When several workers
+(`main.py`, `RunGeneration.generate_runs`, topic shards …) run on the same
+box they would each believe they own the full Azure / Cohere quota.  Point
+``RATE_LIMIT_STATE`` at a SQLite file and every *named* bucket keeps its
+sliding window in that file instead, so the processes split one quota.
+
+The semantics are those of the in‑process bucket: reserve‑or‑wait, refund
+by event id (partial or whole), overrun debit and retry‑after pauses.
+Timestamps are wall‑clock (``time.time``) so every process agrees on them.
+All writes run inside ``BEGIN IMMEDIATE`` transactions, which serialise the
+check‑and‑insert across processes; callers run them in worker threads.  The
+read‑only probes (`load`, `predict_wait`) are called from the event loop, so
+they use their own read‑only connection with a short busy timeout and fall
+back to the last value seen rather than block behind a writer.
+
+Environment
+-----------
+``RATE_LIMIT_STATE=DerivedData/Throughput/rate_limits.sqlite``
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+
+READ_TIMEOUT: float = 0.05   # seconds an event‑loop read waits on a locked file
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id      TEXT PRIMARY KEY,
+    bucket  TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    weight  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_bucket_ts ON events (bucket, ts);
+CREATE TABLE IF NOT EXISTS pauses (
+    bucket  TEXT PRIMARY KEY,
+    until   REAL NOT NULL
+);
+"""
+
+
+class SQLiteBucketState:
+    """Sliding‑window event store shared through one SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._mutex = threading.Lock()   # one connection, many worker threads
+        # Event‑loop reads: separate connection and lock, never behind a writer
+        self._reader = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True,
+                                       timeout=READ_TIMEOUT, isolation_level=None,
+                                       check_same_thread=False)
+        self._read_mutex = threading.Lock()
+        self._last_load: Dict[str, int] = {}
+
+    # ───────────────────────── internal helpers ──────────────────────────
+    def _txn(self, fn, *args):
+        with self._mutex:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(cur, *args)
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+            return out
+
+    @staticmethod
+    def _purge(cur: sqlite3.Cursor, bucket: str, window: float, now: float) -> None:
+        cur.execute("DELETE FROM events WHERE bucket = ? AND ts <= ?", (bucket, now - window))
+
+    # ───────────────────────────── public API ────────────────────────────
+    def try_reserve(self, bucket: str, capacity: int, window: float,
+                    weight: int, event_id: str) -> float:
+        """Record *weight* if it fits and return 0, else return seconds to wait."""
+        def _run(cur: sqlite3.Cursor) -> float:
+            now = time.time()
+            cur.execute("SELECT until FROM pauses WHERE bucket = ?", (bucket,))
+            row = cur.fetchone()
+            if row and row[0] > now:
+                return row[0] - now
+
+            self._purge(cur, bucket, window, now)
+            cur.execute("SELECT COALESCE(SUM(weight), 0), MIN(ts), COUNT(*) "
+                        "FROM events WHERE bucket = ?", (bucket,))
+            load, oldest, count = cur.fetchone()
+            # An oversized weight goes alone, exactly like the local bucket
+            if load + weight <= capacity or count == 0:
+                cur.execute("INSERT INTO events (id, bucket, ts, weight) VALUES (?, ?, ?, ?)",
+                            (event_id, bucket, now, weight))
+                return 0.0
+            return (window - (now - oldest)) + 1  # +1 to be safe
+        return self._txn(_run)
+
+    def credit(self, bucket: str, event_id: str, weight: Optional[int]) -> None:
+        """Refund up to *weight* (``None`` → all) from *event_id*; no‑op if gone."""
+        def _run(cur: sqlite3.Cursor) -> None:
+            cur.execute("SELECT weight FROM events WHERE id = ? AND bucket = ?", (event_id, bucket))
+            row = cur.fetchone()
+            if not row:
+                return
+            refund = row[0] if weight is None else min(weight, row[0])
+            if refund == row[0]:
+                cur.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            else:
+                cur.execute("UPDATE events SET weight = weight - ? WHERE id = ?", (refund, event_id))
+        self._txn(_run)
+
+    def debit(self, bucket: str, event_id: str, weight: int) -> None:
+        """Charge *weight* extra to *event_id*; no‑op if it already expired."""
+        self._txn(lambda cur: cur.execute(
+            "UPDATE events SET weight = weight + ? WHERE id = ? AND bucket = ?",
+            (weight, event_id, bucket)))
+
+    def pause(self, bucket: str, seconds: float) -> None:
+        """Admit nothing on *bucket* (in any process) for *seconds*."""
+        until = time.time() + seconds
+        self._txn(lambda cur: cur.execute(
+            "INSERT INTO pauses (bucket, until) VALUES (?, ?) "
+            "ON CONFLICT(bucket) DO UPDATE SET until = MAX(until, excluded.until)",
+            (bucket, until)))
+
+    def predict_wait(self, bucket: str, capacity: int, window: float, weight: int) -> float:
+        """Seconds until *weight* fits if nothing else is reserved meanwhile (read‑only).
+
+        0 when the file is busy – the bucket itself still enforces the wait.
+        """
+        now = time.time()
+        try:
+            with self._read_mutex:
+                row = self._reader.execute("SELECT until FROM pauses WHERE bucket = ?",
+                                           (bucket,)).fetchone()
+                events = self._reader.execute(
+                    "SELECT ts, weight FROM events WHERE bucket = ? AND ts > ? ORDER BY ts",
+                    (bucket, now - window)).fetchall()
+        except sqlite3.OperationalError:
+            return 0.0
+        wait = max(0.0, row[0] - now) if row else 0.0
+        excess = sum(w for _, w in events) + weight - capacity
+        if excess <= 0 or not events:
+            return wait
+        freed = 0
+        for ts, w in events:
+            freed += w
+            if freed >= excess:
+                break
+        return max(wait, window - (now - ts))
+
+    def load(self, bucket: str, window: float) -> int:
+        """Units currently in *bucket*'s window, summed over all processes (last value when busy)."""
+        try:
+            with self._read_mutex:
+                row = self._reader.execute(
+                    "SELECT COALESCE(SUM(weight), 0) FROM events WHERE bucket = ? AND ts > ?",
+                    (bucket, time.time() - window)).fetchone()
+        except sqlite3.OperationalError:
+            return self._last_load.get(bucket, 0)
+        self._last_load[bucket] = int(row[0])
+        return self._last_load[bucket]
+
+
+@lru_cache
+def shared_state() -> Optional[SQLiteBucketState]:
+    """The process‑wide backend, or ``None`` when ``RATE_LIMIT_STATE`` is unset."""
+    path = os.getenv("RATE_LIMIT_STATE")
+    return SQLiteBucketState(path) if path else None
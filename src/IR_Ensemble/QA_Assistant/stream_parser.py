@@ -0,0 +1,163 @@
+"""
+stream_parser.py
+~~~~~~~~~~~~~~~~
+Incremental parser for a streamed `SEARCH_CONTRACT` answer.
+
+The model writes::
+
+    <cot> … </cot>
+    <answer>{"searches": [{"queries": [...], "master_query": "..."}, {...}]}</answer>
+
+`SearchStreamParser` is fed the output‑text deltas as they arrive and hands
+every ``{queries, master_query}`` object of the ``searches`` array to
+*on_search* the moment its closing brace is written – the first search can
+start while the model is still writing the second.
+
+Scanning starts at the ``<answer>`` after ``</cot>`` – the model often
+mentions the tag in its reasoning.  Every delta is searched / scanned once:
+only a bracket / string scanner runs per character, the text already past
+is dropped, and each complete object is ``json.loads``‑ed once.  Malformed objects are skipped (the caller still
+parses the full answer at the end and dispatches whatever was missed).
+
+Usage
+-----
+````python
+parser = SearchStreamParser(lambda call: tasks.append(asyncio.create_task(search(**search_kwargs(call)))),
+                            limit=2)
+resp = await gated_response(..., stream=parser)
+````
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+ANSWER_OPEN = "<answer>"
+COT_OPEN, COT_CLOSE = "<cot>", "</cot>"
+_TAG_TAIL = max(map(len, (ANSWER_OPEN, COT_OPEN, COT_CLOSE))) - 1
+
+
+class StreamSink(Protocol):
+    """What `gated_response(stream=…)` feeds: text deltas, reset on every attempt."""
+
+    def feed(self, delta: str) -> None: ...
+
+    def reset(self) -> None: ...
+
+
+def search_key(call: Dict[str, Any]) -> Tuple[Tuple[str, ...], str]:
+    """Identity of a search call, so one streamed and later re‑parsed is not run twice."""
+    return tuple(map(str, call.get("queries") or ())), str(call.get("master_query"))
+
+
+def search_kwargs(call: Dict[str, Any]) -> Dict[str, Any]:
+    """The `search` arguments of a call; any other key the model adds is dropped."""
+    return {"queries": call["queries"], "master_query": call["master_query"]}
+
+
+class SearchStreamParser:
+    """Emit each complete object of ``<answer>{"searches": [...]}`` as it streams in."""
+
+    def __init__(self, on_search: Callable[[Dict[str, Any]], None], *, limit: Optional[int] = None) -> None:
+        self.on_search = on_search
+        self.limit = limit
+        self.emitted: List[Dict[str, Any]] = []     # kept across attempts (see `reset`)
+        self._seen: set = set()
+        self.reset()
+
+    def reset(self) -> None:
+        """Start over on a new stream (a retried attempt); emitted calls stay emitted."""
+        self._text = ""                    # unscanned tail (and the object being read)
+        self._pos = 0                      # next char of _text to scan
+        self._in_cot = False               # inside <cot> … </cot>
+        self._started = False              # past "<answer>"
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._start: Optional[int] = None  # index of the "{" of the object being read
+
+    def feed(self, delta: str) -> None:
+        self._text += delta
+        if not self._started and not self._find_answer():
+            return
+        self._scan()
+
+    # ──────────────────────────────── internals ───────────────────────────────
+    def _find_answer(self) -> bool:
+        """Advance through the prose before ``<answer>``; True once scanning can start."""
+        text = self._text
+        while True:
+            if self._in_cot:
+                end = text.find(COT_CLOSE, self._pos)
+                if end < 0:
+                    break           # still reasoning
+                self._in_cot = False
+                self._pos = end + len(COT_CLOSE)
+                continue
+            cot = text.find(COT_OPEN, self._pos)
+            at = text.find(ANSWER_OPEN, self._pos)
+            if cot >= 0 and (at < 0 or cot < at):
+                self._in_cot = True
+                self._pos = cot + len(COT_OPEN)
+                continue
+            if at >= 0:
+                self._started = True
+                self._pos = at + len(ANSWER_OPEN)
+                return True
+            break
+        # Keep only what a tag split across deltas could still start with
+        self._trim(max(self._pos, len(text) - _TAG_TAIL))
+        return False
+
+    def _trim(self, cut: int) -> None:
+        """Drop ``_text[:cut]`` so each delta is only searched / scanned once."""
+        if cut <= 0:
+            return
+        self._text = self._text[cut:]
+        self._pos = max(self._pos - cut, 0)
+        if self._start is not None:
+            self._start -= cut
+
+    def _scan(self) -> None:
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                # an object directly inside the top‑level object's array
+                if ch == "{" and self._stack == ["{", "["]:
+                    self._start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._stack == ["{", "["] and self._start is not None:
+                    self._emit(text[self._start:i + 1])
+                    self._start = None
+        self._pos = len(text)
+        self._trim(self._pos if self._start is None else self._start)
+
+    def _emit(self, raw: str) -> None:
+        if self.limit is not None and len(self.emitted) >= self.limit:
+            return
+        try:
+            call = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(call, dict) or "queries" not in call or "master_query" not in call:
+            return
+        key = search_key(call)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self.emitted.append(call)
+        self.on_search(call)
@@ -0,0 +1,120 @@
+"""
+telemetry.py
+~~~~~~~~~~~~
+Append‑only long‑format telemetry sink + a pivot reader.
+
+Every poll of `BucketMonitor` becomes one JSON line per bucket::
+
+    {"ts": 1718000000.0, "bucket": "gpt-4.1@host:tok", "load": 1234, "capacity": 50000}
+
+New buckets (deployments, agents …) are just new ``bucket`` values, so the
+file is never rewritten and the cost of a poll does not depend on how many
+buckets have come and gone.  Rows are buffered in memory and written in
+batches through one open file handle.
+
+Reader
+------
+    python -m src.IR_Ensemble.QA_Assistant.telemetry DerivedData/bucket_usage.jsonl \\
+        --value remaining --out bucket_usage.csv
+
+pivots the long rows back into one wide row per timestamp.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FLUSH_ROWS: int = 512      # buffered rows before a write
+
+
+class JsonlSink:
+    """Buffered append‑only JSONL writer (one open handle for the whole run)."""
+
+    def __init__(self, path: str | os.PathLike[str], *, overwrite: bool = False,
+                 flush_rows: int = FLUSH_ROWS) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "w" if overwrite else "a", encoding="utf-8")
+        self._buffer: List[str] = []
+        self._flush_rows = flush_rows
+
+    def write(self, rows: Iterable[Dict[str, Any]]) -> bool:
+        """Buffer *rows*; returns True once the buffer is due for a flush."""
+        self._buffer.extend(json.dumps(row, separators=(",", ":")) + "\n" for row in rows)
+        return len(self._buffer) >= self._flush_rows
+
+    def _drain(self) -> None:
+        chunk, self._buffer = "".join(self._buffer), []
+        if chunk:
+            self._fh.write(chunk)
+            self._fh.flush()
+
+    async def flush(self) -> None:
+        """Write the buffered rows in a worker thread."""
+        if self._buffer:
+            await asyncio.to_thread(self._drain)
+
+    async def close(self) -> None:
+        await self.flush()
+        self._fh.close()
+
+
+# ───────────────────────────────────────── reader ─────────────────────────────
+
+def read_rows(path: str | os.PathLike[str]) -> Iterator[Dict[str, Any]]:
+    """Yield the long rows of a telemetry file (a torn last line is skipped)."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _value(row: Dict[str, Any], value: str) -> Any:
+    if value == "remaining":
+        return max(0, row["capacity"] - row["load"])
+    if value == "util":
+        return round(row["load"] / row["capacity"], 4) if row["capacity"] else ""
+    return row.get(value, "")
+
+
+def pivot(rows: Iterable[Dict[str, Any]], value: str = "load") -> Tuple[List[str], List[List[Any]]]:
+    """Long rows → (header, wide rows): one row per timestamp, one column per bucket."""
+    table: Dict[float, Dict[str, Any]] = {}
+    buckets: Dict[str, None] = {}
+    for row in rows:
+        buckets.setdefault(row["bucket"], None)
+        table.setdefault(row["ts"], {})[row["bucket"]] = _value(row, value)
+    columns = sorted(buckets)
+    wide = [[ts] + [cells.get(b, "") for b in columns] for ts, cells in sorted(table.items())]
+    return ["ts"] + columns, wide
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Pivot long‑format bucket telemetry to a wide CSV.")
+    ap.add_argument("path", help="telemetry JSONL written by BucketMonitor")
+    ap.add_argument("--value", default="load",
+                    help="load | capacity | remaining | util | any extra field (default: load)")
+    ap.add_argument("--out", help="CSV output path (default: stdout)")
+    args = ap.parse_args(argv)
+
+    header, wide = pivot(read_rows(args.path), args.value)
+    out = open(args.out, "w", newline="", encoding="utf-8") if args.out else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(header)
+        writer.writerows(wide)
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
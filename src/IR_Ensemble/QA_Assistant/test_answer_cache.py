@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent answer cache.
+
+* `cache_key` – question + document context, or question within a topic
+* `AnswerCache.get` – exact hits, topic scoping and near‑duplicates
+* `AnswerCache.put` – the JSONL store and reloading it
+
+Run with ``python -m pytest src/IR_Ensemble/QA_Assistant/test_answer_cache.py``.
+"""
+
+import asyncio
+import json
+
+from src.IR_Ensemble.QA_Assistant.answer_cache import AnswerCache, cache_key, question_context
+
+
+def _item(question, context="", text="answer", *cited):
+    return {"question": question, "context": context,
+            "answer": {"text": text, "citations": [{"summary": "s", "citation": c} for c in cited]}}
+
+
+def _cache(tmp_path, *entries, **kwargs):
+    cache = AnswerCache(str(tmp_path / "cache" / "answers.jsonl"), **kwargs)
+    for item, topic in entries:
+        asyncio.run(cache.put(item, topic=topic))
+    return cache
+
+
+# ───────────────────────────────────────── keys ───────────────────────────────
+
+def test_key_normalises_and_scopes_context_free_questions():
+    assert cache_key("What is FEMA?", "Doc  A") == cache_key("what is fema", "doc a")
+    assert cache_key("What is FEMA?", "doc a", topic="t1") == cache_key("What is FEMA?", "doc a", topic="t2")
+    assert cache_key("What is FEMA?", topic="t1") != cache_key("What is FEMA?", topic="t2")
+    assert cache_key("What is FEMA?", topic="t1") != cache_key("What is FEMA?", "t1")
+    assert question_context({"context": "new", "doc_context": "old"}) == "new"
+    assert question_context({"doc_context": "old"}) == "old" and question_context({}) == ""
+
+
+# ───────────────────────────────────────── lookup ─────────────────────────────
+
+def test_exact_hit_with_context_holds_across_topics(tmp_path):
+    cache = _cache(tmp_path, (_item("Who funded the rebuild?", "Lahaina grants", "FEMA", "m1"), "t1"))
+    entry = cache.get("who funded the rebuild", "Lahaina grants", topic="t2")
+    assert entry["answer"]["text"] == "FEMA" and entry["segment_ids"] == ["m1"]
+    assert cache.get("Who funded the rebuild?", "another document", topic="t2") is None
+    assert cache.stats() == (1, 1)
+
+
+def test_context_free_question_is_not_served_across_topics(tmp_path):
+    cache = _cache(tmp_path, (_item("When did the fire start?"), "t1"))
+    assert cache.get("When did the fire start?", topic="t1") is not None
+    assert cache.get("When did the fire start?", topic="t2") is None
+    assert cache.get("When did the fire start?") is None              # no topic, no context: no match
+
+
+def test_near_duplicates_only_within_the_topic(tmp_path):
+    cache = _cache(tmp_path,
+                   (_item("What health effects does wildfire smoke have on Maui residents?", text="lungs"), "t1"),
+                   (_item("How much FEMA funding did Lahaina receive?", text="millions"), "t1"))
+    paraphrase = "What health effects does wildfire smoke have on residents of Maui?"
+    assert cache.get(paraphrase, topic="t1")["answer"]["text"] == "lungs"
+    assert cache.get(paraphrase, topic="t2") is None
+    assert cache.get("What health effects does the Maui fire have?", topic="t1") is None   # too far
+    loose = _cache(tmp_path, threshold=0.3)                               # reloads the same file
+    assert loose.get("What health effects does the Maui fire have?", topic="t1")["answer"]["text"] == "lungs"
+
+
+# ───────────────────────────────────────── store ──────────────────────────────
+
+def test_put_appends_and_a_new_cache_reloads(tmp_path):
+    cache = _cache(tmp_path, (_item("Q1?", "ctx", "old"), "t1"), (_item("Q1?", "ctx", "new"), "t1"),
+                   ({"question": "", "answer": {}}, "t1"))                 # nothing to key on: skipped
+    assert len(cache) == 1
+    path = tmp_path / "cache" / "answers.jsonl"
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(r["doc_context"], r["answer"]["text"]) for r in rows] == [("ctx", "old"), ("ctx", "new")]
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"question": "torn')                                      # interrupted run
+    reloaded = AnswerCache(str(path))
+    assert len(reloaded) == 1
+    assert reloaded.get("Q1", "ctx")["answer"]["text"] == "new"          # later entry wins
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Tests for the pure parsing / merging helpers of the QA loop.
+
+* `SearchStreamParser` – incremental ``<answer>{"searches": [...]}`` parsing
+* `BaseAgent._apply_patch` – keyed UPDATE upserts merged into the answer
+* `question_triage` – paraphrase merging and fan‑out of finished answers
+* `BaseAgent._track_convergence` – stale UPDATE rounds that end the loop early
+
+Run with ``python -m pytest src/IR_Ensemble/QA_Assistant/test_answer_parsing.py``.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.IR_Ensemble.QA_Assistant import base
+from src.IR_Ensemble.QA_Assistant.base import BaseAgent, QAStatus
+from src.IR_Ensemble.QA_Assistant.question_triage import merge_duplicates, related_batches
+from src.IR_Ensemble.QA_Assistant.stream_parser import SearchStreamParser, search_kwargs
+
+
+# ───────────────────────────────────────── stream parser ──────────────────────
+
+def _answer(*searches):
+    return "<answer>" + json.dumps({"searches": list(searches)}) + "</answer>"
+
+
+S1 = {"queries": ["wildfire smoke", "maui air"], "master_query": "wildfire smoke health"}
+S2 = {"queries": ["fema {lahaina}"], "master_query": "funding \"}]\" for lahaina"}
+
+
+def _feed(parser, text, step=3):
+    for i in range(0, len(text), step):
+        parser.feed(text[i:i + step])
+
+
+def test_parser_emits_each_search_as_it_closes():
+    got = []
+    parser = SearchStreamParser(got.append)
+    text = "<cot>ok</cot>" + _answer(S1, S2)
+    first_close = text.index("}") + 1
+    _feed(parser, text[:first_close])
+    assert got == [S1]
+    _feed(parser, text[first_close:])
+    assert got == [S1, S2]
+
+
+def test_parser_ignores_answer_tag_inside_cot():
+    got = []
+    parser = SearchStreamParser(got.append)
+    example = {"queries": ["example"], "master_query": "example"}
+    cot = "<cot>I will answer like " + _answer(example) + " – valid JSON</cot>"
+    _feed(parser, cot + _answer(S1))
+    assert got == [S1]
+
+
+def test_parser_braces_inside_strings():
+    got = []
+    parser = SearchStreamParser(got.append)
+    _feed(parser, "<cot>ok</cot>" + _answer(S2, S1), step=1)
+    assert got == [S2, S1]
+
+
+def test_parser_reset_refeeds_without_duplicates():
+    got = []
+    parser = SearchStreamParser(got.append)
+    text = "<cot>ok</cot>" + _answer(S1, S2)
+    _feed(parser, text[: text.index("}") + 1])     # attempt 1 dies after the first search
+    parser.reset()
+    _feed(parser, text)                             # attempt 2 streams everything again
+    assert got == [S1, S2]
+    assert parser.emitted == [S1, S2]
+
+
+def test_parser_limit():
+    got = []
+    parser = SearchStreamParser(got.append, limit=1)
+    _feed(parser, "<cot>ok</cot>" + _answer(S1, S2))
+    assert got == [S1]
+
+
+def test_parser_extra_keys_reach_search_as_its_arguments_only():
+    got = []
+    parser = SearchStreamParser(got.append)
+    extra = {**S1, "rationale": "smoke {and} health"}
+    _feed(parser, "<cot>ok</cot>" + _answer(extra, S2))
+    assert got == [extra, S2]
+    assert search_kwargs(got[0]) == S1
+
+
+def test_parser_tags_split_across_deltas():
+    got = []
+    parser = SearchStreamParser(got.append)
+    text = "<cot>" + "thinking " * 500 + "</cot>" + _answer(S1, S2)
+    _feed(parser, text, step=2)
+    assert got == [S1, S2]
+    assert len(parser._text) < 10                  # nothing already scanned is kept
+
+
+# ───────────────────────────────────────── UPDATE patches ─────────────────────
+
+QUESTIONS = "\n".join([
+    json.dumps({"question": "A?", "doc_context": "ctx a"}),
+    json.dumps({"question": "B?", "doc_context": ""}),
+    "plain C?",
+])
+
+
+def _answer_state():
+    return SimpleNamespace(answer_items=BaseAgent._seed_answer(QUESTIONS), answer_rounds=[])
+
+
+def _patch(state, payload):
+    BaseAgent._apply_patch(state, json.dumps(payload))
+
+
+def test_seed_assigns_ids():
+    items = BaseAgent._seed_answer(QUESTIONS)
+    assert list(items) == ["q1", "q2", "q3"]
+    assert items["q1"]["doc_context"] == "ctx a"
+    assert items["q3"]["question"] == "plain C?"
+    assert items["q3"]["answer"] == {"text": "", "citations": []}
+
+
+def test_upsert_by_id_and_by_question_text():
+    state = _answer_state()
+    _patch(state, {"upserts": [
+        {"id": "q1", "answer": {"text": "a1", "citations": []}},
+        {"question": "plain C?", "finished": True},
+    ], "round": {"summary": "r1", "seen_ids": ["m1"]}})
+    assert state.answer_items["q1"]["answer"]["text"] == "a1"
+    assert state.answer_items["q3"]["finished"] is True
+    assert state.answer_items["q2"]["answer"]["text"] == ""     # untouched
+    assert state.answer_rounds == [{"summary": "r1", "seen_ids": ["m1"]}]
+
+
+def test_unknown_ids_are_ignored():
+    state = _answer_state()
+    _patch(state, {"upserts": [{"id": "q9", "answer": {"text": "x"}}, "junk"]})
+    assert all(item["answer"]["text"] == "" for item in state.answer_items.values())
+
+
+def test_citations_are_appended_and_deduplicated():
+    state = _answer_state()
+    _patch(state, {"upserts": [{"id": "q1", "answer": {"text": "a1", "citations": [
+        {"summary": "s1", "citation": "m1"}]}}]})
+    _patch(state, {"upserts": [{"id": "q1", "answer": {"text": "a2", "citations": [
+        {"summary": "again", "citation": "m1"}, {"summary": "s2", "citation": "m2"}]}}]})
+    answer = state.answer_items["q1"]["answer"]
+    assert answer["text"] == "a2"
+    assert [c["citation"] for c in answer["citations"]] == ["m1", "m2"]
+    assert answer["citations"][0]["summary"] == "s1"
+
+
+def test_legacy_full_rewrite_is_an_upsert_of_every_question():
+    state = _answer_state()
+    _patch(state, {"questions": [
+        {"question": "A?", "answer": {"text": "full a", "citations": []}, "finished": False},
+        {"question": "B?", "answer": {"text": "full b", "citations": []}, "finished": True},
+    ], "rounds": [{"summary": "old", "seen_ids": []}]})
+    assert state.answer_items["q1"]["answer"]["text"] == "full a"
+    assert state.answer_items["q2"]["finished"] is True
+    assert state.answer_rounds == [{"summary": "old", "seen_ids": []}]
+
+
+def test_truncated_patch_raises():
+    state = _answer_state()
+    with pytest.raises(json.JSONDecodeError):
+        BaseAgent._apply_patch(state, '{"upserts": [{"id": "q1", "answer": {"text": "cut')
+
+
+# ───────────────────────────────────────── triage / fan‑out ───────────────────
+
+PARAPHRASES = [
+    {"question": "What health effects does wildfire smoke have on Maui residents?", "doc_context": "d1"},
+    {"question": "How much FEMA funding did Lahaina receive?", "doc_context": ""},
+    {"question": "What are the health effects of wildfire smoke on residents of Maui?", "doc_context": "d2"},
+    {"question": "When did the FEMA disaster declaration for Lahaina happen?", "doc_context": ""},
+    {"question": "What respiratory illnesses are linked to wildfire smoke?", "doc_context": ""},
+]
+
+
+def test_merge_duplicates_keeps_first_and_collects_paraphrases():
+    items = merge_duplicates(PARAPHRASES)
+    assert [i["question"] for i in items] == [PARAPHRASES[k]["question"] for k in (0, 1, 3, 4)]
+    assert items[0]["duplicates"] == [PARAPHRASES[2]]
+    assert "duplicates" not in items[1]
+    assert "duplicates" not in PARAPHRASES[0]                   # input untouched
+
+
+def test_related_batches_group_similar_questions():
+    items = merge_duplicates(PARAPHRASES)
+    batches = related_batches(items, 2)
+    questions = [[i["question"] for i in batch] for batch in batches]
+    assert questions == [
+        [items[0]["question"], items[3]["question"]],           # wildfire smoke
+        [items[1]["question"], items[2]["question"]],           # FEMA / Lahaina
+    ]
+    assert sum(len(b) for b in batches) == len(items)
+
+
+def _agent(questions):
+    """A `BaseAgent` with just the state `_update_status` touches (no files, no client)."""
+    agent = object.__new__(BaseAgent)
+    agent.num = 0
+    agent.answer_items = BaseAgent._seed_answer("\n".join(json.dumps(q) for q in questions))
+    agent.answer_rounds = []
+    agent.finished_items = []
+    agent.full_answer = None
+    agent.status = QAStatus.NO_ANSWER
+    agent.new_segments = 1
+    agent.stale_rounds = 0
+    agent._answer_snapshot = None
+    return agent
+
+
+def test_finished_answer_fans_out_to_duplicates(monkeypatch):
+    monkeypatch.delenv("ANSWER_CACHE_PATH", raising=False)
+    agent = _agent(merge_duplicates(PARAPHRASES[:3]))
+    patch = {"upserts": [{"id": "q1", "answer": {"text": "smoke harms lungs", "citations": [
+        {"summary": "s", "citation": "m1"}]}, "finished": True}]}
+    asyncio.run(agent._update_status(patch=json.dumps(patch)))
+
+    assert [item["question"] for item in agent.finished_items] == [
+        PARAPHRASES[0]["question"], PARAPHRASES[2]["question"]]
+    assert [item["doc_context"] for item in agent.finished_items] == ["d1", "d2"]
+    for item in agent.finished_items:
+        assert item["answer"]["text"] == "smoke harms lungs"
+        assert "id" not in item and "duplicates" not in item
+    assert list(agent.answer_items) == ["q2"]                  # only the FEMA question left
+    assert agent.status == QAStatus.PARTIAL
+    assert "duplicates" not in agent.full_answer
+
+
+def test_failed_cache_write_keeps_the_patch(monkeypatch):
+    class _BrokenCache:
+        async def put(self, item, *, topic=None):
+            raise OSError("disk full")
+
+    async def _log(msg, **_):
+        logged.append(msg)
+
+    logged = []
+    monkeypatch.setattr(base, "answer_cache", lambda: _BrokenCache())
+    agent = _agent(PARAPHRASES[:2])
+    agent._log = _log
+    patch = {"upserts": [{"id": "q1", "answer": {"text": "done", "citations": []}, "finished": True}]}
+    asyncio.run(agent._update_status(patch=json.dumps(patch)))
+
+    assert [item["question"] for item in agent.finished_items] == [PARAPHRASES[0]["question"]]
+    assert list(agent.answer_items) == ["q2"]
+    assert agent.status == QAStatus.PARTIAL
+    assert not any("UNREADABLE" in msg for msg in logged)
+    assert any("CACHE WRITE FAILED" in msg for msg in logged)
+
+
+# ───────────────────────────────────────── convergence ────────────────────────
+
+def _payload(text, *cited, finished=False):
+    return [{"question": "A?", "finished": finished,
+             "answer": {"text": text, "citations": [{"citation": c} for c in cited]}}]
+
+
+def _round(agent, payload, new_segments=1):
+    agent.new_segments = new_segments
+    agent._track_convergence(payload)
+    return agent.converged
+
+
+def test_a_round_that_changes_nothing_is_stale():
+    agent = _agent([])
+    assert not _round(agent, _payload("smoke harms lungs", "m1"))      # first round sets the baseline
+    assert not _round(agent, _payload("smoke harms lungs and hearts", "m1", "m2"))   # new citation
+    assert _round(agent, _payload("smoke harms lungs and hearts.", "m2", "m1"))       # reworded only
+    assert agent.stale_rounds == 1
+
+
+def test_no_new_evidence_is_stale_even_if_the_text_moved():
+    agent = _agent([])
+    _round(agent, _payload("first draft"))
+    assert _round(agent, _payload("a completely different answer", "m9"), new_segments=0)
+
+
+def test_progress_resets_the_count_and_zero_rounds_disables():
+    agent = _agent([])
+    agent.CONVERGE_ROUNDS = 2
+    for text in ("same", "same", "same"):
+        _round(agent, _payload(text))
+    assert agent.stale_rounds == 2 and agent.converged
+    assert not _round(agent, _payload("same", finished=True))          # a finished question is progress
+    assert agent.stale_rounds == 0
+    agent.CONVERGE_ROUNDS = 0
+    agent.stale_rounds = 5
+    assert not agent.converged
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Tests for the observation side of the pipeline.
+
+* `telemetry` / `BucketMonitor` – append‑only long rows and the pivot reader
+* `call_metrics` – fixed‑bound histograms, cumulative and rolling
+* `metrics_server` – the Prometheus text rendering and ``GET /metrics``
+
+Run with ``python -m pytest src/IR_Ensemble/QA_Assistant/test_metrics.py``.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from src.IR_Ensemble.QA_Assistant import call_metrics as metrics_module, rate_limits
+from src.IR_Ensemble.QA_Assistant.bucket_monitor import BucketMonitor
+from src.IR_Ensemble.QA_Assistant.bucket_pool import AssistantBucketPool
+from src.IR_Ensemble.QA_Assistant.call_metrics import (SLOT_SEC, SLOTS, CallMetrics, RollingHistogram,
+                                                       record_call)
+from src.IR_Ensemble.QA_Assistant.metrics_server import MetricsServer, render
+from src.IR_Ensemble.QA_Assistant.quotas import QuotaRegistry
+from src.IR_Ensemble.QA_Assistant.telemetry import JsonlSink, pivot, read_rows
+from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
+
+
+# ───────────────────────────────────────── telemetry ──────────────────────────
+
+def test_sink_buffers_and_appends(tmp_path):
+    path = tmp_path / "out" / "usage.jsonl"
+
+    async def run(rows, **kwargs):
+        sink = JsonlSink(path, flush_rows=2, **kwargs)
+        due = [sink.write([row]) for row in rows]
+        await sink.close()
+        return due
+
+    assert asyncio.run(run([{"a": 1}, {"a": 2}, {"a": 3}])) == [False, True, True]
+    asyncio.run(run([{"a": 4}]))                                  # a later run appends
+    assert [row["a"] for row in read_rows(path)] == [1, 2, 3, 4]
+    asyncio.run(run([{"a": 5}], overwrite=True))
+    assert [row["a"] for row in read_rows(path)] == [5]
+
+
+def test_read_rows_skips_a_torn_line(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    path.write_text('{"ts": 1, "bucket": "a", "load": 1, "capacity": 2}\n{"ts": 2, "buck', encoding="utf-8")
+    assert len(list(read_rows(path))) == 1
+
+
+def test_pivot_long_rows_to_one_column_per_bucket():
+    rows = [
+        {"ts": 1, "bucket": "gpt:tok", "load": 400, "capacity": 1_000},
+        {"ts": 2, "bucket": "gpt:tok", "load": 900, "capacity": 1_000},
+        {"ts": 2, "bucket": "agent", "load": 5, "capacity": 0},   # appears later
+    ]
+    assert pivot(rows) == (["ts", "agent", "gpt:tok"], [[1, "", 400], [2, 5, 900]])
+    assert pivot(rows, "remaining")[1] == [[1, "", 600], [2, 0, 100]]
+    assert pivot(rows, "util")[1] == [[1, "", 0.4], [2, "", 0.9]]
+
+
+def test_bucket_monitor_writes_long_rows_and_events(tmp_path, monkeypatch):
+    monkeypatch.delenv("BUCKET_MONITOR_OUT", raising=False)
+
+    async def run():
+        registry = QuotaRegistry({}, default={"rpm": 10, "tpm": 1_000})
+        req, tok = registry.buckets("https://aoai.test", "gpt-4.1")
+        pool = AssistantBucketPool(500, 60)
+        metrics = CallMetrics()
+        await tok.reserve(250)
+        await pool.bucket("agent").reserve(100)
+        monitor = BucketMonitor(quotas=registry, assistant_buckets=pool, cohere=AsyncTokenBucket(20),
+                                metrics=metrics, interval=60, path=tmp_path / "usage.jsonl",
+                                hist_path=tmp_path / "hist.jsonl", events_path=tmp_path / "events.jsonl")
+        await monitor.start()
+        metrics.observe("queue_wait_s", 2.0, stage="UPDATE_CALL")
+        await asyncio.sleep(0)
+        await monitor.stop()
+
+    asyncio.run(run())
+    rows = {row["bucket"]: row for row in read_rows(tmp_path / "usage.jsonl")}
+    assert set(rows) == {"Cohere", "gpt-4.1@aoai.test:req", "gpt-4.1@aoai.test:tok", "Assistants"}
+    assert rows["gpt-4.1@aoai.test:tok"]["load"] == 250
+    assert rows["Assistants"] == {**rows["Assistants"], "load": 100, "capacity": 500, "live": 1}
+    events = list(read_rows(tmp_path / "events.jsonl"))
+    assert [(e["metric"], e["value"], e["stage"]) for e in events] == [("queue_wait_s", 2.0, "UPDATE_CALL")]
+    hist = [json.loads(line) for line in (tmp_path / "hist.jsonl").read_text().splitlines()]
+    assert hist[0]["metric"] == "queue_wait_s" and hist[0]["count"] == 1
+
+
+# ───────────────────────────────────────── histograms ─────────────────────────
+
+def test_histogram_bins_and_interpolated_quantiles():
+    hist = RollingHistogram((1, 2, 4))
+    for value in (0.5, 1.5, 1.5, 3, 10):
+        hist.observe(value)
+    assert hist.counts == [1, 2, 1, 1] and hist.n == 5 and hist.total == 16.5
+    assert hist.quantile(0.2) == 1.0                               # top of the first bin
+    assert hist.quantile(0.5) == pytest.approx(1.75)               # inside (1, 2]
+    assert hist.quantile(1.0) == 4                                 # +Inf bin reports the last bound
+    assert RollingHistogram((1,)).quantile(0.5) == 0.0
+
+
+def test_rolling_view_forgets_old_slots(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(metrics_module.time, "monotonic", lambda: now[0])
+    hist = RollingHistogram((1, 10))
+    hist.observe(5)
+    now[0] = SLOT_SEC * (SLOTS - 1)
+    hist.observe(0.5)
+    assert hist.rolling()[1:] == (5.5, 2)
+    now[0] = SLOT_SEC * SLOTS                                      # the first slot ages out
+    assert hist.rolling() == ([1, 0, 0], 0.5, 1)
+    assert hist.n == 2                                             # cumulative view keeps both
+
+
+def test_series_are_keyed_by_metric_and_tags():
+    metrics = CallMetrics()
+    metrics.observe("queue_wait_s", 1.0, stage="SEARCH_CALL", topic=None)
+    metrics.observe("queue_wait_s", 3.0, stage="SEARCH_CALL")
+    metrics.observe("queue_wait_s", 2.0, stage="UPDATE_CALL", topic=4)
+    metrics.observe("queue_wait_s", None, stage="UPDATE_CALL")    # nothing to record
+    metrics.add("agents_active", 2, topic=4)
+    metrics.add("agents_active", -1, topic=4)
+    rows = {(r["stage"], r.get("topic")): r for r in metrics.snapshot()}
+    assert rows[("SEARCH_CALL", None)]["count"] == 2 and rows[("SEARCH_CALL", None)]["sum"] == 4.0
+    assert rows[("UPDATE_CALL", "4")]["count"] == 1
+    assert metrics.values() == [("agents_active", {"topic": "4"}, 1)]
+
+
+def test_record_call_splits_reservation_outcomes(monkeypatch):
+    metrics = CallMetrics()
+    monkeypatch.setattr(metrics_module, "call_metrics", metrics)
+    record_call(reserved=1_000, used=600, output=200, cached=128, stage="UPDATE_CALL")
+    record_call(reserved=1_000, used=1_300, stage="UPDATE_CALL")
+    record_call(reserved=500, used=None, stage="UPDATE_CALL")     # failed attempt
+    totals = {metric: (hist.n, hist.total) for metric, _, hist in metrics.series()}
+    assert totals == {
+        "reserved_tokens": (3, 2_500),
+        "output_tokens": (1, 200),
+        "cached_tokens": (1, 128),
+        "used_tokens": (2, 1_900),
+        "refunded_tokens": (3, 400 + 0 + 500),
+        "overrun_tokens": (1, 300),
+    }
+
+
+# ───────────────────────────────────────── /metrics ───────────────────────────
+
+@pytest.fixture
+def fresh_buckets(monkeypatch):
+    registry = QuotaRegistry({}, default={"rpm": 10, "tpm": 1_000})
+    registry.buckets("https://aoai.test", "gpt-4.1")
+    monkeypatch.setattr(rate_limits, "quota_registry", registry)
+    monkeypatch.setattr(rate_limits, "assistant_tok_limiters", AssistantBucketPool(500, 60))
+    monkeypatch.setattr(rate_limits, "cohere_bucket", [AsyncTokenBucket(20), "key"])
+    return registry
+
+
+def _families(text):
+    return [line.split()[2] for line in text.splitlines() if line.startswith("# TYPE")]
+
+
+def test_render_prometheus_text(fresh_buckets):
+    metrics = CallMetrics()
+    metrics.add("throttled", bucket='gpt "mini"')
+    metrics.add("agents_active", 3, topic=1)
+    metrics.observe("queue_wait_s", 0.3, stage="SEARCH_CALL")
+    metrics.observe("queue_wait_s", 7.0, stage="SEARCH_CALL")
+    metrics.observe("queue_wait_s", 1.0, stage="UPDATE_CALL")
+    text = render(metrics)
+    lines = text.splitlines()
+
+    families = _families(text)
+    assert len(families) == len(set(families))                     # one TYPE line per family
+    assert 'ir_bucket_capacity{bucket="gpt-4.1@aoai.test:tok"} 1000' in lines
+    assert 'ir_throttled_total{bucket="gpt \\"mini\\""} 1' in lines
+    assert 'ir_agents_active{topic="1"} 3' in lines
+    assert "# TYPE ir_queue_wait_s histogram" in lines
+    assert 'ir_queue_wait_s_bucket{le="0.5",stage="SEARCH_CALL"} 1' in lines
+    assert 'ir_queue_wait_s_bucket{le="+Inf",stage="SEARCH_CALL"} 2' in lines
+    assert 'ir_queue_wait_s_count{stage="UPDATE_CALL"} 1' in lines
+    # a family's samples are contiguous, as the text format requires
+    hist = [i for i, line in enumerate(lines) if line.startswith("ir_queue_wait_s")]
+    assert hist == list(range(hist[0], hist[0] + len(hist)))
+
+
+def test_server_answers_metrics_and_404(fresh_buckets):
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response.decode()
+
+    async def run():
+        metrics = CallMetrics()
+        metrics.add("topics_completed")
+        server = MetricsServer(0, metrics=metrics)
+        await server.start()
+        port = server._server.sockets[0].getsockname()[1]
+        try:
+            return await get(port, "/metrics?x=1"), await get(port, "/other")
+        finally:
+            await server.stop()
+
+    ok, missing = asyncio.run(run())
+    assert ok.startswith("HTTP/1.1 200 OK") and "ir_topics_completed_total 1" in ok
+    assert missing.startswith("HTTP/1.1 404")
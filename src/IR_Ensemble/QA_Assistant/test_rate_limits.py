@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Tests for the deterministic parts of the rate‑limit stack.
+
+* `OutputTokenEstimator` – output reservations learned per (stage, model)
+* `AsyncTokenBucket` – reservations, refunds and overrun charges by event id
+* `QuotaRegistry` – one request / token bucket pair per (endpoint, deployment)
+* `AdaptiveLimit` – capacities following rate‑limit headers and 429s
+* `retry` – backoff, what counts as sent, and the retry loop
+* `SQLiteBucketState` – one sliding window shared by several processes
+* `AssistantBucketPool` – released assistants' buckets evicted once drained
+* `admission` – predicted waits and deadline‑bounded reservations
+
+Run with ``python -m pytest src/IR_Ensemble/QA_Assistant/test_rate_limits.py``.
+"""
+
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from src.IR_Ensemble.QA_Assistant import rate_limits, retry, token_bucket
+from src.IR_Ensemble.QA_Assistant.adaptive_limits import ALPHA, DECREASE, AdaptiveLimit, retry_after_seconds
+from src.IR_Ensemble.QA_Assistant.admission import AdmissionRejected, admit, resolve_deadline
+from src.IR_Ensemble.QA_Assistant.bucket_pool import AssistantBucketPool
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics
+from src.IR_Ensemble.QA_Assistant.quotas import QuotaRegistry
+from src.IR_Ensemble.QA_Assistant.shared_state import SQLiteBucketState
+from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
+from src.IR_Ensemble.QA_Assistant.usage_estimator import OutputTokenEstimator
+
+
+# ───────────────────────────────────────── output estimator ───────────────────
+
+def test_estimator_reserves_the_cap_until_warmed_up():
+    est = OutputTokenEstimator(min_samples=4)
+    for n in (100, 200, 300):
+        est.observe("UPDATE_CALL", "mini", n)
+    assert est.quantile("UPDATE_CALL", "mini") is None
+    assert est.reserve_for("UPDATE_CALL", "mini", 6_000) == 6_000
+
+
+def test_estimator_reserves_the_percentile_with_headroom():
+    est = OutputTokenEstimator(percentile=0.9, min_samples=10, headroom=1.1, min_reserve=1)
+    for n in range(100, 1100, 100):                       # 100 … 1000
+        est.observe("UPDATE_CALL", "mini", n)
+    est.observe("UPDATE_CALL", "mini", None)               # usage missing – ignored
+    assert est.quantile("UPDATE_CALL", "mini") == 900
+    assert est.reserve_for("UPDATE_CALL", "mini", 6_000) == 990
+    assert est.reserve_for("UPDATE_CALL", "mini", 500) == 500   # never past the cap
+    assert est.reserve_for("SEARCH_CALL", "mini", 3_000) == 3_000  # other stage: cold
+
+
+def test_estimator_floor_and_history():
+    est = OutputTokenEstimator(min_samples=2, history=3, min_reserve=256)
+    for n in (10, 10, 5_000, 5_000, 5_000):
+        est.observe("SELECT_CALL", "mini", n)
+    assert est.quantile("SELECT_CALL", "mini") == 5_000    # the 10s rolled out
+    est = OutputTokenEstimator(min_samples=2, min_reserve=256)
+    est.observe("SELECT_CALL", "mini", 10)
+    est.observe("SELECT_CALL", "mini", 12)
+    assert est.reserve_for("SELECT_CALL", "mini", 3_000) == 256
+
+
+# ───────────────────────────────────────── token bucket ───────────────────────
+
+def test_credit_and_debit_target_their_own_event():
+    async def run():
+        bucket = AsyncTokenBucket(10_000)
+        a = await bucket.reserve(3_000)
+        b = await bucket.reserve(2_000)
+        assert bucket.current_load() == 5_000
+        await bucket.credit_by_id(a, 1_200)                # surplus of call a
+        await bucket.debit_by_id(b, 500)                   # overrun of call b
+        assert bucket.current_load() == 5_000 - 1_200 + 500
+        await bucket.credit_by_id(b)                       # whole event back
+        assert bucket.current_load() == 1_800
+        await bucket.credit_by_id(a, 99_999)               # never more than reserved
+        assert bucket.current_load() == 0 and bucket.drained()
+        await bucket.credit_by_id("gone", 10)              # unknown / expired – no‑op
+        await bucket.debit_by_id("gone", 10)
+        assert bucket.current_load() == 0
+        assert bucket.reserved_total == 5_500 and bucket.refunded_total == 5_500
+
+    asyncio.run(run())
+
+
+# ───────────────────────────────────────── quotas ─────────────────────────────
+
+def test_quota_registry_buckets_per_deployment(monkeypatch):
+    monkeypatch.setenv("IR_ENDPOINT", "https://IR-Host.openai.azure.com/")
+    registry = QuotaRegistry({("IR_ENDPOINT", "gpt-4.1"): {"rpm": 50, "tpm": 50_000},
+                              ("IR_ENDPOINT", "gpt-4.1-mini"): {"rpm": 200, "tpm": 200_000}},
+                             default={"rpm": 5, "tpm": 500})
+    client = SimpleNamespace(base_url="https://ir-host.openai.azure.com/openai/")
+    req, tok = registry.for_client(client, "gpt-4.1")
+    assert (req.capacity, tok.capacity) == (50, 50_000)
+    assert registry.buckets("ir-host.openai.azure.com", "gpt-4.1") == (req, tok)
+    mini_req, mini_tok = registry.for_client(client, "gpt-4.1-mini")
+    assert (mini_req.capacity, mini_tok.capacity) == (200, 200_000)
+    assert mini_req is not req
+    other = registry.buckets("https://other-host/", "gpt-4.1")
+    assert (other[0].capacity, other[1].capacity) == (5, 500)   # undeclared → default
+    assert [label for label, _, _ in registry.items()] == [
+        "gpt-4.1@ir-host.openai.azure.com", "gpt-4.1-mini@ir-host.openai.azure.com", "gpt-4.1@other-host"]
+
+
+# ───────────────────────────────────────── adaptive limits ────────────────────
+
+def test_adaptive_limit_moves_toward_load_plus_remaining():
+    bucket = AsyncTokenBucket(100)
+    ctl = AdaptiveLimit(bucket, "requests")
+    ctl.observe({"x-ratelimit-remaining-requests": "150"})          # load 0 + 150
+    assert bucket.capacity == int((1 - ALPHA) * 100 + ALPHA * 150)
+    ctl.observe({"unrelated": "1"})                                  # no header – unchanged
+    assert bucket.capacity == 110
+
+
+def test_adaptive_limit_is_clamped_by_limit_header_and_floor():
+    bucket = AsyncTokenBucket(1_000)
+    ctl = AdaptiveLimit(bucket, "tokens")
+    for _ in range(50):
+        ctl.observe({"x-ratelimit-limit-tokens": "1200", "x-ratelimit-remaining-tokens": "90000"})
+    assert bucket.capacity == 1_200                                  # the real quota
+    for _ in range(50):
+        ctl.throttled(None)
+    assert bucket.capacity == ctl.floor == 250                       # FLOOR_FRAC of 1 000
+
+
+def test_throttled_shrinks_once_and_pauses():
+    bucket = AsyncTokenBucket(100)
+    AdaptiveLimit(bucket, "requests").throttled(30)
+    assert bucket.capacity == int(100 * DECREASE)
+    assert bucket.predict_wait(1) > 29                               # paused for retry‑after
+
+
+def test_retry_after_parsing():
+    assert retry_after_seconds({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+    assert retry_after_seconds({"retry-after": "4"}) == 4.0
+    assert retry_after_seconds({"retry-after": "soon"}) is None
+    assert retry_after_seconds(None) is None
+
+
+def test_cohere_429_is_backed_off_once(monkeypatch):
+    bucket = AsyncTokenBucket(100, name="cohere:test")
+    monkeypatch.setattr(rate_limits, "cohere_bucket", [bucket, "key"])
+    monkeypatch.setattr(rate_limits, "with_retries", lambda attempt, **_: attempt())
+
+    async def send(**_):
+        return httpx.Response(429, headers={"retry-after": "0"},
+                              request=httpx.Request("POST", "https://cohere.test/rerank"))
+
+    def throttled():
+        return sum(v for name, tags, v in call_metrics.values()
+                   if name == "throttled" and tags.get("bucket") == "cohere:test")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(rate_limits.gated_cohere_rerank_call(send, json={"model": "rerank"}))
+    assert bucket.capacity == int(100 * DECREASE)
+    assert throttled() == 1
+    assert bucket.current_load() == 1                                # the server counted it
+
+
+# ───────────────────────────────────────── retry ──────────────────────────────
+
+_REQUEST = httpx.Request("POST", "https://aoai.test/openai/responses")
+
+
+def _status_error(status, headers=None):
+    return httpx.HTTPStatusError("boom", request=_REQUEST,
+                                 response=httpx.Response(status, headers=headers, request=_REQUEST))
+
+
+def test_backoff_delay_is_jittered_capped_and_floored():
+    random.seed(7)
+    for attempt in range(8):
+        delay = retry.backoff_delay(attempt)
+        assert 0 <= delay <= min(retry.MAX_DELAY, retry.BASE_DELAY * 2 ** attempt)
+    assert retry.backoff_delay(0, _status_error(429, {"retry-after": "12"})) >= 12
+
+
+def test_reached_server():
+    assert retry.reached_server(_status_error(429))
+    assert retry.reached_server(_status_error(500))
+    assert retry.reached_server(httpx.ReadTimeout("slow", request=_REQUEST))
+    assert retry.reached_server(openai.APITimeoutError(request=_REQUEST))
+    assert retry.reached_server(asyncio.TimeoutError())
+    assert not retry.reached_server(httpx.ConnectTimeout("no route", request=_REQUEST))
+    assert not retry.reached_server(httpx.ConnectError("refused", request=_REQUEST))
+    assert not retry.reached_server(openai.APIConnectionError(request=_REQUEST))
+
+
+def test_with_retries_retries_transient_errors_only(monkeypatch):
+    async def no_sleep(_):
+        pass
+
+    monkeypatch.setattr(retry.asyncio, "sleep", no_sleep)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _status_error(503)
+        return "ok"
+
+    assert asyncio.run(retry.with_retries(flaky)) == "ok" and len(calls) == 3
+
+    calls.clear()
+
+    async def bad_request():
+        calls.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(retry.with_retries(bad_request))
+    assert len(calls) == 1
+
+    calls.clear()
+
+    async def throttled():
+        calls.append(1)
+        raise _status_error(429, {"retry-after": "60"})
+
+    with pytest.raises(httpx.HTTPStatusError):                 # retry would start past the deadline
+        asyncio.run(retry.with_retries(throttled, deadline=retry.time.monotonic() + 5))
+    assert len(calls) == 1
+
+
+class _FailingClient:
+    """Just enough of `AsyncAzureOpenAI` for `gated_response` to reach `create`."""
+
+    base_url = "https://aoai.test/openai/"
+
+    def __init__(self, exc):
+        self.responses = SimpleNamespace(with_raw_response=SimpleNamespace(create=self._create))
+        self._exc = exc
+
+    async def _create(self, **_):
+        raise self._exc
+
+
+@pytest.mark.parametrize("exc, slot_kept", [
+    (_status_error(500), True),                                   # the server counted it
+    (httpx.ConnectError("refused", request=_REQUEST), False),     # never left the box
+])
+def test_failed_attempt_refunds_tokens_and_only_unsent_slots(monkeypatch, exc, slot_kept):
+    registry = QuotaRegistry({})
+    pool = AssistantBucketPool(100_000, 60)
+    monkeypatch.setattr(rate_limits, "quota_registry", registry)
+    monkeypatch.setattr(rate_limits, "assistant_tok_limiters", pool)
+    monkeypatch.setattr(rate_limits, "with_retries", lambda attempt, **_: attempt())
+    client = _FailingClient(exc)
+
+    with pytest.raises(type(exc)):
+        asyncio.run(rate_limits.gated_response(assistant_id="a1", client=client, prompt="hi",
+                                               stage=rate_limits.LoopStage.SELECT_CALL,
+                                               prompt_tokens=1_000))
+    req, tok = registry.for_client(client, "gpt-4.1-mini")
+    assert req.current_load() == (1 if slot_kept else 0)
+    assert tok.current_load() == 0 and pool["a1"].current_load() == 0
+
+
+# ───────────────────────────────────────── shared state ───────────────────────
+
+def test_shared_state_splits_one_window_between_processes(tmp_path):
+    path = str(tmp_path / "state" / "rate_limits.sqlite")
+    one, two = SQLiteBucketState(path), SQLiteBucketState(path)   # two processes, one file
+    assert one.try_reserve("gpt:req", 3, 60, 2, "a") == 0
+    assert two.try_reserve("gpt:req", 3, 60, 1, "b") == 0
+    assert two.load("gpt:req", 60) == one.load("gpt:req", 60) == 3
+    assert 59 < one.try_reserve("gpt:req", 3, 60, 1, "c") <= 61   # full until "a" ages out
+    assert 59 < two.predict_wait("gpt:req", 3, 60, 1) <= 60
+    assert one.load("other", 60) == 0
+
+    two.credit("gpt:req", "a", 1)                                  # partial refund
+    assert one.load("gpt:req", 60) == 2
+    one.debit("gpt:req", "b", 4)
+    assert two.load("gpt:req", 60) == 6
+    one.credit("gpt:req", "b", None)
+    one.credit("gpt:req", "gone", None)                            # unknown id – no‑op
+    assert two.load("gpt:req", 60) == 1
+
+    one.pause("gpt:req", 30)
+    assert 29 < two.try_reserve("gpt:req", 3, 60, 1, "d") <= 30
+    assert 29 < two.predict_wait("gpt:req", 3, 60, 1) <= 30
+
+
+def test_named_bucket_uses_the_shared_window(tmp_path):
+    async def run():
+        state = SQLiteBucketState(str(tmp_path / "rate_limits.sqlite"))
+        mine, theirs = AsyncTokenBucket(10, name="tok"), AsyncTokenBucket(10, name="tok")
+        mine._shared = theirs._shared = state
+        event = await mine.reserve(7)
+        assert theirs.current_load() == 7
+        assert theirs.predict_wait(4) > 0 and theirs.predict_wait(3) == 0
+        await mine.credit_by_id(event, 5)
+        assert theirs.current_load() == 2
+        theirs.pause(10)                                            # written from a worker thread
+        await asyncio.gather(*token_bucket._background)
+        assert mine.predict_wait(1) > 9
+
+    asyncio.run(run())
+
+
+# ───────────────────────────────────────── bucket pool ────────────────────────
+
+def test_pool_evicts_released_buckets_once_drained():
+    async def run():
+        pool = AssistantBucketPool(1_000, 60)
+        busy, idle = pool.bucket("busy"), pool.bucket("idle")
+        assert pool.bucket("busy") is busy and len(pool) == 2
+        held = await busy.reserve(300)
+        await idle.credit_by_id(await idle.reserve(200))
+        assert pool.live_load() == 300
+
+        pool.release("idle")
+        pool.release("busy")                    # still in its window – kept
+        pool.release("never-created")
+        assert list(pool) == ["busy"]
+        assert pool.aggregate == {"evicted": 1, "reserved_total": 200,
+                                  "refunded_total": 200, "peak_load": 200}
+
+        await busy.credit_by_id(held, 100)
+        assert pool.sweep() == 0                # 200 units still in the window
+        await busy.credit_by_id(held)
+        assert pool.sweep() == 1 and len(pool) == 0
+        assert pool.aggregate["evicted"] == 2 and pool.aggregate["peak_load"] == 300
+        assert pool.aggregate["reserved_total"] == pool.aggregate["refunded_total"] == 500
+        assert pool.bucket("busy") is not busy  # a new agent with the same id starts fresh
+
+    asyncio.run(run())
+
+
+# ───────────────────────────────────────── admission ──────────────────────────
+
+def test_predict_wait_walks_the_window_oldest_first(monkeypatch):
+    now = [1_000.0]
+    monkeypatch.setattr(token_bucket.time, "monotonic", lambda: now[0])
+
+    async def run():
+        bucket = AsyncTokenBucket(10, window=60)
+        await bucket.reserve(4)                 # t = 1000, expires at 1060
+        now[0] = 1_010.0
+        await bucket.reserve(4)                 # t = 1010, expires at 1070
+        now[0] = 1_020.0
+        assert bucket.predict_wait(2) == 0
+        assert bucket.predict_wait(3) == 40     # the first event must age out
+        assert bucket.predict_wait(7) == 50     # … and the second
+        bucket.pause(45)
+        assert bucket.predict_wait(1) == 45
+        assert bucket.predict_wait(7) == 50
+
+    asyncio.run(run())
+
+
+def test_resolve_deadline_takes_the_earliest():
+    assert resolve_deadline() is None
+    assert resolve_deadline(123.0) == 123.0
+    start = time.monotonic()
+    relative = resolve_deadline(None, 5)
+    assert start + 5 <= relative <= time.monotonic() + 5
+    assert resolve_deadline(start + 1, 5) == start + 1
+
+
+def test_admit_rejects_what_cannot_start_in_time():
+    async def run():
+        full = AsyncTokenBucket(10, window=60, name="tok")
+        await full.reserve(10)
+        free = AsyncTokenBucket(10, window=60)
+        assert admit([(full, 1), (free, 1)], None) == 0.0           # no deadline – never sheds
+        assert admit([(free, 5)], time.monotonic() + 1) == 0.0
+        with pytest.raises(AdmissionRejected) as info:
+            admit([(free, 5), (full, 1)], time.monotonic() + 30, label="UPDATE_CALL")
+        assert info.value.label == "UPDATE_CALL" and info.value.predicted_wait > 30
+        with pytest.raises(AdmissionRejected):                      # the bucket enforces it too
+            await full.reserve(1, deadline=time.monotonic() + 30)
+        assert full.waiters == 0 and full.current_load() == 10
+
+    asyncio.run(run())
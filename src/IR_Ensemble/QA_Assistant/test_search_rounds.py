@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Tests for the retrieval side of a QA round.
+
+* `speculative_searches` – BM25 queries built locally from ``<questions>``
+* `BaseAgent._score_select` – skipping SELECT when the rerank scores decide
+* `rerank_jsonl` – already‑read segments never reach the reranker
+* `TopicIndex` – BM25 ranking over the segments a topic has fetched
+
+Nothing here reaches the JVM daemon or Cohere: agent tool dispatch is
+replaced by a recorder.
+
+Run with ``python -m pytest src/IR_Ensemble/QA_Assistant/test_search_rounds.py``.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.IR_Ensemble.QA_Assistant import Searcher
+from src.IR_Ensemble.QA_Assistant.base import BaseAgent
+from src.IR_Ensemble.QA_Assistant.evidence_index import TopicIndex, drop_topic_index, terms, topic_index
+from src.IR_Ensemble.QA_Assistant.Searcher import keyword_query, rerank_jsonl, speculative_searches
+
+
+def _agent(**attrs):
+    agent = object.__new__(BaseAgent)
+    agent.read_segments, agent.num = set(), 1
+    for name, value in attrs.items():
+        setattr(agent, name, value)
+    return agent
+
+
+def _hits(*ids, scores=None, **extra):
+    if scores is None:
+        return {"search": "q", "results": [{"segment_id": seg} for seg in ids], **extra}
+    return {"search": "q", **extra,
+            "results": [{"segment_id": seg, "relevance_score": s} for seg, s in zip(ids, scores)]}
+
+
+# ───────────────────────────────────────── speculative searches ───────────────
+
+def test_keyword_query_keeps_content_words_in_order():
+    assert keyword_query("What are the health effects of the Maui wildfire smoke?") == \
+        "health effects maui wildfire smoke"
+    assert keyword_query("a b c") == ""                   # one‑letter words carry nothing
+    assert keyword_query("fire fire smoke fire drill", max_terms=2) == "fire smoke"
+
+
+def test_speculative_searches_from_question_and_context():
+    questions = "\n".join([
+        json.dumps({"question": "Who funded the Lahaina rebuild?", "context": "FEMA grants"}),
+        json.dumps({"question": "When did the fire start?", "doc_context": "August 8 2023"}),
+        "How many homes burned?",                                   # not JSON – the line is the question
+        json.dumps(["not", "an", "item"]),
+    ])
+    calls = speculative_searches(questions, limit=None)
+    assert calls == [
+        {"queries": ["funded lahaina rebuild", "fema grants"], "master_query": "Who funded the Lahaina rebuild?"},
+        {"queries": ["fire start", "august 2023"], "master_query": "When did the fire start?"},
+        {"queries": ["many homes burned"], "master_query": "How many homes burned?"},
+    ]
+    assert speculative_searches(questions) == calls[:2]
+    same = json.dumps({"question": "maui fire", "context": "Maui fire"})
+    assert speculative_searches(same)[0]["queries"] == ["maui fire"]
+
+
+def test_speculative_search_skips_and_caps():
+    questions = "\n".join(json.dumps({"question": f"question number {i}"}) for i in range(4))
+    dispatched = []
+
+    async def dispatch(tool, **kwargs):
+        dispatched.append(kwargs["master_query"])
+        if kwargs["master_query"].endswith("2"):
+            raise RuntimeError("daemon down")
+        return _hits(kwargs["master_query"])
+
+    agent = _agent(questions=questions, SPECULATIVE_SEARCHES=2, _dispatch_tool=dispatch)
+    found = asyncio.run(agent._speculative_search(skip={"question number 0"}))
+    assert dispatched == ["question number 1", "question number 2"]
+    assert [r["results"][0]["segment_id"] for r in found] == ["question number 1"]   # failure dropped
+
+
+def test_merge_results_drops_segments_already_in_the_pool():
+    pool = [_hits("a", "b")]
+    merged = BaseAgent._merge_results(pool, [_hits("b", "c"), _hits("a"), _hits("c", "d")])
+    assert [[r["segment_id"] for r in res["results"]] for res in merged] == [["a", "b"], ["c"], ["d"]]
+
+
+# ───────────────────────────────────────── score select ───────────────────────
+
+def test_score_select_cuts_at_a_decisive_gap():
+    agent = _agent()
+    results = [_hits("a", "b", "c", scores=[0.9, 0.6, 0.3]),
+               _hits("b", "d", scores=[0.85, 0.2])]                 # b pooled at its best score
+    assert agent._score_select(results) == ["a", "b"]
+
+
+def test_score_select_is_ambiguous_without_a_clear_gap():
+    agent = _agent()
+    flat = [f"s{i}" for i in range(BaseAgent.AUTO_SELECT_K + 1)]
+    assert agent._score_select([_hits(*flat, scores=[0.8 - 0.02 * i for i in range(len(flat))])]) is None
+    assert agent._score_select([_hits("a", "b", scores=[0.3, 0.05])]) is None      # below SCORE_FLOOR
+    assert agent._score_select([_hits("a", scores=[0.9])]) is None                  # nothing to compare
+    assert agent._score_select([_hits("a", "b", scores=[0.9, 0.1]), _hits("c")]) is None   # BM25 fallback
+
+
+def test_score_select_ignores_topic_index_hits():
+    agent = _agent()
+    index = _hits("x", "y", source="topic_index")                    # BM25 scores only
+    assert agent._score_select([_hits("a", "b", scores=[0.9, 0.2]), index]) == ["a"]
+
+
+# ───────────────────────────────────────── read ledger ────────────────────────
+
+def _bm25_file(tmp_path, *ids):
+    path = tmp_path / "results.jsonl"
+    path.write_text("".join(json.dumps({"docid": seg, "title": f"t{seg}", "url": None, "headings": None,
+                                        "segment": f"text of {seg}"}) + "\n" for seg in ids))
+    return path
+
+
+def test_rerank_drops_read_segments_before_cohere(tmp_path, monkeypatch):
+    sent = []
+
+    async def rerank(call, **kwargs):
+        documents = kwargs["json"]["documents"]
+        sent.append(documents)
+        scores = [{"index": i, "relevance_score": 1 - i / 10} for i in range(len(documents))]
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {"results": scores})
+
+    monkeypatch.setattr(Searcher, "gated_cohere_rerank_call", rerank)
+    path = _bm25_file(tmp_path, "a", "b", "c")
+    out = asyncio.run(rerank_jsonl(path, "query", exclude={"b"}))
+    assert sent == [["text of a", "text of c"]]
+    assert [(r["segment_id"], r["relevance_score"]) for r in out] == [("a", 1.0), ("c", 0.9)]
+
+    assert asyncio.run(rerank_jsonl(path, "query", exclude={"a", "b", "c"})) == []
+    assert len(sent) == 1                                            # nothing new – no rerank call
+
+
+# ───────────────────────────────────────── topic index ────────────────────────
+
+def _index(**segments):
+    index = TopicIndex()
+    for seg, text in segments.items():
+        index.add(seg, text, {"segment_id": seg})
+    return index
+
+
+def test_terms_drop_stop_words_and_single_characters():
+    assert terms("The Maui fire's smoke, a 2023 event") == ["maui", "fire's", "smoke", "2023", "event"]
+
+
+def test_bm25_ranks_by_rare_terms_and_length():
+    index = _index(
+        smoke="wildfire smoke health effects",
+        long="wildfire smoke health effects " + "filler words about nothing " * 10,
+        fema="fema funding lahaina rebuild",
+        both="wildfire lahaina",
+    )
+    assert not index.add("smoke", "again", {}) and not index.add(None, "no id", {})
+    assert len(index) == 4
+    ranked = [meta["segment_id"] for meta, _ in index.search("wildfire smoke health")]
+    assert ranked[:2] == ["smoke", "long"]                           # same terms, shorter wins
+    assert "fema" not in ranked
+    assert [m["segment_id"] for m, _ in index.search("lahaina")] == ["both", "fema"]
+    assert index.search("the of and") == [] and TopicIndex().search("smoke") == []
+
+
+def test_scores_are_normalised_to_query_coverage():
+    index = _index(s1="alpha beta", s2="alpha gamma", s3="gamma delta")
+    (top, full), (_, half) = index.search("alpha beta", k=2)
+    assert top["segment_id"] == "s1" and full == pytest.approx(1.0, rel=0.2)
+    assert half < full and [m["segment_id"] for m, _ in index.search("alpha beta", min_score=0.8)] == ["s1"]
+
+
+def test_search_excludes_read_segments_but_still_fills_k():
+    index = _index(a="smoke smoke", b="smoke", c="smoke haze", d="haze")
+    hits = index.search("smoke", k=2, exclude={"a"})
+    assert [m["segment_id"] for m, _ in hits] == ["b", "c"]
+
+
+def test_rerank_feeds_the_topic_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(Searcher, "gated_cohere_rerank_call", None)  # never reached
+    path = _bm25_file(tmp_path, "a", "b")
+    try:
+        assert asyncio.run(rerank_jsonl(path, "query", topic=-7, exclude={"a", "b"})) == []
+        assert len(topic_index(-7)) == 2                             # read segments are indexed too
+        assert [m["segment_id"] for m, _ in topic_index(-7).search("tb")] == ["b"]   # title included
+    finally:
+        drop_topic_index(-7)
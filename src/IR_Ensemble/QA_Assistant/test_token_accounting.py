@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for token accounting on the agent side.
+
+* `BaseAgent` – the running token ledger over the logical thread
+* `TokenEstimator` – bytes‑per‑token calibration from exact counts
+* prompt layout – one stable instructions prefix, cached tokens read from usage
+
+tiktoken's BPE file is not needed: the ledger counts through a stand‑in
+that charges one token per character, exact counts through a word split.
+
+Run with ``python -m pytest src/IR_Ensemble/QA_Assistant/test_token_accounting.py``.
+"""
+
+import asyncio
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from src.IR_Ensemble.QA_Assistant import base, token_estimator as estimator_module
+from src.IR_Ensemble.QA_Assistant import answer_contracts as contracts
+from src.IR_Ensemble.QA_Assistant.answer_contracts import INSTRUCTIONS
+from src.IR_Ensemble.QA_Assistant.base import BaseAgent
+from src.IR_Ensemble.QA_Assistant.call_metrics import cached_tokens
+from src.IR_Ensemble.QA_Assistant.token_estimator import (CALIBRATE_MIN_BYTES, SAFETY, SAMPLE_EVERY,
+                                                          WARMUP_SAMPLES, TokenEstimator)
+
+
+@pytest.fixture
+def char_tokens(monkeypatch):
+    """One token per character; records which texts were counted as static."""
+    static = []
+
+    def count_static(text):
+        static.append(text)
+        return len(text or "")
+
+    monkeypatch.setattr(base, "count_static_tokens", count_static)
+    monkeypatch.setattr(base, "estimate_tokens", lambda text: len(text or ""))
+    return static
+
+
+# ───────────────────────────────────────── history ledger ─────────────────────
+
+def _agent():
+    agent = object.__new__(BaseAgent)
+    agent.history, agent.history_tokens, agent.prev_id = [], 0, "resp_1"
+
+    async def _log(msg, **_):
+        pass
+
+    agent._log = _log
+    return agent
+
+
+def test_record_counts_each_message_once(char_tokens):
+    agent = _agent()
+    header = "<search contract>"
+    n = agent._record("user", header + "payload", static=header)
+    assert n == len("<|user|>\n") + len(header) + len("payload\n")
+    assert header in char_tokens and "payload\n" not in char_tokens   # only the header is memoised
+    agent._record("assistant", "answer")
+    assert agent.history == [{"role": "user", "content": header + "payload"},
+                             {"role": "assistant", "content": "answer"}]
+    assert agent.history_tokens == n + len("<|assistant|>\n") + len("answer\n")
+    assert agent._prompt_tokens(10) == len(INSTRUCTIONS) + agent.history_tokens + 10
+
+
+def test_static_prefix_that_does_not_match_is_counted_as_dynamic(char_tokens):
+    agent = _agent()
+    n = agent._record("user", "no header here", static="<search contract>")
+    assert n == len("<|user|>\n") + len("no header here\n")
+
+
+def test_reset_clears_the_ledger(char_tokens):
+    agent = _agent()
+    agent._record("user", "x" * 100)
+    asyncio.run(agent.reset_logical_thread())
+    assert agent.history == [] and agent.history_tokens == 0 and agent.prev_id is None
+    assert agent._prompt_tokens() == len(INSTRUCTIONS)
+
+
+# ───────────────────────────────────────── estimator ──────────────────────────
+
+def test_estimate_is_bytes_over_ratio_with_safety():
+    est = TokenEstimator(bytes_per_token=4.0)
+    assert est.estimate("") == 0 and est.estimate(None) == 0
+    assert est.estimate("a" * 400) == math.ceil(100 * SAFETY)
+    assert est.estimate("é" * 200) == math.ceil(100 * SAFETY)         # bytes, not characters
+
+
+def test_observe_converges_on_the_real_ratio():
+    est = TokenEstimator(bytes_per_token=3.8)
+    est.observe(CALIBRATE_MIN_BYTES - 1, 100)                        # too small to say much
+    est.observe(10_000, 0)
+    assert est.samples == 0 and est.bytes_per_token == 3.8
+    for _ in range(100):
+        est.observe(5_000, 1_000)                                    # really 5 bytes / token
+    assert est.samples == 100
+    assert est.bytes_per_token == pytest.approx(5.0, rel=1e-3)
+    assert est.mean_abs_error < 0.01
+
+
+def test_exact_counts_in_a_thread_and_recalibrates(monkeypatch):
+    monkeypatch.setattr(estimator_module, "ENCODER",
+                        lambda: SimpleNamespace(encode=lambda text: text.split()))
+    est = TokenEstimator(bytes_per_token=3.8)
+    text = "word " * 1_000                                           # 5 000 bytes, 1 000 tokens
+    assert asyncio.run(est.exact(text)) == 1_000
+    assert est.samples == 1 and est.bytes_per_token > 3.8
+
+
+def test_calibration_is_sampled_after_warm_up():
+    est = TokenEstimator()
+    counted = []
+
+    async def exact(text):
+        counted.append(text)
+        est.samples += 1
+
+    est.exact = exact
+    text = "x" * CALIBRATE_MIN_BYTES
+
+    async def run():
+        est.calibrate_soon("short")                                  # never worth an exact count
+        for _ in range(WARMUP_SAMPLES + 4 * SAMPLE_EVERY):
+            est.calibrate_soon(text)
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert len(counted) == WARMUP_SAMPLES + 4
+    est.calibrate_soon(text)                                         # no running loop – skipped
+
+
+# ───────────────────────────────────────── prompt layout ──────────────────────
+
+def test_instructions_carry_every_contract_after_the_global_format():
+    assert INSTRUCTIONS.startswith(contracts.GLOBAL_FORMAT)
+    for name in ("SEARCH", "SELECT", "UPDATE", "FINAL"):
+        assert getattr(contracts, f"{name}_CONTRACT") in INSTRUCTIONS
+        assert f"#### Contract {name}\n" in INSTRUCTIONS
+        assert getattr(contracts, f"{name}_TURN") == f"<contract>{name}</contract>\n"
+
+
+def test_a_turn_charges_its_header_not_the_contract(char_tokens):
+    agent = _agent()
+    n = agent._record("user", contracts.UPDATE_TURN + "<selected_segments></selected_segments>",
+                      static=contracts.UPDATE_TURN)
+    assert char_tokens == ["<|user|>\n", contracts.UPDATE_TURN]
+    assert n < len(contracts.UPDATE_CONTRACT)
+
+
+def test_cached_tokens_from_either_usage_shape():
+    responses = SimpleNamespace(input_tokens_details=SimpleNamespace(cached_tokens=1_024))
+    chat = SimpleNamespace(prompt_tokens_details=SimpleNamespace(cached_tokens=512))
+    assert cached_tokens(responses) == 1_024 and cached_tokens(chat) == 512
+    assert cached_tokens(SimpleNamespace(input_tokens_details=None)) is None
+    assert cached_tokens(None) is None
@@ -18,23 +18,38 @@ async with bucket.acquire(3_000) as event_id:
     await bucket.credit_by_id(event_id, 1_200)
 ````
 
+Pass a *deadline* (``time.monotonic()`` seconds) to `acquire` and the wait
+is abandoned with `AdmissionRejected` once it cannot finish in time; see
+`predict_wait` and `admission`.
+
 If you don’t capture the `event_id`, you can still use the legacy `credit` API
 (which walks the deque newest‑to‑oldest).
+
+Give a bucket a *name* and set ``RATE_LIMIT_STATE`` to keep its window in a
+SQLite file shared by every process on the box (see `shared_state`).
 """
 
 import asyncio
 import time
+import uuid
 from collections import deque
 from contextlib import asynccontextmanager
 from typing import Deque, Optional, Tuple
 
+from src.IR_Ensemble.QA_Assistant.admission import AdmissionRejected
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics
+from src.IR_Ensemble.QA_Assistant.shared_state import shared_state
+
+_background: set = set()   # in‑flight shared‑state writes started from sync code
+
 
 class AsyncTokenBucket:
     """Sliding‑window bucket (capacity units per *window* seconds)."""
 
     # ─────────────────────────── construction ────────────────────────────
-    def __init__(self, capacity: int, window: float = 60.0) -> None:
+    def __init__(self, capacity: int, window: float = 60.0, *, name: Optional[str] = None) -> None:
         self.capacity: int = capacity
+        self.base_capacity: int = capacity  # as configured (capacity may adapt)
         self.window: float = window
 
         # Each event: (timestamp, weight, event_id)
@@ -45,6 +60,19 @@ class AsyncTokenBucket:
         # Simple monotonically‑increasing counter for ids (stringified ints)
         self._next_id: int = 0
 
+        # Server‑requested back‑off (retry‑after); nothing is admitted before it
+        self._paused_until: float = 0.0
+
+        # Lifetime stats (local events only) – rolled up when a bucket is evicted
+        self.reserved_total: int = 0
+        self.refunded_total: int = 0
+        self.peak_load: int = 0
+        self.waiters: int = 0              # callers currently inside `acquire`
+
+        # Named buckets may share their window across processes
+        self.name = name
+        self._shared = shared_state() if name else None
+
     # ───────────────────────── internal helpers ──────────────────────────
     def _purge_old(self, now: float) -> None:
         """Drop events that have aged out of the sliding window."""
@@ -53,36 +81,95 @@ class AsyncTokenBucket:
             _, weight, _ = self._events.popleft()
             self._in_window -= weight
 
-    async def _reserve(self, weight: int) -> str:
-        """Block until *weight* units fit, then record and return an `event_id`."""
+    def _wait_for(self, weight: int, now: float) -> float:
+        """Seconds until *weight* fits if nothing else is reserved meanwhile."""
+        wait = max(0.0, self._paused_until - now)
+        excess = self._in_window + weight - self.capacity
+        if excess <= 0 or not self._events:
+            return wait
+        # Walk the window oldest‑first until enough units have expired
+        freed = 0
+        for ts, w, _ in self._events:
+            freed += w
+            if freed >= excess:
+                break
+        return max(wait, self.window - (now - ts))
+
+    def _check_deadline(self, sleep_for: float, deadline: Optional[float], now: float,
+                        predicted: float) -> None:
+        if deadline is not None and now + sleep_for > deadline:
+            raise AdmissionRejected(self.name or "bucket", predicted, deadline - now)
+
+    async def _reserve(self, weight: int, deadline: Optional[float] = None) -> str:
+        """Block until *weight* units fit, then record and return an `event_id`.
+
+        With a *deadline* the wait is abandoned (`AdmissionRejected`) as soon
+        as the next sleep would end past it.
+        """
+        if self._shared is not None:
+            return await self._reserve_shared(weight, deadline)
         while True:
             async with self._lock:
                 now = time.monotonic()
                 self._purge_old(now)
 
-                if self._in_window + weight <= self.capacity:
+                if now < self._paused_until:
+                    sleep_for = self._paused_until - now
+                # An oversized weight (e.g. after a capacity cut) goes alone
+                elif self._in_window + weight <= self.capacity or not self._events:
                     event_id = str(self._next_id)
                     self._next_id += 1
 
                     self._events.append((now, weight, event_id))
                     self._in_window += weight
+                    self.reserved_total += weight
+                    self.peak_load = max(self.peak_load, self._in_window)
                     return event_id
+                else:
+                    # Earliest expiry → how long we need to wait
+                    oldest_ts, _, _ = self._events[0]
+                    sleep_for = (self.window - (now - oldest_ts)) + 1 # +1 to be safe
+                self._check_deadline(sleep_for, deadline, now, self._wait_for(weight, now))
+            await asyncio.sleep(sleep_for)
 
-                # Earliest expiry → how long we need to wait
-                oldest_ts, _, _ = self._events[0]
-                sleep_for = (self.window - (now - oldest_ts)) + 1 # +1 to be safe
+    async def _reserve_shared(self, weight: int, deadline: Optional[float] = None) -> str:
+        """`_reserve` against the cross‑process store (ids are globally unique)."""
+        while True:
+            event_id = uuid.uuid4().hex
+            sleep_for = await asyncio.to_thread(
+                self._shared.try_reserve, self.name, self.capacity, self.window, weight, event_id
+            )
+            if sleep_for <= 0:
+                return event_id
+            self._check_deadline(sleep_for, deadline, time.monotonic(), sleep_for)
             await asyncio.sleep(sleep_for)
 
     # ───────────────────────────── public API ────────────────────────────
-    @asynccontextmanager
-    async def acquire(self, weight: int = 1):
-        """Async CM that reserves *weight* units and yields the **event_id**."""
-        event_id = await self._reserve(weight)
+    async def reserve(self, weight: int = 1, *, deadline: Optional[float] = None) -> str:
+        """Wait until *weight* units fit, take them and return the **event_id**.
+
+        The units stay taken for the whole window – there is no release; give
+        them back early with `credit_by_id`.  *deadline* (``time.monotonic()``
+        seconds) bounds the queue wait, which is recorded as ``bucket_wait_s``
+        in `call_metrics`.
+        """
+        started = time.monotonic()
+        self.waiters += 1
         try:
-            yield event_id
+            return await self._reserve(weight, deadline)
         finally:
-            # Nothing to do – reservation expires naturally after <window> sec.
-            pass
+            self.waiters -= 1
+            call_metrics.observe("bucket_wait_s", time.monotonic() - started,
+                                 bucket=self.name or "assistant")
+
+    @asynccontextmanager
+    async def acquire(self, weight: int = 1, *, deadline: Optional[float] = None):
+        """Async CM around `reserve` that yields the **event_id**.
+
+        Leaving the block does not release anything – the reservation expires
+        naturally after <window> sec.
+        """
+        yield await self.reserve(weight, deadline=deadline)
 
     async def credit_by_id(self, event_id: str, weight: Optional[int] = None) -> None:
         """Refund up to *weight* tokens from the reservation identified by *event_id*.
@@ -90,6 +177,9 @@ class AsyncTokenBucket:
         * If *weight* is ``None`` → refund the entire event.
         * If the event has already fully expired → no‑op.
         """
+        if self._shared is not None:
+            await asyncio.to_thread(self._shared.credit, self.name, event_id, weight)
+            return
         async with self._lock:
             now = time.monotonic()
             self._purge_old(now)
@@ -102,6 +192,7 @@ class AsyncTokenBucket:
 
                 refund = w if weight is None else min(weight, w)
                 self._in_window -= refund
+                self.refunded_total += refund
 
                 if refund == w:
                     # Drop the whole event
@@ -114,7 +205,73 @@ class AsyncTokenBucket:
             # Safety net
             self._in_window = max(0, self._in_window)
 
+    async def debit_by_id(self, event_id: str, weight: int) -> None:
+        """Charge *weight* extra units to the reservation identified by *event_id*.
+
+        Used to reconcile an overrun (a call that consumed more than it
+        reserved).  The charge is applied without waiting, so the bucket may
+        briefly sit above capacity; later reservations absorb the difference.
+        If the event has already expired → no‑op.
+        """
+        if weight <= 0:
+            return
+        if self._shared is not None:
+            await asyncio.to_thread(self._shared.debit, self.name, event_id, weight)
+            return
+        async with self._lock:
+            now = time.monotonic()
+            self._purge_old(now)
+
+            for idx in range(len(self._events) - 1, -1, -1):
+                ts, w, eid = self._events[idx]
+                if eid != event_id:
+                    continue
+                self._events[idx] = (ts, w + weight, eid)
+                self._in_window += weight
+                self.reserved_total += weight
+                self.peak_load = max(self.peak_load, self._in_window)
+                break
+
+    def set_capacity(self, capacity: int) -> None:
+        """Resize the bucket (used by the adaptive rate‑limit controller)."""
+        self.capacity = max(1, int(capacity))
+
+    def pause(self, seconds: float) -> None:
+        """Admit nothing for *seconds* (server asked us to back off)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        if self._shared is not None:
+            # Locally the pause holds at once; the shared write goes to a worker thread
+            try:
+                task = asyncio.get_running_loop().create_task(
+                    asyncio.to_thread(self._shared.pause, self.name, seconds))
+            except RuntimeError:   # no loop – plain call
+                self._shared.pause(self.name, seconds)
+            else:
+                _background.add(task)
+                task.add_done_callback(_background.discard)
+
     # ───────────────────────────── introspection ──────────────────────────
     def current_load(self) -> int:
         """Return the total units currently in the sliding window."""
+        if self._shared is not None:
+            return self._shared.load(self.name, self.window)
         return self._in_window
+
+    def predict_wait(self, weight: int = 1) -> float:
+        """Seconds a reservation of *weight* would queue given the current window.
+
+        Ignores other waiters and future refunds, so it is a lower bound on
+        the real wait – good enough to shed work that clearly cannot start.
+        """
+        if self._shared is not None:
+            return self._shared.predict_wait(self.name, self.capacity, self.window, weight)
+        now = time.monotonic()
+        self._purge_old(now)
+        return self._wait_for(weight, now)
+
+    def drained(self) -> bool:
+        """True once every reservation has aged out of (or been refunded from) the window."""
+        if self._shared is not None:
+            return self.current_load() == 0
+        self._purge_old(time.monotonic())
+        return not self._events
@@ -0,0 +1,113 @@
+"""
+token_estimator.py
+~~~~~~~~~~~~~~~~~~
+Two‑level token counting that never blocks the event loop on tiktoken.
+
+1. `estimate()` – bytes / calibrated bytes‑per‑token.  O(n) in C, used to
+   size reservations immediately.
+2. `exact()`    – tiktoken in a worker thread.  Every exact count also
+   recalibrates the bytes‑per‑token ratio (EWMA), so estimates converge on
+   the real tokeniser for the prompts this pipeline actually sends.
+
+Reservations are reconciled against ``usage.total_tokens`` after each call,
+so a slightly off estimate only shifts *when* tokens are refunded.
+
+Usage
+-----
+````python
+n = token_estimator.estimate(prompt)          # cheap, gate right away
+token_estimator.calibrate_soon(prompt)        # exact count off the loop
+````
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Set
+
+import tiktoken
+
+# ───────────────────────────────────────── config ────────────────────────────
+INITIAL_BYTES_PER_TOKEN: float = 3.8   # o200k on English / JSON, slightly pessimistic
+ALPHA: float = 0.1                     # EWMA weight of each exact sample
+SAFETY: float = 1.05                   # estimates err on the high side
+CALIBRATE_MIN_BYTES: int = 2_048       # tiny strings say little about the ratio
+WARMUP_SAMPLES: int = 32               # calibrate every eligible text until then …
+SAMPLE_EVERY: int = 8                  # … then only one text in this many
+EXACT_WORKERS: int = 2
+
+
+@lru_cache
+def ENCODER():
+    return tiktoken.get_encoding("o200k_base")
+
+
+class TokenEstimator:
+    """Calibrated bytes‑based estimate with exact tiktoken counts off the loop."""
+
+    def __init__(self, bytes_per_token: float = INITIAL_BYTES_PER_TOKEN) -> None:
+        self.bytes_per_token = bytes_per_token
+        self.samples: int = 0
+        self.mean_abs_error: float = 0.0   # relative |estimate − exact| / exact (EWMA)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pending: Set[asyncio.Task] = set()
+        self._seen: int = 0
+
+    # ───────────────────────────── fast path ─────────────────────────────
+    def estimate(self, text: str | None) -> int:
+        """Cheap token estimate for *text* (never encodes)."""
+        if not text:
+            return 0
+        return math.ceil(len(text.encode("utf-8")) / self.bytes_per_token * SAFETY)
+
+    # ───────────────────────────── exact path ────────────────────────────
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(EXACT_WORKERS, thread_name_prefix="tiktoken")
+        return self._pool
+
+    async def exact(self, text: str | None) -> int:
+        """Exact tiktoken count computed in a worker thread (also recalibrates)."""
+        if not text:
+            return 0
+        loop = asyncio.get_running_loop()
+        tokens = await loop.run_in_executor(self._executor(), lambda: len(ENCODER().encode(text)))
+        self.observe(len(text.encode("utf-8")), tokens)
+        return tokens
+
+    def observe(self, n_bytes: int, n_tokens: int) -> None:
+        """Fold one (bytes, exact tokens) sample into the calibration."""
+        if n_tokens <= 0 or n_bytes < CALIBRATE_MIN_BYTES:
+            return
+        estimate = n_bytes / self.bytes_per_token
+        error = abs(estimate - n_tokens) / n_tokens
+        self.bytes_per_token = (1 - ALPHA) * self.bytes_per_token + ALPHA * (n_bytes / n_tokens)
+        self.mean_abs_error = (1 - ALPHA) * self.mean_abs_error + ALPHA * error
+        self.samples += 1
+
+    def calibrate_soon(self, text: str | None) -> None:
+        """Schedule `exact` for *text* in the background (fire‑and‑forget)."""
+        if not text or len(text) < CALIBRATE_MIN_BYTES:
+            return
+        self._seen += 1
+        if self.samples >= WARMUP_SAMPLES and self._seen % SAMPLE_EVERY:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (sync caller) – skip calibration
+        task = loop.create_task(self.exact(text))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+
+# Process‑wide estimator shared by every gated wrapper / agent ledger
+token_estimator = TokenEstimator()
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Fast estimate for gating; also queues an exact count for calibration."""
+    token_estimator.calibrate_soon(text)
+    return token_estimator.estimate(text)
@@ -0,0 +1,85 @@
+"""
+usage_estimator.py
+~~~~~~~~~~~~~~~~~~
+Predictive output‑token reservations.
+
+Every gated call used to reserve the stage's full ``max_output_tokens`` and
+only hand the surplus back once the call returned.  This module keeps a
+running distribution of the *observed* ``usage.output_tokens`` per
+(stage, model) and reserves a high percentile of it instead.  Overruns are
+reconciled by the refund helpers (``AsyncTokenBucket.debit_by_id``).
+
+Usage
+-----
+````python
+out = output_estimator.reserve_for("UPDATE_CALL", "gpt-4.1-mini", 6_000)
+...
+output_estimator.observe("UPDATE_CALL", "gpt-4.1-mini", resp.usage.output_tokens)
+````
+"""
+from __future__ import annotations
+
+import math
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+# ───────────────────────────────────────── config ────────────────────────────
+PERCENTILE: float = 0.95   # quantile of observed output tokens to reserve
+HISTORY: int = 256         # samples kept per (stage, model)
+MIN_SAMPLES: int = 8       # reserve the full max_output_tokens until warmed up
+HEADROOM: float = 1.10     # multiplicative slack on top of the percentile
+MIN_RESERVE: int = 256     # never reserve fewer output tokens than this
+
+
+class OutputTokenEstimator:
+    """Rolling per‑(stage, model) quantile of observed output tokens."""
+
+    def __init__(
+        self,
+        *,
+        percentile: float = PERCENTILE,
+        history: int = HISTORY,
+        min_samples: int = MIN_SAMPLES,
+        headroom: float = HEADROOM,
+        min_reserve: int = MIN_RESERVE,
+    ) -> None:
+        self.percentile = percentile
+        self.history = history
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self.min_reserve = min_reserve
+        self._samples: Dict[Tuple[str, str], Deque[int]] = {}
+
+    def observe(self, stage: str, model: str, output_tokens: int | None) -> None:
+        """Record the actual ``usage.output_tokens`` of a finished call."""
+        if output_tokens is None:
+            return
+        key = (stage, model)
+        if key not in self._samples:
+            self._samples[key] = deque(maxlen=self.history)
+        self._samples[key].append(int(output_tokens))
+
+    def quantile(self, stage: str, model: str) -> int | None:
+        """Return the configured percentile, or ``None`` while warming up."""
+        samples = self._samples.get((stage, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        idx = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        return ordered[max(0, idx)]
+
+    def reserve_for(self, stage: str, model: str, max_output: int) -> int:
+        """Output tokens to reserve for the next call of *stage* on *model*.
+
+        Falls back to *max_output* until enough samples have been observed and
+        never exceeds it (the API cannot emit more than that anyway).
+        """
+        q = self.quantile(stage, model)
+        if q is None:
+            return max_output
+        predicted = int(q * self.headroom)
+        return max(min(self.min_reserve, max_output), min(predicted, max_output))
+
+
+# Process‑wide estimator shared by every gated wrapper
+output_estimator = OutputTokenEstimator()
@@ -11,17 +11,39 @@ from __future__ import annotations
 • Subsequent workers start immediately when a slot frees up, which preserves
   the natural phase offset.
 
+• Optional `CONTEXT_BUDGET_SEC` caps the wall time of one `create_context`;
+  agents shed work at the rate‑limit gate rather than queue past it.
+
+• Before batching, paraphrased questions are merged into one research item
+  and related ones are batched together (`question_triage`), so fewer agents
+  cover the same questions and related questions share search results.
+
+• With `ANSWER_CACHE_PATH` set, questions already answered (in an earlier
+  round or run, or a near‑duplicate of one) are taken straight from the
+  answer cache; only the misses are batched out to agents.  Cache entries
+  are scoped by *topic_id* – the topic's stable id (its ``docid``), not the
+  run‑local *num*.
+
+• `create_context` returns a `ContextResult` built in memory from what the
+  agents hand back.  Questions already delivered in an earlier round of the
+  topic (the caller's *seen* set) are left out, so the context a round adds
+  does not repeat the rounds before it.
+
 Environment
 -----------
-`CONTEXT_PATH` must be defined in your `.env`.
+`CONTEXT_PATH` (optional) – every round's result is appended to
+`CONTEXT_PATH{num}.txt` as a trace, in one write.
+`CONTEXT_BUDGET_SEC` (optional) – seconds per `create_context` call.
+`ANSWER_CACHE_PATH` (optional) – see `answer_cache`.
 """
 
 # ── stdlib ───────────────────────────────────────────────────────────────────
 import asyncio
 import json
 import os
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 # ── third‑party ──────────────────────────────────────────────────────────────
 from dotenv import load_dotenv
@@ -30,6 +52,23 @@ import aiofiles
 
 # ── internal ────────────────────────────────────────────────────────────────
 from src.IR_Ensemble.QA_Assistant.question_eval import assess_questions
+from src.IR_Ensemble.QA_Assistant.admission import resolve_deadline
+from src.IR_Ensemble.QA_Assistant.answer_cache import answer_cache, normalise, question_context
+from src.IR_Ensemble.QA_Assistant.question_triage import merge_duplicates, related_batches
+
+
+@dataclass
+class ContextResult:
+    """One `create_context` round: newly answered questions plus each batch's agent output."""
+
+    finished: List[Dict[str, Any]] = field(default_factory=list)  # finished question items
+    batches: List[Dict[str, Any]] = field(default_factory=list)   # `assess_questions` result per batch
+
+    def render(self) -> str:
+        """Finished items one JSON per line, then the batch results – the old context file layout."""
+        sep = "\n===================================\n"
+        lines = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in self.finished)
+        return lines + sep.join(json.dumps(batch) for batch in self.batches)
 
 
 class ContextProctor:
@@ -38,29 +77,58 @@ class ContextProctor:
     MAX_WORKERS: int = 5          # how many workers run in parallel 
     STAGGER_SEC: float = 1.0      # delay between first, second, third starts
     BATCH_SIZE: int = 2           # questions per worker‑batch (‑5 recommended)
+    TRIAGE: bool = True           # merge paraphrases and batch related questions together
 
     # ────────────────────────────── init ────────────────────────────────
-    def __init__(self, client: AsyncAzureOpenAI, questions: List[Dict[str, str]],num: int ):
+    def __init__(self, client: AsyncAzureOpenAI, questions: List[Dict[str, str]], num: int,
+                 seen: Optional[Set[str]] = None, topic_id: Optional[str] = None):
         load_dotenv()
         self.client = client
         self.questions = questions
         self.num = num
+        self.topic_id = topic_id  # stable across runs; scopes the answer cache
+        # normalised questions already delivered to the caller; shared across rounds
+        self.seen: Set[str] = seen if seen is not None else set()
+
+        # Answer cache hits skip the agents entirely
+        self.cached: List[Dict[str, Any]] = []
+        misses = questions
+        cache = answer_cache()
+        if cache is not None:
+            misses = []
+            for q in questions:
+                entry = cache.get(str(q.get("question", "")), question_context(q), topic=topic_id)
+                if entry is None:
+                    misses.append(q)
+                else:
+                    self.cached.append({**q, "answer": entry["answer"], "finished": True})
 
         # Slice into (index, batch) tuples so we can emit results in order
-        self._batches: List[Tuple[int, List[Dict[str, str]]]] = [
-            (idx, questions[i : i + self.BATCH_SIZE])
-            for idx, i in enumerate(range(0, len(questions), self.BATCH_SIZE))
-        ]
-
-        self._results: List[str | None] = [None] * len(self._batches)
+        if self.TRIAGE:
+            items = merge_duplicates(misses)
+            if len(items) < len(misses):
+                print(f"{len(misses) - len(items)} duplicate questions merged")
+            batches = related_batches(items, self.BATCH_SIZE)
+        else:
+            batches = [misses[i : i + self.BATCH_SIZE] for i in range(0, len(misses), self.BATCH_SIZE)]
+        self._batches: List[Tuple[int, List[Dict[str, str]]]] = list(enumerate(batches))
+
+        self._results: List[Dict[str, Any] | None] = [None] * len(self._batches)
         self._queue: asyncio.Queue[Tuple[int, List[Dict[str, str]]]] = asyncio.Queue()
-        self.context_path = Path(f"{os.getenv('CONTEXT_PATH')}{self.num}.txt")
+        trace = os.getenv("CONTEXT_PATH")
+        self.context_path: Optional[Path] = Path(f"{trace}{self.num}.txt") if trace else None
+        budget = os.getenv("CONTEXT_BUDGET_SEC")
+        self.budget: Optional[float] = float(budget) if budget else None
+        self.deadline: Optional[float] = None
         for item in self._batches:
             self._queue.put_nowait(item)
 
     # ───────────────────────── public API ───────────────────────────────
-    async def create_context(self) -> None:
-        """Main entry – dispatch the worker pool, write `CONTEXT_PATH`."""
+    async def create_context(self) -> ContextResult:
+        """Main entry – dispatch the worker pool and collect the round's `ContextResult`."""
+        self.deadline = resolve_deadline(max_wait=self.budget)
+        if self.cached:
+            print(f"{len(self.cached)}/{len(self.questions)} questions answered from the answer cache")
 
         # Launch workers
         workers = [
@@ -76,12 +144,19 @@ class ContextProctor:
             w.cancel()
         await asyncio.gather(*workers, return_exceptions=True)
 
-        # Concatenate results in original batch order
-        sep = "\n===================================\n"
-        total_context = sep.join(filter(None, self._results))
+        # Cached answers first, then every agent's finished items in batch order
+        result = ContextResult(batches=[r for r in self._results if r is not None])
+        finished = self.cached + [item for r in result.batches for item in r.pop("finished", None) or []]
+        for item in finished:
+            key = normalise(str(item.get("question", "")))
+            if key not in self.seen:
+                self.seen.add(key)
+                result.finished.append(item)
 
-        async with aiofiles.open(self.context_path, "a") as f:
-            await f.write(total_context)
+        if self.context_path is not None:
+            async with aiofiles.open(self.context_path, "a") as f:
+                await f.write(result.render())
+        return result
 
     # ─────────────────────────── worker loop ────────────────────────────
     async def _worker(self, worker_idx: int):
@@ -98,17 +173,16 @@ class ContextProctor:
 
             try:
                 # One batch ➜ many questions ➜ gather
-                result_str = await self._process_batch(batch)
-                self._results[batch_idx] = result_str
+                self._results[batch_idx] = await self._process_batch(batch)
             finally:
                 self._queue.task_done()
 
     # ───────────────────────── batch helper ─────────────────────────────
-    async def _process_batch(self, batch: List[Dict[str, str]]) -> str:
+    async def _process_batch(self, batch: List[Dict[str, str]]) -> Dict[str, Any]:
         """Call `assess_questions` for each question in the batch concurrently."""
         # Convert question dict ➜ JSON string (per original code expectations)
         stringified = [json.dumps(q) for q in batch]
-        contexts = await assess_questions("\n".join(stringified),self.client,self.num)
-        return json.dumps(contexts)
+        return await assess_questions("\n".join(stringified),self.client,self.num,
+                                      deadline=self.deadline, topic_id=self.topic_id)
     
 
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for `ContextProctor` rounds.
+
+* `ContextResult.render` – the context file layout, built in memory
+* `ContextProctor.create_context` – cache hits first, agents' finished items
+  in batch order, questions delivered in an earlier round left out
+
+Agents are replaced by a stand‑in `assess_questions` that finishes every
+question it is given.
+
+Run with ``python -m pytest src/IR_Ensemble/test_context_builder.py``.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from src.IR_Ensemble import context_builder
+from src.IR_Ensemble.QA_Assistant.answer_cache import AnswerCache
+from src.IR_Ensemble.context_builder import ContextProctor, ContextResult
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    """Record each batch sent to the agents; every question comes back finished."""
+    batches = []
+
+    async def assess_questions(questions, client, num, *, deadline=None, topic_id=None):
+        items = [json.loads(line) for line in questions.splitlines()]
+        batches.append(([item["question"] for item in items], topic_id))
+        finished = [{**item, "answer": {"text": f"agent: {item['question']}"}, "finished": True}
+                    for item in items]
+        return {"answer": "ok", "finished": finished}
+
+    monkeypatch.setattr(context_builder, "assess_questions", assess_questions)
+    monkeypatch.setattr(context_builder, "answer_cache", lambda: None)
+    monkeypatch.setattr(ContextProctor, "STAGGER_SEC", 0)
+    monkeypatch.setattr(ContextProctor, "TRIAGE", False)
+    monkeypatch.delenv("CONTEXT_PATH", raising=False)
+    monkeypatch.delenv("CONTEXT_BUDGET_SEC", raising=False)
+    return batches
+
+
+def _round(questions, **kwargs):
+    async def run():
+        return await ContextProctor(None, questions, 1, **kwargs).create_context()
+    return asyncio.run(run())
+
+
+QUESTIONS = [{"question": q, "context": ""} for q in
+             ("When did the Maui fire start?", "Who funded the Lahaina rebuild?", "How many homes burned?")]
+Q0, Q1, Q2 = (q["question"] for q in QUESTIONS)
+
+
+# ───────────────────────────────────────── result ─────────────────────────────
+
+def test_render_is_the_context_file_layout():
+    result = ContextResult(finished=[{"question": "é?"}, {"question": "b?"}],
+                           batches=[{"answer": 1}, {"answer": 2}])
+    assert result.render() == ('{"question": "é?"}\n{"question": "b?"}\n'
+                               '{"answer": 1}\n===================================\n{"answer": 2}')
+    assert ContextResult().render() == ""
+
+
+# ───────────────────────────────────────── rounds ─────────────────────────────
+
+def test_round_returns_finished_items_in_batch_order(agents):
+    result = _round(QUESTIONS)
+    assert [item["question"] for item in result.finished] == [Q0, Q1, Q2]
+    assert result.batches == [{"answer": "ok"}, {"answer": "ok"}]           # "finished" moved out
+    assert len(agents) == 2
+
+
+def test_seen_questions_are_not_delivered_again(agents):
+    seen = set()
+    _round(QUESTIONS[:2], seen=seen)
+    again = _round([{"question": "who funded the Lahaina rebuild"}, QUESTIONS[2]], seen=seen)
+    assert [item["question"] for item in again.finished] == [Q2]
+    assert len(seen) == 3
+
+
+def test_cache_hits_skip_the_agents(agents, tmp_path, monkeypatch):
+    cache = AnswerCache(str(tmp_path / "answers.jsonl"))
+    asyncio.run(cache.put({"question": Q1, "answer": {"text": "cached"}}, topic="doc-7"))
+    monkeypatch.setattr(context_builder, "answer_cache", lambda: cache)
+
+    result = _round(QUESTIONS, topic_id="doc-7")
+    assert [(item["question"], item["answer"]["text"]) for item in result.finished] == [
+        (Q1, "cached"), (Q0, f"agent: {Q0}"), (Q2, f"agent: {Q2}")]
+    assert agents == [([Q0, Q2], "doc-7")]
+
+    agents.clear()
+    _round(QUESTIONS, topic_id="doc-8")                                    # another topic: no hit
+    assert sum(len(questions) for questions, _ in agents) == 3
@@ -26,6 +26,7 @@ class ReportEvaluator:
         load_dotenv()
         self.client = client
         self.topic = topic
+        self.num = num
         self.my_notes = []
         self.gen_notes = []
         self.LOG_PATH = f"{os.getenv('EVAL_PATH')}{num}.txt"
@@ -46,12 +47,22 @@ class ReportEvaluator:
         """
         self.gen_notes.append(generator_comment)
 
-        prompt = SYSTEM_PROMPT + f"\nTopic document:\n{self.topic}\n \nReport:\n{report}\nIR Context:\n{ir_context or 'First round no IR context yet'}\nGenerator Comments:\n{self.serialize_notes(False)}\n Your Comments:\n{self.serialize_notes(True)}"
+        # Stable prefix first (system prompt as instructions, then topic and the
+        # append-only comments log), per-round sections last for prompt caching.
+        prompt = (
+            f"Topic document:\n{self.topic}\n"
+            f"Comments (oldest first):\n{self.serialize_notes()}"
+            f"Report:\n{report}\n"
+            f"IR Context:\n{ir_context or 'First round no IR context yet'}\n"
+        )
         self._log(prompt)
         response: Response = await gated_call_gen(
             prompt = prompt,
             client=self.client,
             temperature=0.2,
+            stage="REPORT_EVAL",
+            topic=self.num,
+            instructions=SYSTEM_PROMPT,
         )
         text = response.output_text
         if not text or not text.strip():
@@ -60,12 +71,14 @@ class ReportEvaluator:
         self._update_status(text,report)
         return self.my_notes[-1],self.questions, self.eval_
     
-    def serialize_notes(self, mine: bool) -> str:
-        notes = self.my_notes if mine else self.gen_notes
-        return "\n".join(
-            f"{i}. Evaluation note: {note or 'First round no note yet or trouble parsing eval note'}"
-            for i, note in enumerate(notes)
-        ) + "\n"
+    def serialize_notes(self) -> str:
+        """Generator comments and own notes interleaved oldest first – only ever appended to."""
+        lines = []
+        for i, comment in enumerate(self.gen_notes):
+            lines.append(f"{i}. Generator comment: {comment or 'No comment or trouble parsing comment'}")
+            if i < len(self.my_notes):
+                lines.append(f"{i}. Your comment: {self.my_notes[i] or 'trouble parsing note'}")
+        return "\n".join(lines) + "\n"
     
     def _log(self, msg: str, *, _file: Optional[str] = None) -> None:
         with open(_file or self.LOG_PATH, "a", encoding="utf-8") as f: f.write(msg)
@@ -36,6 +36,7 @@ class ReportGenerator:
         load_dotenv()
         self.topic = topic
         self.client = client
+        self.num = num
 
         self.cur_report: str = None
         self.eval_notes: List[str] = []
@@ -62,11 +63,23 @@ class ReportGenerator:
         Generates a report based on the topic, IR context, evaluation notes, and previous report
         """
         self.eval_notes.append(note)
-        prompt = f"{SYSTEM_PROMPT}\nTopic:\n{self.topic}\nPrevious report: \n{self.cur_report or 'First round no report yet'}\nYour notes:\n{self.serialize_notes(True)}Evaluation notes: \n{self.serialize_notes(False)}\nEvaluation:\n{eval_}\nIR context: \n{ir_context or 'First round no IR context yet'}\n"
+        # Stable prefix first (system prompt as instructions, then topic and the
+        # append-only notes log), per-round sections last – keeps the prefix the
+        # provider's prompt cache sees byte-identical from round to round.
+        prompt = (
+            f"Topic:\n{self.topic}\n"
+            f"Notes (oldest first):\n{self.serialize_notes()}"
+            f"Previous report: \n{self.cur_report or 'First round no report yet'}\n"
+            f"Evaluation:\n{eval_}\n"
+            f"IR context: \n{ir_context or 'First round no IR context yet'}\n"
+        )
         resp: Response = await gated_call_gen(
             prompt = prompt,
             client = self.client,
             temperature=0.25,
+            stage="REPORT_GEN",
+            topic=self.num,
+            instructions=SYSTEM_PROMPT,
         )
         text = resp.output_text
         self._log("\n=========\n")
@@ -76,12 +89,14 @@ class ReportGenerator:
         return self.cur_report,self.my_notes[-1]
 
 
-    def serialize_notes(self, mine: bool) -> str:
-        notes = self.my_notes if mine else self.eval_notes
-        return "\n".join(
-            f"{i}. Evaluation note: {note or 'First round no note yet or trouble parsing eval note'}"
-            for i, note in enumerate(notes)
-        ) + "\n"
+    def serialize_notes(self) -> str:
+        """Evaluator and own notes interleaved oldest first – only ever appended to."""
+        lines = []
+        for i, note in enumerate(self.eval_notes):
+            lines.append(f"{i}. Evaluation note: {note or 'First round no note yet or trouble parsing eval note'}")
+            if i < len(self.my_notes):
+                lines.append(f"{i}. Your note: {self.my_notes[i] or 'trouble parsing note'}")
+        return "\n".join(lines) + "\n"
 
     def _update_status(
         self,
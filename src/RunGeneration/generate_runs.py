@@ -18,7 +18,10 @@ from dotenv import load_dotenv
 # Import your existing pipeline components
 from openai import AsyncAzureOpenAI, AsyncOpenAI
 from ..IR_Ensemble.QA_Assistant.bucket_monitor import BucketMonitor
+from ..IR_Ensemble.QA_Assistant.metrics_server import MetricsServer
+from ..IR_Ensemble.QA_Assistant.call_metrics import call_metrics
 from ..IR_Ensemble.QA_Assistant.Searcher import cohere_client
+from ..IR_Ensemble.QA_Assistant.evidence_index import drop_topic_index
 from ..IR_Ensemble.QA_Assistant.daemon_wrapper import JVMDaemon 
 from ..IR_Ensemble.context_builder import ContextProctor
 from ..ReportGenerator.report_generator import ReportGenerator
@@ -61,26 +64,26 @@ def load_topics(topics_file: str) -> List[Dict[str, Any]]:
     return topics
 
 
-async def get_context(client: AsyncAzureOpenAI, questions: list[dict[str,str]]) -> str:
+async def get_context(client: AsyncAzureOpenAI, questions: list[dict[str,str]], num: int,
+                      seen: set[str], topic_id: str | None = None) -> str:
     """
     Get search results for a set of questions.
+    *seen* carries the questions already answered in earlier rounds of the topic;
+    *topic_id* is the topic's docid, which scopes the answer cache across runs.
     """
-    proc = ContextProctor(client, questions)
+    proc = ContextProctor(client, questions, num, seen=seen, topic_id=topic_id)
     try: 
-        await proc.create_context()
-        # clear mem
-        del proc
-        with open(os.getenv("CONTEXT_PATH"), "r") as f: 
-            return f.read()
+        result = await proc.create_context()
+        return result.render()
     except Exception as e:
         print(e)
         import traceback
         traceback.print_exc()
-        del proc
         return "Error generating context."
 
 
-async def generate_report_for_topic(oai_client: AsyncOpenAI, aoai_client: AsyncAzureOpenAI, topic: Dict[str, Any]) -> str:
+async def generate_report_for_topic(oai_client: AsyncOpenAI, aoai_client: AsyncAzureOpenAI, topic: Dict[str, Any],
+                                    num: int = 0) -> str:
     """
     Generate a report for a specific topic using the existing pipeline.
     
@@ -88,6 +91,7 @@ async def generate_report_for_topic(oai_client: AsyncOpenAI, aoai_client: AsyncA
         oai_client: OpenAI client
         aoai_client: Azure OpenAI client
         topic: Topic dictionary
+        num: Topic number (keys the per-topic agent state)
         
     Returns:
         Generated report text
@@ -95,24 +99,25 @@ async def generate_report_for_topic(oai_client: AsyncOpenAI, aoai_client: AsyncA
     # Extract topic content
     topic_content = f"Title: {topic.get('title', '')}\n\nBody: {topic.get('body', '')}"
     
-    # clear old context if it exists else ensure it exists
-    with open(os.getenv("CONTEXT_PATH"), "w") as f: 
-        f.write("")
-
     # init agents
     gen: ReportGenerator = ReportGenerator(client=oai_client, topic=topic_content)
     eval: ReportEvaluator = ReportEvaluator(client=oai_client, topic=topic_content)
     rounds = 0
     note, context = [None]*2
+    seen: set[str] = set()   # questions whose answers earlier rounds already delivered
 
     # run loop
-    while rounds < MAX_ROUNDS:
-        report, note = await gen.generate_report(context, note)
-        note, questions = await eval.evaluate(report=report, generator_comment=note, ir_context=context)
-        if eval.status == EvalStatus.PASS:
-            break
-        context = await get_context(client=aoai_client, questions=questions)
-        rounds += 1
+    try:
+        while rounds < MAX_ROUNDS:
+            report, note = await gen.generate_report(context, note)
+            note, questions = await eval.evaluate(report=report, generator_comment=note, ir_context=context)
+            if eval.status == EvalStatus.PASS:
+                break
+            context = await get_context(client=aoai_client, questions=questions, num=num, seen=seen,
+                                        topic_id=topic.get('docid'))
+            rounds += 1
+    finally:
+        drop_topic_index(num)   # free the topic's evidence index once it is done
     
     return report
 
@@ -263,21 +268,24 @@ async def generate_runs_async(topics_file: str, output_file: str, team_id: str =
     oai_client = AsyncOpenAI(
         api_key=os.getenv("OPENAI_API_KEY"),
         timeout=25,
-        max_retries=3,
+        max_retries=0,  # retries are re-gated through the buckets (QA_Assistant/retry.py)
     )
     aoai_client = AsyncAzureOpenAI(
         api_key=os.getenv("AZURE_OPENAI_KEY"),
         base_url=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_version="preview",
         timeout=60.5,
-        max_retries=3,
+        max_retries=0,  # retries are re-gated through the buckets (QA_Assistant/retry.py)
     )
     
     # Initialize bucket monitor
     bm = BucketMonitor()
+    ms = MetricsServer.from_env()  # optional Prometheus endpoint (METRICS_PORT)
     
     try:
         await bm.start()
+        if ms:
+            await ms.start()
         
         # Generate runs
         runs = []
@@ -286,7 +294,7 @@ async def generate_runs_async(topics_file: str, output_file: str, team_id: str =
             
             try:
                 # Generate report for this topic
-                report = await generate_report_for_topic(oai_client, aoai_client, topic)
+                report = await generate_report_for_topic(oai_client, aoai_client, topic, num=i)
                 
                 # Split report into responses
                 responses = split_report_into_responses(report, topic.get('docid', 'unknown'))
@@ -307,6 +315,7 @@ async def generate_runs_async(topics_file: str, output_file: str, team_id: str =
                 )
                 
                 runs.append(run_entry)
+                call_metrics.add("topics_completed")
                 print(f"Successfully generated run for topic {topic.get('docid', 'unknown')}")
                 
             except Exception as e:
@@ -338,6 +347,8 @@ async def generate_runs_async(topics_file: str, output_file: str, team_id: str =
         await cohere_client.aclose()
         await JVMDaemon.stop()
         await bm.stop()
+        if ms:
+            await ms.stop()
 
 
 def generate_runs(topics_file: str, output_file: str, team_id: str = "SCIAI", 
@@ -0,0 +1,8 @@
+"""
+Offline simulation of the IR loop's rate‑limit and agent scheduling stack.
+
+Runs the real buckets, gated wrappers and `ContextProctor` on a virtual
+clock against synthetic LLM, Cohere and JVM daemon services.
+
+    python -m src.Simulation.simulate --help
+"""
@@ -0,0 +1,268 @@
+"""
+fakes.py
+~~~~~~~~
+Synthetic stand‑ins for the external services of the IR loop.
+
+* `FakeAzureClient` – answers ``client.responses.with_raw_response.create``
+  with contract‑shaped output (SEARCH / SELECT / UPDATE / FINAL are told
+  apart by the contract header the prompt starts with).  Latency and output tokens
+  are drawn from per‑stage `StageProfile`s; input tokens include the
+  server‑side history chained through ``previous_response_id``.  With
+  ``stream=True`` the text arrives as deltas over the generation time.
+* `FakeCohere` – ``post()`` for ``/v2/rerank`` with a sampled latency.
+* `FakeDaemon` – replacements for `JVMDaemon.run_bm25_search` and
+  `JVMDaemon.select_documents`.
+
+The fake server never throttles; it trusts the client‑side buckets, so
+waits measured in a simulation are the gate's waits only.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import random
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from src.IR_Ensemble.QA_Assistant.answer_contracts import (
+    SEARCH_TURN,
+    SELECT_TURN,
+    UPDATE_TURN,
+    FINAL_TURN,
+)
+from src.IR_Ensemble.QA_Assistant.token_estimator import token_estimator
+
+
+# ───────────────────────────────────────── distributions ──────────────────────
+
+@dataclass
+class Dist:
+    """Log‑normal around *median* (``sigma`` = 0 → constant)."""
+    median: float
+    sigma: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        return self.median * math.exp(self.sigma * rng.gauss(0.0, 1.0))
+
+
+@dataclass
+class StageProfile:
+    """Output size and latency of one LLM stage."""
+    output_tokens: Dist
+    first_token: Dist = field(default_factory=lambda: Dist(0.8, 0.3))
+    tokens_per_sec: float = 80.0
+
+
+DEFAULT_PROFILES: Dict[str, StageProfile] = {
+    "SEARCH_CALL": StageProfile(Dist(350, 0.4)),
+    "SELECT_CALL": StageProfile(Dist(150, 0.4)),
+    "UPDATE_CALL": StageProfile(Dist(1_800, 0.5)),
+    "FINAL_CALL":  StageProfile(Dist(300, 0.4)),
+}
+
+_CONTRACTS = (
+    (SEARCH_TURN, "SEARCH_CALL"),
+    (SELECT_TURN, "SELECT_CALL"),
+    (UPDATE_TURN, "UPDATE_CALL"),
+    (FINAL_TURN, "FINAL_CALL"),
+)
+CACHE_MIN_TOKENS = 1_024   # shortest prefix the provider's prompt cache serves
+STREAM_CHUNKS = 16         # text deltas per streamed response
+_SEGMENT_RE = re.compile(r'"segment_id":\s*"([^"]+)"')
+
+
+def stage_of(prompt: str) -> str:
+    """Which LoopStage a prompt belongs to, from the contract header it starts with."""
+    for contract, stage in _CONTRACTS:
+        if prompt.startswith(contract):
+            return stage
+    return "UNKNOWN"
+
+
+def _tag(text: str, tag: str) -> Optional[str]:
+    start, end = f"<{tag}>", f"</{tag}>"
+    if start in text and end in text:
+        return text.split(start, 1)[1].split(end, 1)[0]
+    return None
+
+
+# ───────────────────────────────────────── Azure OpenAI ───────────────────────
+
+class FakeAzureClient:
+    """Just enough of `AsyncAzureOpenAI` for `gated_response`."""
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        rng: random.Random,
+        profiles: Dict[str, StageProfile] = DEFAULT_PROFILES,
+        finish_prob: float = 0.35,
+        on_create: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.base_url = base_url
+        self.rng = rng
+        self.profiles = profiles
+        self.finish_prob = finish_prob
+        self.on_create = on_create
+        self.calls: Dict[str, int] = {}
+        self._next_id = 0
+        self._context: Dict[str, int] = {}          # response id → tokens in its thread
+        self._questions: Dict[str, List[str]] = {}  # response id → questions in play
+        self.responses = SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self._create)
+        )
+
+    async def _create(self, *, input: str, model: str, max_output_tokens: int,
+                      instructions: str = "", previous_response_id: Optional[str] = None,
+                      stream: bool = False, **_: Any):
+        stage = stage_of(input)
+        if self.on_create:
+            self.on_create(stage)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        profile = self.profiles.get(stage, DEFAULT_PROFILES["SELECT_CALL"])
+
+        out_tokens = max(1, min(max_output_tokens, int(profile.output_tokens.sample(self.rng))))
+        first_token = profile.first_token.sample(self.rng)
+        generate = out_tokens / profile.tokens_per_sec
+        if not stream:
+            await asyncio.sleep(first_token + generate)
+
+        # Instructions are not carried along the response chain, the thread is
+        history = self._context.get(previous_response_id, 0)
+        prefix = token_estimator.estimate(instructions) + history
+        in_tokens = prefix + token_estimator.estimate(input)
+        cached = prefix if prefix >= CACHE_MIN_TOKENS else 0
+        questions = self._questions.get(previous_response_id) or self._parse_questions(input)
+        text, questions = self._output(stage, input, questions)
+
+        self._next_id += 1
+        resp_id = f"resp_sim_{self._next_id}"
+        self._context[resp_id] = history + token_estimator.estimate(input) + out_tokens
+        self._questions[resp_id] = questions
+
+        usage = SimpleNamespace(input_tokens=in_tokens, output_tokens=out_tokens,
+                                total_tokens=in_tokens + out_tokens,
+                                input_tokens_details=SimpleNamespace(cached_tokens=cached))
+        response = SimpleNamespace(id=resp_id, output_text=text, usage=usage)
+        if stream:
+            return SimpleNamespace(headers={},
+                                   parse=lambda: self._stream(text, response, first_token, generate))
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+    @staticmethod
+    async def _stream(text: str, response: Any, first_token: float, generate: float,
+                      chunks: int = STREAM_CHUNKS):
+        """Responses API stream events: text deltas spread over the generation time."""
+        await asyncio.sleep(first_token)
+        step = max(1, -(-len(text) // chunks))
+        for i in range(0, len(text), step):
+            await asyncio.sleep(generate * step / len(text))
+            yield SimpleNamespace(type="response.output_text.delta", delta=text[i:i + step])
+        yield SimpleNamespace(type="response.completed", response=response)
+
+    # ───────────────────────────── output shapes ─────────────────────────
+    @staticmethod
+    def _parse_questions(prompt: str) -> List[str]:
+        """Ids of the questions still open in *prompt*."""
+        block = _tag(prompt, "questions")
+        if block is not None:
+            lines = [q for q in block.split("\n") if q.strip()]
+            return [json.loads(q).get("id", f"q{i + 1}") for i, q in enumerate(lines)]
+        answer = _tag(prompt, "current_answer")
+        try:
+            return [q.get("id", "") for q in json.loads(answer)["questions"]]
+        except Exception:  # noqa: BLE001 – unparseable answer → one question
+            return ["q1"]
+
+    def _output(self, stage: str, prompt: str, questions: List[str]):
+        rng = self.rng
+        if stage == "SEARCH_CALL":
+            searches = [{"queries": [f"kw{i}_{j}" for j in range(3)], "master_query": f"mq{i}"}
+                        for i in range(2)]
+            return f"<cot>ok</cot><answer>{json.dumps({'searches': searches})}</answer>", questions
+        if stage == "SELECT_CALL":
+            ids = list(dict.fromkeys(_SEGMENT_RE.findall(prompt)))[:6]
+            return f"<cot>ok</cot><answer>{json.dumps({'selections': ids})}</answer>", questions
+        if stage == "UPDATE_CALL":
+            upserts = [{"id": q, "answer": {"text": "simulated", "citations": []},
+                        "finished": rng.random() < self.finish_prob}
+                       for q in questions]
+            remaining = [q["id"] for q in upserts if not q["finished"]]
+            payload = {"upserts": upserts, "round": {"summary": "simulated", "seen_ids": []}}
+            return f"<cot>ok</cot><answer>{json.dumps(payload)}</answer>", remaining
+        return "<cot>ok</cot><summary>simulated summary</summary>", questions
+
+
+# ───────────────────────────────────────── Cohere ─────────────────────────────
+
+class _FakeHttpResponse:
+    def __init__(self, body: Dict[str, Any]) -> None:
+        self.status_code = 200
+        self.headers: Dict[str, str] = {}
+        self._body = body
+
+    def json(self) -> Dict[str, Any]:
+        return self._body
+
+    def raise_for_status(self) -> None:
+        return None
+
+
+class FakeCohere:
+    """Replaces `Searcher.cohere_client`; only ``post`` to ``/v2/rerank`` is used."""
+
+    def __init__(self, *, rng: random.Random, latency: Dist = Dist(0.6, 0.3),
+                 on_post: Optional[Callable[[], None]] = None) -> None:
+        self.rng = rng
+        self.latency = latency
+        self.on_post = on_post
+        self.calls = 0
+
+    async def post(self, url: str, *, headers=None, json=None, **_: Any) -> _FakeHttpResponse:
+        if self.on_post:
+            self.on_post()
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample(self.rng))
+        n = len(json.get("documents", []))
+        top_n = min(json.get("top_n", n), n)
+        scores = sorted((self.rng.random() for _ in range(top_n)), reverse=True)
+        order = self.rng.sample(range(n), top_n)
+        return _FakeHttpResponse({"results": [{"index": i, "relevance_score": s}
+                                              for i, s in zip(order, scores)]})
+
+    async def aclose(self) -> None:
+        return None
+
+
+# ───────────────────────────────────────── JVM daemon ─────────────────────────
+
+class FakeDaemon:
+    """Synthetic BM25 search / document selection with sampled latency."""
+
+    def __init__(self, *, rng: random.Random, search_latency: Dist = Dist(1.5, 0.5),
+                 select_latency: Dist = Dist(0.3, 0.3), hits: int = 100) -> None:
+        self.rng = rng
+        self.search_latency = search_latency
+        self.select_latency = select_latency
+        self.hits = hits
+        self.calls = {"search": 0, "selectDocuments": 0}
+
+    async def run_bm25_search(self, queries: List[str], out_path: Path) -> None:
+        self.calls["search"] += 1
+        await asyncio.sleep(self.search_latency.sample(self.rng))
+        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            for _ in range(self.hits):
+                docid = f"msmarco_v2.1_sim_{self.rng.randrange(10**6)}"
+                f.write(json.dumps({"docid": docid, "title": "t", "url": "u",
+                                    "headings": "h", "segment": "lorem ipsum " * 40}) + "\n")
+
+    async def select_documents(self, segment_ids: List[str], is_segment: bool) -> List[dict]:
+        self.calls["selectDocuments"] += 1
+        await asyncio.sleep(self.select_latency.sample(self.rng))
+        return [{"segment_id": sid, "segment": "lorem ipsum " * 120} for sid in segment_ids]
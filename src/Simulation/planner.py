@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Capacity planner – run telemetry → concurrency settings.
+
+Reads what `BucketMonitor` wrote during a real run:
+
+* ``call_events.jsonl`` – raw `call_metrics` events: per gated call its
+  reserved / used / output tokens, queue wait and API latency (tagged by
+  stage, model and topic), JVM daemon round trips and 429s.
+* ``bucket_usage.jsonl`` (optional) – peak utilisation per bucket, shown
+  next to the prediction.
+
+From those it fits per‑stage token and latency distributions and the
+per‑topic demand on every rate‑limited resource, then recommends:
+
+1. ``max_output_tokens`` per `LoopStage` – observed p99 output × ``MARGIN``,
+   rounded up to ``ROUND_TO`` and never below the largest output seen.
+2. The sustainable throughput: for every bucket, ``HEADROOM × capacity ÷
+   demand per topic``; the smallest one is the predicted bottleneck.
+3. Topics at once – Little's law on that throughput and the observed
+   topic duration.
+4. ``ContextProctor.MAX_WORKERS`` / ``BATCH_SIZE`` – a `simulate` sweep
+   with the fitted profiles; the cheapest setting within ``NEAR_BEST`` of the
+   best topics/min wins (extra concurrency only adds queueing, and queueing
+   near the cap is where estimate drift turns into 429s).
+
+Usage
+-----
+    python -m src.Simulation.planner DerivedData/call_events.jsonl \\
+        --usage DerivedData/bucket_usage.jsonl --out planner_settings.json
+    python -m src.Simulation.planner call_events.jsonl --tpm gpt-4.1=80000 --no-simulate
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.IR_Ensemble.context_builder import ContextProctor
+from src.IR_Ensemble.QA_Assistant.quotas import DEFAULT_QUOTA, QUOTAS
+from src.IR_Ensemble.QA_Assistant.rate_limits import COHERE_RERANK_CAP, WINDOW, LoopStage
+from src.IR_Ensemble.QA_Assistant.telemetry import read_rows
+from src.Simulation.fakes import DEFAULT_PROFILES, Dist, StageProfile
+from src.Simulation.simulate import RERANK, Scenario, _parse_quota, run_simulation
+
+# ───────────────────────────────────────── config ────────────────────────────
+HEADROOM: float = 0.85          # plan to this share of every quota
+MARGIN: float = 1.2             # max_output_tokens = p99 output × MARGIN
+ROUND_TO: int = 250
+NEAR_BEST: float = 0.97         # accept the cheapest setting within 3 % of the best
+MIN_CALLS: int = 5              # fewer samples → keep the stage's defaults
+
+WORKER_CHOICES: Tuple[int, ...] = (2, 3, 5, 8)
+BATCH_CHOICES: Tuple[int, ...] = (1, 2, 3, 5)
+
+# Stages served by the report deployment; every other stage hits the IR one
+ENDPOINT_OF: Dict[str, str] = {
+    "REPORT_GEN": "AZURE_OPENAI_ENDPOINT",
+    "REPORT_EVAL": "AZURE_OPENAI_ENDPOINT",
+}
+IR_ENDPOINT = "IR_AZURE_OPENAI_ENDPOINT"
+DAEMON_CALLS = {"search": "search_latency", "selectDocuments": "select_latency"}
+
+
+# ───────────────────────────────────────── fitting ────────────────────────────
+
+def _quantile(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def fit_lognormal(xs: Iterable[float]) -> Optional[Dist]:
+    """Log‑normal `Dist` (median, sigma) of the positive samples, None if empty."""
+    logs = [math.log(x) for x in xs if x and x > 0]
+    if not logs:
+        return None
+    mu = sum(logs) / len(logs)
+    var = sum((v - mu) ** 2 for v in logs) / len(logs)
+    return Dist(round(math.exp(mu), 3), round(math.sqrt(var), 3))
+
+
+@dataclass
+class StageFit:
+    """What one stage spent per call, over the whole run."""
+    stage: str
+    model: Optional[str]
+    calls: int = 0                       # successful calls
+    attempts: int = 0                    # gated attempts (incl. failed ones)
+    used: List[float] = field(default_factory=list)
+    output: List[float] = field(default_factory=list)
+    latency: List[float] = field(default_factory=list)
+    queue_wait: List[float] = field(default_factory=list)
+
+    def profile(self) -> Optional[StageProfile]:
+        """`StageProfile` for the simulator: latency ≈ first token + output ÷ rate."""
+        out = fit_lognormal(self.output)
+        if out is None or len(self.output) < MIN_CALLS:
+            return None
+        pairs = list(zip(self.output, self.latency))
+        tps = DEFAULT_PROFILES["SEARCH_CALL"].tokens_per_sec
+        if len(pairs) >= MIN_CALLS:
+            mx = sum(o for o, _ in pairs) / len(pairs)
+            my = sum(l for _, l in pairs) / len(pairs)
+            sxx = sum((o - mx) ** 2 for o, _ in pairs)
+            slope = sum((o - mx) * (l - my) for o, l in pairs) / sxx if sxx else 0.0
+            if slope > 0:
+                tps = 1.0 / slope
+        first = fit_lognormal(l - o / tps for o, l in pairs) or Dist(0.8, 0.3)
+        return StageProfile(out, first_token=first, tokens_per_sec=round(tps, 1))
+
+
+@dataclass
+class RunFit:
+    """Per‑stage fits plus per‑topic demand of one run."""
+    stages: Dict[str, StageFit]
+    topics: int
+    topic_seconds: float                 # median span of a topic's events
+    daemon: Dict[str, Dist]
+    throttled: Dict[str, float]
+
+    def per_topic(self, stage: str, attr: str = "attempts") -> float:
+        fit = self.stages.get(stage)
+        return getattr(fit, attr) / self.topics if fit and self.topics else 0.0
+
+
+def fit_run(events: Iterable[Dict[str, Any]]) -> RunFit:
+    """Group raw `call_metrics` events into per‑stage fits."""
+    stages: Dict[str, StageFit] = {}
+    spans: Dict[str, List[float]] = {}
+    daemon: Dict[str, List[float]] = defaultdict(list)
+    throttled: Dict[str, float] = defaultdict(float)
+
+    for ev in events:
+        metric, value = ev.get("metric"), ev.get("value")
+        if metric == "daemon_latency_s":
+            daemon[ev.get("call", "?")].append(value)
+            continue
+        if metric == "throttled":
+            throttled[ev.get("bucket", "?")] += value
+            continue
+        stage = ev.get("stage")
+        if stage is None:
+            continue
+        fit = stages.setdefault(stage, StageFit(stage, ev.get("model")))
+        if ev.get("topic") is not None:
+            lo_hi = spans.setdefault(ev["topic"], [ev["ts"], ev["ts"]])
+            lo_hi[0], lo_hi[1] = min(lo_hi[0], ev["ts"]), max(lo_hi[1], ev["ts"])
+        if metric == "reserved_tokens":
+            fit.attempts += 1
+        elif metric == "used_tokens":
+            fit.calls += 1
+            fit.used.append(value)
+        elif metric == "output_tokens":
+            fit.output.append(value)
+        elif metric == "call_latency_s":
+            fit.latency.append(value)
+        elif metric == "queue_wait_s":
+            fit.queue_wait.append(value)
+            if stage == RERANK:
+                fit.attempts += 1          # rerank reserves requests, not tokens
+                fit.calls += 1
+
+    return RunFit(
+        stages=stages,
+        topics=len(spans),
+        topic_seconds=_quantile([hi - lo for lo, hi in spans.values()], 0.5),
+        daemon={call: d for call, xs in daemon.items() if (d := fit_lognormal(xs))},
+        throttled=dict(throttled),
+    )
+
+
+# ───────────────────────────────────────── planning ───────────────────────────
+
+def max_output_tokens(fit: RunFit) -> Dict[str, int]:
+    """Recommended ``max_output_tokens`` per `LoopStage` with enough samples."""
+    out: Dict[str, int] = {}
+    for stage in LoopStage:
+        f = fit.stages.get(stage.name)
+        if not f or len(f.output) < MIN_CALLS:
+            continue
+        want = max(_quantile(f.output, 0.99) * MARGIN, max(f.output))
+        out[stage.name] = int(math.ceil(want / ROUND_TO) * ROUND_TO)
+    return out
+
+
+def resource_ceilings(fit: RunFit,
+                      overrides: Dict[str, Dict[str, int]] | None = None) -> Dict[str, float]:
+    """Sustainable topics/min each rate‑limited resource allows on its own."""
+    overrides = overrides or {}
+    per_min = 60.0 / WINDOW
+    demand: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(lambda: {"rpm": 0.0, "tpm": 0.0})
+    ceilings: Dict[str, float] = {}
+
+    for name, f in fit.stages.items():
+        if name == RERANK:
+            rerank = fit.per_topic(name)
+            if rerank:
+                ceilings["cohere:rerank"] = HEADROOM * COHERE_RERANK_CAP * per_min / rerank
+            continue
+        key = (ENDPOINT_OF.get(name, IR_ENDPOINT), f.model or "")
+        demand[key]["rpm"] += fit.per_topic(name)
+        demand[key]["tpm"] += sum(f.used) / fit.topics if fit.topics else 0.0
+
+    for (endpoint, model), need in demand.items():
+        quota = {**QUOTAS.get((endpoint, model), DEFAULT_QUOTA), **overrides.get(model, {})}
+        for kind in ("rpm", "tpm"):
+            if need[kind]:
+                ceilings[f"{model}@{endpoint}:{kind}"] = HEADROOM * quota[kind] * per_min / need[kind]
+    return ceilings
+
+
+@dataclass
+class Plan:
+    topics_per_hour: float
+    bottleneck: str
+    topics_at_once: int
+    max_workers: int
+    batch_size: int
+    max_output_tokens: Dict[str, int]
+    ceilings: Dict[str, float]
+    simulated: List[Dict[str, Any]] = field(default_factory=list)
+
+    def settings(self) -> Dict[str, Any]:
+        return {
+            "MAX_TOPICS": self.topics_at_once,
+            "ContextProctor.MAX_WORKERS": self.max_workers,
+            "ContextProctor.BATCH_SIZE": self.batch_size,
+            "max_output_tokens": self.max_output_tokens,
+        }
+
+
+def _scenario(fit: RunFit, max_out: Dict[str, int], questions: int,
+              overrides: Dict[str, Dict[str, int]]) -> Scenario:
+    """A `Scenario` driven by the fitted profiles instead of the defaults."""
+    profiles = dict(DEFAULT_PROFILES)
+    for stage in profiles:
+        fitted = fit.stages.get(stage)
+        profile = fitted.profile() if fitted else None
+        if profile:
+            profiles[stage] = profile
+    extra: Dict[str, Any] = {
+        attr: fit.daemon[call] for call, attr in DAEMON_CALLS.items() if call in fit.daemon
+    }
+    rerank = fit.stages.get(RERANK)
+    if rerank and (latency := fit_lognormal(rerank.latency)):
+        extra["rerank_latency"] = latency
+    return Scenario(name="fitted", questions_per_topic=questions, quotas=overrides,
+                    max_output=max_out, profiles=profiles, **extra)
+
+
+def plan(fit: RunFit, *, questions: int = 6, overrides: Dict[str, Dict[str, int]] | None = None,
+         simulate: bool = True, sim_topics: int = 10) -> Plan:
+    """Turn a `RunFit` into recommended settings (see module docstring)."""
+    overrides = overrides or {}
+    max_out = max_output_tokens(fit)
+    ceilings = resource_ceilings(fit, overrides)
+    if ceilings:
+        bottleneck, per_min = min(ceilings.items(), key=lambda kv: kv[1])
+    else:
+        bottleneck, per_min = "none observed", 0.0
+    duration = fit.topic_seconds
+    at_once = max(1, math.ceil(per_min * duration / 60.0)) if duration and per_min else 1
+
+    result = Plan(topics_per_hour=round(per_min * 60.0, 1), bottleneck=bottleneck,
+                  topics_at_once=at_once, max_workers=ContextProctor.MAX_WORKERS,
+                  batch_size=ContextProctor.BATCH_SIZE, max_output_tokens=max_out,
+                  ceilings={k: round(v * 60.0, 1) for k, v in ceilings.items()})
+    if not simulate:
+        return result
+
+    base = replace(_scenario(fit, max_out, questions, overrides), topics=sim_topics,
+                   topic_concurrency=min(at_once, sim_topics))
+    runs = []
+    for workers, batch in product(WORKER_CHOICES, BATCH_CHOICES):
+        report = run_simulation(replace(base, name=f"workers={workers} batch={batch}",
+                                        max_workers=workers, batch_size=batch))
+        runs.append({"max_workers": workers, "batch_size": batch,
+                     "topics_per_min": round(report.topics_per_min, 3),
+                     "shed": sum(report.shed.values())})
+    result.simulated = runs
+    clean = [r for r in runs if not r["shed"]] or runs
+    best = max(r["topics_per_min"] for r in clean)
+    # Cheapest = fewest agents in flight, then fewest batches
+    pick = min((r for r in clean if r["topics_per_min"] >= NEAR_BEST * best),
+               key=lambda r: (r["max_workers"], -r["batch_size"]))
+    result.max_workers, result.batch_size = pick["max_workers"], pick["batch_size"]
+    return result
+
+
+# ───────────────────────────────────────── report ─────────────────────────────
+
+def _peaks(path: Optional[str]) -> Dict[str, float]:
+    """Peak load ÷ capacity per bucket of a ``bucket_usage.jsonl``."""
+    peaks: Dict[str, float] = {}
+    if not path or not os.path.exists(path):
+        return peaks
+    for row in read_rows(path):
+        if row.get("capacity"):
+            util = row["load"] / row["capacity"]
+            peaks[row["bucket"]] = max(peaks.get(row["bucket"], 0.0), util)
+    return peaks
+
+
+def summary(fit: RunFit, result: Plan, peaks: Dict[str, float]) -> str:
+    lines = [f"{fit.topics} topics, median topic {fit.topic_seconds:,.0f}s",
+             f"  {'stage':<14}{'calls/topic':>12}{'out p50':>9}{'out p99':>9}"
+             f"{'used p95':>10}{'lat p50':>9}{'lat p95':>9}{'wait p95':>10}"]
+    for name, f in sorted(fit.stages.items()):
+        lines.append(f"  {name:<14}{fit.per_topic(name, 'calls'):>12.1f}"
+                     f"{_quantile(f.output, 0.5):>9.0f}{_quantile(f.output, 0.99):>9.0f}"
+                     f"{_quantile(f.used, 0.95):>10.0f}{_quantile(f.latency, 0.5):>9.1f}"
+                     f"{_quantile(f.latency, 0.95):>9.1f}{_quantile(f.queue_wait, 0.95):>10.1f}")
+    for call, d in sorted(fit.daemon.items()):
+        lines.append(f"  daemon {call:<20} median {d.median:.2f}s  sigma {d.sigma:.2f}")
+    lines.append(f"  {'resource':<48}{'topics/hour':>12}")
+    for name, per_hour in sorted(result.ceilings.items(), key=lambda kv: kv[1]):
+        lines.append(f"  {name:<48}{per_hour:>12.1f}")
+    for bucket, n in sorted(fit.throttled.items()):
+        lines.append(f"  429s on {bucket}: {n:.0f}")
+    for bucket, peak in sorted(peaks.items()):
+        lines.append(f"  observed peak {bucket:<40}{peak:>6.0%}")
+    lines += [
+        f"bottleneck: {result.bottleneck} → {result.topics_per_hour:,.1f} topics/hour "
+        f"at {HEADROOM:.0%} of quota",
+        f"recommend: MAX_TOPICS={result.topics_at_once}  "
+        f"ContextProctor.MAX_WORKERS={result.max_workers}  BATCH_SIZE={result.batch_size}",
+    ]
+    for stage, tokens in sorted(result.max_output_tokens.items()):
+        lines.append(f"  {stage}.max_output_tokens = {tokens:,} "
+                     f"(now {LoopStage[stage].value[0]['max_output_tokens']:,})")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Recommend concurrency settings from run telemetry.")
+    ap.add_argument("events", help="call_events.jsonl written by BucketMonitor")
+    ap.add_argument("--usage", help="bucket_usage.jsonl of the same run (optional)")
+    ap.add_argument("--questions", type=int, default=6, help="questions per ContextProctor call")
+    ap.add_argument("--rpm", action="append", metavar="DEPLOYMENT=N")
+    ap.add_argument("--tpm", action="append", metavar="DEPLOYMENT=N")
+    ap.add_argument("--no-simulate", action="store_true", help="skip the worker / batch sweep")
+    ap.add_argument("--sim-topics", type=int, default=10)
+    ap.add_argument("--out", help="write the recommended settings as JSON")
+    args = ap.parse_args(argv)
+
+    overrides: Dict[str, Dict[str, int]] = {}
+    _parse_quota(args.rpm, "rpm", overrides)
+    _parse_quota(args.tpm, "tpm", overrides)
+
+    fit = fit_run(read_rows(args.events))
+    if not fit.stages:
+        raise SystemExit(f"No gated calls in {args.events}")
+    result = plan(fit, questions=args.questions, overrides=overrides,
+                  simulate=not args.no_simulate, sim_topics=args.sim_topics)
+    print(summary(fit, result, _peaks(args.usage)))
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({
+            "topics_per_hour": result.topics_per_hour,
+            "bottleneck": result.bottleneck,
+            "settings": result.settings(),
+            "ceilings_topics_per_hour": result.ceilings,
+            "simulated": result.simulated,
+        }, indent=2), encoding="utf-8")
+        print(f"settings written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
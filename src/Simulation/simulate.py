@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Discrete‑event simulation of the IR loop's rate‑limit and scheduling stack.
+
+The *real* `ContextProctor`, `BaseAgent`, `gated_response`,
+`gated_cohere_rerank_call` and `AsyncTokenBucket` code runs on a virtual
+clock (`virtual_clock`) against synthetic Azure OpenAI, Cohere and JVM
+daemon services (`fakes`).  Bucket capacities, ContextProctor settings,
+stage reservations and topic concurrency come from a `Scenario`, so
+scheduling policies can be compared offline in seconds without spending
+quota.
+
+Reported per scenario: topics/minute, per‑stage gate wait (p50 / p95 /
+max), shed calls and bucket utilisation (mean / peak load ÷ capacity).
+
+Usage
+-----
+    python -m src.Simulation.simulate --topics 10 --questions 6
+    python -m src.Simulation.simulate --sweep max_workers=3,5,8
+    python -m src.Simulation.simulate --tpm gpt-4.1=100000 --budget 600
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextvars
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field, fields, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from src.IR_Ensemble.context_builder import ContextProctor
+from src.IR_Ensemble.QA_Assistant import adaptive_limits, base, rate_limits
+from src.IR_Ensemble.QA_Assistant import Searcher
+from src.IR_Ensemble.QA_Assistant.admission import AdmissionRejected
+from src.IR_Ensemble.QA_Assistant.answer_cache import answer_cache
+from src.IR_Ensemble.QA_Assistant.bucket_pool import AssistantBucketPool
+from src.IR_Ensemble.QA_Assistant.daemon_wrapper import JVMDaemon
+from src.IR_Ensemble.QA_Assistant.quotas import QUOTAS, QuotaRegistry, _host
+from src.IR_Ensemble.QA_Assistant.rate_limits import (
+    COHERE_RERANK_CAP,
+    PERSONAL_TOK_CAP,
+    WINDOW,
+    LoopStage,
+)
+from src.IR_Ensemble.QA_Assistant.shared_state import shared_state
+from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
+from src.IR_Ensemble.QA_Assistant.token_estimator import token_estimator
+from src.IR_Ensemble.QA_Assistant.usage_estimator import OutputTokenEstimator
+from src.Simulation.fakes import (
+    DEFAULT_PROFILES,
+    Dist,
+    FakeAzureClient,
+    FakeCohere,
+    FakeDaemon,
+    StageProfile,
+)
+from src.Simulation.virtual_clock import VirtualClock, VirtualEventLoop, virtual_time
+
+RERANK = "COHERE_RERANK"
+
+
+# ───────────────────────────────────────── scenario ───────────────────────────
+
+@dataclass
+class Scenario:
+    """Everything a simulation run may vary."""
+    name: str = "baseline"
+    topics: int = 10
+    topic_concurrency: int = 10          # topics in flight at once (main.py: all)
+    questions_per_topic: int = 6
+    # ContextProctor
+    max_workers: int = ContextProctor.MAX_WORKERS
+    stagger_sec: float = ContextProctor.STAGGER_SEC
+    batch_size: int = ContextProctor.BATCH_SIZE
+    budget: Optional[float] = None       # CONTEXT_BUDGET_SEC
+    # Buckets – deployment → {"rpm": …, "tpm": …} overrides of quotas.QUOTAS
+    quotas: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    personal_cap: int = PERSONAL_TOK_CAP
+    cohere_cap: int = COHERE_RERANK_CAP
+    # LoopStage name → max_output_tokens override
+    max_output: Dict[str, int] = field(default_factory=dict)
+    # Synthetic services
+    profiles: Dict[str, StageProfile] = field(default_factory=lambda: dict(DEFAULT_PROFILES))
+    finish_prob: float = 0.35            # chance UPDATE marks a question finished
+    rerank_latency: Dist = field(default_factory=lambda: Dist(0.6, 0.3))
+    search_latency: Dist = field(default_factory=lambda: Dist(1.5, 0.5))
+    select_latency: Dist = field(default_factory=lambda: Dist(0.3, 0.3))
+    # Harness
+    exact_tokens: bool = False           # tiktoken for static strings (needs the BPE file)
+    sample_every: float = 1.0            # virtual seconds between utilisation samples
+    seed: int = 0
+    verbose: bool = False
+
+
+@dataclass
+class SimReport:
+    scenario: str
+    topics: int
+    makespan: float                      # virtual seconds
+    wall: float                          # real seconds the simulation took
+    topic_times: List[float]
+    waits: Dict[str, List[float]]
+    shed: Dict[str, int]
+    calls: Dict[str, int]
+    utilisation: Dict[str, List[float]]
+
+    @property
+    def topics_per_min(self) -> float:
+        return 60.0 * self.topics / self.makespan if self.makespan else 0.0
+
+    def summary(self) -> str:
+        lines = [
+            f"scenario {self.scenario}: {self.topics} topics in {self.makespan:,.1f}s virtual "
+            f"({self.wall:.2f}s wall) → {self.topics_per_min:.2f} topics/min",
+            f"  {'stage':<16}{'calls':>7}{'shed':>6}{'wait p50':>10}{'wait p95':>10}{'wait max':>10}",
+        ]
+        for stage in sorted(set(self.waits) | set(self.shed)):
+            w = self.waits.get(stage, [])
+            lines.append(f"  {stage:<16}{self.calls.get(stage, 0):>7}{self.shed.get(stage, 0):>6}"
+                         f"{_pct(w, 0.5):>10.1f}{_pct(w, 0.95):>10.1f}{max(w, default=0):>10.1f}")
+        lines.append(f"  {'bucket':<40}{'mean util':>10}{'peak util':>10}")
+        for label, samples in sorted(self.utilisation.items()):
+            if any(samples):
+                lines.append(f"  {label:<40}{sum(samples) / len(samples):>10.0%}{max(samples):>10.0%}")
+        return "\n".join(lines)
+
+
+def _pct(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+# ───────────────────────────────────────── harness ────────────────────────────
+
+_MISSING = object()
+_CALL: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("sim_call", default=None)
+
+
+class _Patches:
+    """Attribute / env / dict patches undone in reverse order on exit."""
+
+    def __init__(self) -> None:
+        self._undo: List[Callable[[], None]] = []
+
+    def __enter__(self) -> "_Patches":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        while self._undo:
+            self._undo.pop()()
+
+    def set(self, obj: Any, attr: str, value: Any) -> None:
+        old = vars(obj).get(attr, _MISSING)
+        setattr(obj, attr, value)
+        self._undo.append(lambda: delattr(obj, attr) if old is _MISSING else setattr(obj, attr, old))
+
+    def item(self, mapping: Dict[str, Any], key: str, value: Any) -> None:
+        old = mapping.get(key, _MISSING)
+        mapping[key] = value
+        self._undo.append(lambda: mapping.pop(key) if old is _MISSING else mapping.__setitem__(key, old))
+
+    def env(self, key: str, value: Optional[str]) -> None:
+        old = os.environ.get(key)
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+        self._undo.append(lambda: os.environ.pop(key, None) if old is None
+                          else os.environ.__setitem__(key, old))
+
+
+class _Recorder:
+    """Collects gate waits, shed calls and bucket utilisation on the virtual clock."""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+        self.waits: Dict[str, List[float]] = {}
+        self.shed: Dict[str, int] = {}
+        self.calls: Dict[str, int] = {}
+        self.utilisation: Dict[str, List[float]] = {}
+        self.topic_times: List[float] = []
+
+    def timed(self, fn: Callable[..., Any], key: Callable[[Dict[str, Any]], str]):
+        """Wrap a gated wrapper: remember when the call entered the gate."""
+        async def wrapper(*args, **kwargs):
+            label = key(kwargs)
+            token = _CALL.set({"stage": label, "t0": self.clock.now, "seen": False})
+            try:
+                return await fn(*args, **kwargs)
+            except AdmissionRejected:
+                self.shed[label] = self.shed.get(label, 0) + 1
+                raise
+            finally:
+                _CALL.reset(token)
+        return wrapper
+
+    def started(self, stage: Optional[str] = None) -> None:
+        """Called by a fake service when a request leaves the gate (first attempt only)."""
+        call = _CALL.get()
+        if call is None or call["seen"]:
+            return
+        call["seen"] = True
+        label = call["stage"]
+        self.calls[label] = self.calls.get(label, 0) + 1
+        self.waits.setdefault(label, []).append(self.clock.now - call["t0"])
+
+    def sample(self) -> None:
+        def put(label: str, bucket: AsyncTokenBucket) -> None:
+            self.utilisation.setdefault(label, []).append(bucket.current_load() / bucket.capacity)
+        for label, req, tok in rate_limits.quota_registry.items():
+            put(f"{label}:req", req)
+            put(f"{label}:tok", tok)
+        put("cohere:rerank", rate_limits.cohere_bucket[0])
+
+    async def sample_forever(self, every: float) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(every)
+
+
+async def _quiet_log(self, msg: str, *, _file: Optional[str] = None) -> None:
+    return None
+
+
+def _install(p: _Patches, s: Scenario, rec: _Recorder, tmp: Path, rng: random.Random):
+    """Point the pipeline's globals at fresh buckets and the fake services."""
+    # Fresh, process‑local rate‑limit state
+    p.env("RATE_LIMIT_STATE", None)
+    shared_state.cache_clear()
+    quotas = {key: {**quota, **s.quotas.get(key[1], {})} for key, quota in QUOTAS.items()}
+    p.set(rate_limits, "quota_registry", QuotaRegistry(quotas, window=WINDOW))
+    p.set(rate_limits, "assistant_tok_limiters", AssistantBucketPool(s.personal_cap, WINDOW))
+    p.set(rate_limits, "cohere_bucket", [AsyncTokenBucket(s.cohere_cap, WINDOW), "sim"])
+    p.set(rate_limits, "output_estimator", OutputTokenEstimator())
+    p.set(adaptive_limits, "_controllers", {})
+    for stage, max_out in s.max_output.items():
+        p.item(LoopStage[stage].value[0], "max_output_tokens", max_out)
+
+    # Token counting without background threads (and, by default, without tiktoken)
+    p.set(token_estimator, "calibrate_soon", lambda text: None)
+    if not s.exact_tokens:
+        for module in (rate_limits, base):
+            p.set(module, "count_static_tokens", token_estimator.estimate)
+
+    # ContextProctor policy
+    p.set(ContextProctor, "MAX_WORKERS", s.max_workers)
+    p.set(ContextProctor, "STAGGER_SEC", s.stagger_sec)
+    p.set(ContextProctor, "BATCH_SIZE", s.batch_size)
+
+    # Artefacts go to a scratch dir; agent conversation logs are dropped
+    (tmp / "context").mkdir()
+    p.env("BM25_RESULTS_PATH", str(tmp / "search"))
+    p.env("CONTEXT_PATH", str(tmp / "context" / "context"))
+    p.env("CONTEXT_BUDGET_SEC", "" if s.budget is None else str(s.budget))
+    p.env("ANSWER_CACHE_PATH", None)      # every simulated question runs its agent
+    answer_cache.cache_clear()
+    p.set(base, "BM25_RESULTS_PATH", str(tmp / "search"))
+    if not s.verbose:
+        p.set(base.BaseAgent, "_log", _quiet_log)
+
+    # Synthetic services, timed at the gate
+    daemon = FakeDaemon(rng=rng, search_latency=s.search_latency, select_latency=s.select_latency)
+    p.set(JVMDaemon, "run_bm25_search", daemon.run_bm25_search)
+    p.set(JVMDaemon, "select_documents", daemon.select_documents)
+    p.set(Searcher, "cohere_client", FakeCohere(rng=rng, latency=s.rerank_latency, on_post=rec.started))
+    p.set(base, "gated_response", rec.timed(rate_limits.gated_response, lambda kw: kw["stage"].name))
+    p.set(Searcher, "gated_cohere_rerank_call", rec.timed(rate_limits.gated_cohere_rerank_call,
+                                                          lambda kw: RERANK))
+
+    endpoint = os.getenv("IR_AZURE_OPENAI_ENDPOINT", "IR_AZURE_OPENAI_ENDPOINT")
+    return FakeAzureClient(f"https://{_host(endpoint)}/openai/", rng=rng, profiles=s.profiles,
+                           finish_prob=s.finish_prob, on_create=rec.started)
+
+
+async def _drive(s: Scenario, client: FakeAzureClient, rec: _Recorder) -> None:
+    gate = asyncio.Semaphore(s.topic_concurrency)
+    sampler = asyncio.create_task(rec.sample_forever(s.sample_every))
+
+    async def topic(num: int) -> None:
+        async with gate:
+            # Lexically distinct, so question triage merges nothing
+            questions = [{"question": f"topic{num} question{i} " + " ".join(f"term{num}x{i}x{j}" for j in range(4)),
+                          "doc_context": ""}
+                         for i in range(s.questions_per_topic)]
+            await ContextProctor(client, questions, num).create_context()
+            rec.topic_times.append(rec.clock.now)
+
+    try:
+        await asyncio.gather(*(topic(num) for num in range(s.topics)))
+    finally:
+        sampler.cancel()
+
+
+def run_simulation(scenario: Scenario) -> SimReport:
+    """Run one scenario to completion on a virtual clock and report on it."""
+    rng = random.Random(scenario.seed)
+    random.seed(scenario.seed)            # retry jitter
+    clock = VirtualClock()
+    rec = _Recorder(clock)
+    started = time.perf_counter()
+    out = sys.stdout if scenario.verbose else io.StringIO()
+
+    with tempfile.TemporaryDirectory() as tmp, _Patches() as patches, \
+            virtual_time(clock), redirect_stdout(out):
+        client = _install(patches, scenario, rec, Path(tmp), rng)
+        loop = VirtualEventLoop(clock)
+        try:
+            loop.run_until_complete(_drive(scenario, client, rec))
+        finally:
+            loop.close()
+            shared_state.cache_clear()
+            answer_cache.cache_clear()
+
+    return SimReport(
+        scenario=scenario.name,
+        topics=scenario.topics,
+        makespan=clock.now,
+        wall=time.perf_counter() - started,
+        topic_times=rec.topic_times,
+        waits=rec.waits,
+        shed=rec.shed,
+        calls=rec.calls,
+        utilisation=rec.utilisation,
+    )
+
+
+# ───────────────────────────────────────── CLI ────────────────────────────────
+
+def _parse_quota(values: List[str], key: str, quotas: Dict[str, Dict[str, int]]) -> None:
+    for item in values or []:
+        deployment, value = item.split("=", 1)
+        quotas.setdefault(deployment, {})[key] = int(value)
+
+
+def _sweep(base_scenario: Scenario, spec: Optional[str]) -> List[Scenario]:
+    """``field=v1,v2`` → one scenario per value (cast to the field's type)."""
+    if not spec:
+        return [base_scenario]
+    name, values = spec.split("=", 1)
+    if name not in {f.name for f in fields(Scenario)}:
+        raise SystemExit(f"Unknown scenario field: {name}")
+    cast = type(getattr(base_scenario, name)) if getattr(base_scenario, name) is not None else float
+    return [replace(base_scenario, name=f"{name}={v}", **{name: cast(v)}) for v in values.split(",")]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Simulate the IR loop's rate limits offline.")
+    ap.add_argument("--topics", type=int, default=10)
+    ap.add_argument("--concurrency", type=int, default=None, help="topics in flight (default: all)")
+    ap.add_argument("--questions", type=int, default=6, help="questions per topic")
+    ap.add_argument("--max-workers", type=int, default=ContextProctor.MAX_WORKERS)
+    ap.add_argument("--stagger", type=float, default=ContextProctor.STAGGER_SEC)
+    ap.add_argument("--batch-size", type=int, default=ContextProctor.BATCH_SIZE)
+    ap.add_argument("--budget", type=float, default=None, help="CONTEXT_BUDGET_SEC")
+    ap.add_argument("--rpm", action="append", metavar="DEPLOYMENT=N")
+    ap.add_argument("--tpm", action="append", metavar="DEPLOYMENT=N")
+    ap.add_argument("--personal-cap", type=int, default=PERSONAL_TOK_CAP)
+    ap.add_argument("--cohere-cap", type=int, default=COHERE_RERANK_CAP)
+    ap.add_argument("--finish-prob", type=float, default=0.35)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--sweep", metavar="FIELD=V1,V2,...", help="run one scenario per value")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    quotas: Dict[str, Dict[str, int]] = {}
+    _parse_quota(args.rpm, "rpm", quotas)
+    _parse_quota(args.tpm, "tpm", quotas)
+    scenario = Scenario(
+        topics=args.topics,
+        topic_concurrency=args.concurrency or args.topics,
+        questions_per_topic=args.questions,
+        max_workers=args.max_workers,
+        stagger_sec=args.stagger,
+        batch_size=args.batch_size,
+        budget=args.budget,
+        quotas=quotas,
+        personal_cap=args.personal_cap,
+        cohere_cap=args.cohere_cap,
+        finish_prob=args.finish_prob,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+
+    reports = [run_simulation(s) for s in _sweep(scenario, args.sweep)]
+    for report in reports:
+        print(report.summary(), end="\n\n")
+    if len(reports) > 1:
+        print(f"{'scenario':<24}{'topics/min':>12}{'makespan s':>12}")
+        for r in reports:
+            print(f"{r.scenario:<24}{r.topics_per_min:>12.2f}{r.makespan:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
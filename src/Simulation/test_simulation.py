@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline simulator.
+
+* `virtual_clock` – timers jump the clock instead of sleeping
+* `run_simulation` – small, seeded scenarios run end to end and reproducibly
+* `planner` – run telemetry fitted into per‑stage demand and settings
+
+Run with ``python -m pytest src/Simulation/test_simulation.py``.
+"""
+
+import asyncio
+import math
+import time
+
+import pytest
+
+from src.IR_Ensemble.QA_Assistant.rate_limits import WINDOW
+from src.Simulation.planner import HEADROOM, fit_lognormal, fit_run, max_output_tokens, plan, resource_ceilings
+from src.Simulation.simulate import Scenario, _sweep, run_simulation
+from src.Simulation.virtual_clock import SimulationStalled, VirtualClock, VirtualEventLoop, virtual_time
+
+
+# ───────────────────────────────────────── virtual clock ──────────────────────
+
+def test_virtual_loop_jumps_to_the_next_timer():
+    clock = VirtualClock()
+    seen = []
+
+    async def sleeper(delay):
+        await asyncio.sleep(delay)
+        seen.append((delay, clock.now, time.monotonic()))
+
+    async def main():
+        await asyncio.gather(sleeper(3_600), sleeper(60), asyncio.to_thread(sum, [1, 2]))
+
+    started = time.perf_counter()
+    with virtual_time(clock):
+        loop = VirtualEventLoop(clock)
+        try:
+            loop.run_until_complete(main())
+        finally:
+            loop.close()
+    assert time.perf_counter() - started < 5
+    assert [d for d, _, _ in seen] == [60, 3_600]
+    assert all(now == mono and now >= delay for delay, now, mono in seen)
+    assert time.monotonic() != clock.now                          # patched only inside
+
+
+def test_virtual_loop_reports_a_stall():
+    clock = VirtualClock()
+    with virtual_time(clock):
+        loop = VirtualEventLoop(clock)
+        try:
+            with pytest.raises(SimulationStalled):
+                loop.run_until_complete(asyncio.Event().wait())
+        finally:
+            loop.close()
+
+
+# ───────────────────────────────────────── scenarios ──────────────────────────
+
+def test_small_scenario_is_reproducible():
+    scenario = Scenario(topics=2, topic_concurrency=2, questions_per_topic=2, seed=3)
+    first, second = run_simulation(scenario), run_simulation(scenario)
+    assert first.makespan == second.makespan > 0
+    assert len(first.topic_times) == 2 and max(first.topic_times) == first.makespan
+    assert first.calls == second.calls
+    assert {"SEARCH_CALL", "UPDATE_CALL"} <= set(first.calls)
+    assert first.topics_per_min == pytest.approx(120 / first.makespan)
+    assert "scenario baseline: 2 topics" in first.summary()
+
+
+def test_sweep_builds_one_scenario_per_value():
+    scenarios = _sweep(Scenario(), "max_workers=3,8")
+    assert [(s.name, s.max_workers) for s in scenarios] == [("max_workers=3", 3), ("max_workers=8", 8)]
+    assert _sweep(Scenario(), None) == [Scenario()]
+    with pytest.raises(SystemExit):
+        _sweep(Scenario(), "no_such_field=1")
+
+
+# ───────────────────────────────────────── planner ────────────────────────────
+
+def _events():
+    """Two topics, three UPDATE_CALLs each, one of them a failed attempt, plus a 429."""
+    events = []
+    for topic, start in ((1, 0.0), (2, 100.0)):
+        for i, output in enumerate((900, 1_000, 1_100)):
+            tags = {"ts": start + 30 * i, "stage": "UPDATE_CALL", "model": "gpt-4.1-mini", "topic": topic}
+            events.append({**tags, "metric": "reserved_tokens", "value": 8_000})
+            if i == 2 and topic == 2:
+                continue                                   # failed: reserved, never used
+            events += [{**tags, "metric": "used_tokens", "value": 10_000},
+                       {**tags, "metric": "output_tokens", "value": output},
+                       {**tags, "metric": "call_latency_s", "value": 2.0 + output / 500}]
+    events.append({"ts": 5.0, "metric": "daemon_latency_s", "call": "search", "value": 1.5})
+    events.append({"ts": 6.0, "metric": "throttled", "bucket": "gpt-4.1-mini:tok", "value": 1})
+    return events
+
+
+def test_fit_lognormal():
+    assert fit_lognormal([]) is None and fit_lognormal([0, -1]) is None
+    dist = fit_lognormal([1, math.e ** 2])
+    assert dist.median == pytest.approx(math.e, rel=1e-3) and dist.sigma == pytest.approx(1.0)
+
+
+def test_fit_run_groups_events_per_stage_and_topic():
+    fit = fit_run(_events())
+    update = fit.stages["UPDATE_CALL"]
+    assert (update.attempts, update.calls, update.model) == (6, 5, "gpt-4.1-mini")
+    assert sorted(update.output) == [900, 900, 1_000, 1_000, 1_100]
+    assert fit.topics == 2 and fit.topic_seconds == 60.0
+    assert fit.per_topic("UPDATE_CALL") == 3 and fit.per_topic("SEARCH_CALL") == 0
+    assert set(fit.daemon) == {"search"} and fit.throttled == {"gpt-4.1-mini:tok": 1}
+
+
+def test_plan_from_fit():
+    fit = fit_run(_events() * 2)                           # enough samples for every stage fit
+    assert max_output_tokens(fit) == {"UPDATE_CALL": 1_500}  # p99 1 100 × 1.2, rounded up to 250
+    ceilings = resource_ceilings(fit)
+    per_min = 60.0 / WINDOW
+    rpm = "gpt-4.1-mini@IR_AZURE_OPENAI_ENDPOINT:rpm"
+    tpm = "gpt-4.1-mini@IR_AZURE_OPENAI_ENDPOINT:tpm"
+    assert ceilings[rpm] == pytest.approx(HEADROOM * 200 * per_min / 6)
+    assert ceilings[tpm] == pytest.approx(HEADROOM * 200_000 * per_min / 50_000)
+    assert resource_ceilings(fit, {"gpt-4.1-mini": {"tpm": 20_000}})[tpm] == pytest.approx(ceilings[tpm] / 10)
+
+    result = plan(fit, simulate=False)
+    assert result.bottleneck == tpm
+    assert result.topics_at_once == math.ceil(ceilings[tpm] * fit.topic_seconds / 60)
+    assert result.settings()["max_output_tokens"] == {"UPDATE_CALL": 1_500}
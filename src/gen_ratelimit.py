@@ -1,58 +1,106 @@
-from src.IR_Ensemble.QA_Assistant.token_bucket import AsyncTokenBucket
-from src.IR_Ensemble.QA_Assistant.rate_limits import _count_tokens, PROMPT_BUFFER
+from src.IR_Ensemble.QA_Assistant.rate_limits import PROMPT_BUFFER, quota_registry, count_static_tokens
+from src.IR_Ensemble.QA_Assistant.token_estimator import estimate_tokens
+from src.IR_Ensemble.QA_Assistant.usage_estimator import output_estimator
+from src.IR_Ensemble.QA_Assistant.adaptive_limits import observe_headers, observe_error
+from src.IR_Ensemble.QA_Assistant.retry import with_retries, reached_server
+from src.IR_Ensemble.QA_Assistant.admission import admit, resolve_deadline
+from src.IR_Ensemble.QA_Assistant.call_metrics import call_metrics, record_call, cached_tokens
 from openai import AsyncAzureOpenAI
-# GEN RATE LIMITS
-RPM = 50          # requests per minute
-TPM = 50_000      # tokens per minute
-
-REQ_BUCKET = AsyncTokenBucket(RPM)
-TOK_BUCKET = AsyncTokenBucket(TPM)
+import time
+# GEN RATE LIMITS – RPM / TPM come from the deployment's entry in quotas.QUOTAS
 
 MAX_OUT = 5_000
+MODEL = "gpt-4.1"
 
 async def gated_call_gen(prompt: str,
                          client: AsyncAzureOpenAI,
-                         temperature: float):
+                         temperature: float,
+                         stage: str = "GEN_CALL",
+                         deadline: float | None = None,
+                         max_wait: float | None = None,
+                         topic: int | None = None,
+                         instructions: str | None = None):
     """
-    Throttle a call to the report generator with a token bucket.
+    Throttle a call to the report generator with the request / token buckets
+    of the deployment *client* points at.
+    *stage* keys the output‑token estimator so the generator and evaluator
+    each reserve from their own observed output distribution.
+    *deadline* / *max_wait* bound the queue wait; work that cannot start in
+    time raises `AdmissionRejected` (see `admission`).
+    Per‑call wait / token usage goes to `call_metrics`, tagged with *topic*.
+    *instructions* is the stable system prompt, sent separately so it forms a
+    byte‑identical prefix the provider's prompt cache can serve across calls.
     """
-    toks = _count_tokens(prompt)
-    toks = toks + PROMPT_BUFFER(toks) + MAX_OUT 
-    if toks > TOK_BUCKET.capacity:
-        raise ValueError(f"Prompt is too large: {toks} tokens, max is {TOK_BUCKET.capacity}.")
-    async with REQ_BUCKET.acquire(1) as _, \
-        TOK_BUCKET.acquire(toks) as tok_id:
+    req_bucket, tok_bucket = quota_registry.for_client(client, MODEL)
+    # Cheap calibrated estimate – exact tiktoken runs in a worker thread
+    toks = estimate_tokens(prompt) + count_static_tokens(instructions)
+    expected_out = output_estimator.reserve_for(stage, MODEL, MAX_OUT)
+    toks = toks + PROMPT_BUFFER(toks) + expected_out
+    if toks > tok_bucket.base_capacity:
+        raise ValueError(f"Prompt is too large: {toks} tokens, max is {tok_bucket.base_capacity}.")
+
+    deadline = resolve_deadline(deadline, max_wait)
+    tags = {"stage": stage, "model": MODEL, "topic": topic}
+
+    sent = False   # whether the current attempt's request went out
+
+    async def _create():
+        nonlocal sent
+        started = time.monotonic()
+        sent = True
+        try:
+            raw = await client.responses.with_raw_response.create(
+                model=MODEL,
+                max_output_tokens= MAX_OUT,
+                temperature=temperature,
+                input=prompt,
+                **({"instructions": instructions} if instructions else {}),
+            )
+        finally:
+            call_metrics.observe("call_latency_s", time.monotonic() - started, **tags)
+        # Let the deployment buckets follow the server's rate-limit headers
+        observe_headers(raw.headers, req=req_bucket, tok=tok_bucket)
+        return raw.parse()
+
+    async def _attempt():
+        # Each attempt re-gates; a failed attempt gives its reservation back at once
+        nonlocal sent
+        sent = False
+        entered = time.monotonic()
+        admit([(req_bucket, 1), (tok_bucket, toks)], deadline, label=stage)
+        async with req_bucket.acquire(1, deadline=deadline) as req_id:
+            tok_id = None
             try:
-                response = await client.responses.create(
-                    model="gpt-4.1",
-                    max_output_tokens= MAX_OUT,
-                    temperature=temperature,
-                    input=prompt,
-                )
-                return response
+                async with tok_bucket.acquire(toks, deadline=deadline) as tok_id:
+                    call_metrics.observe("queue_wait_s", time.monotonic() - entered, **tags)
+                    response = await _create()
             except Exception as e:
-                # If the call fails attempt a recall
-                try:
-                    response = await client.responses.create(
-                        model="gpt-4.1",
-                        max_output_tokens= MAX_OUT,
-                        temperature=temperature,
-                        input=prompt,
-                    )
-                    return response
-                except Exception as e:
-                    print(f"Failed to call generator: {e}")
-                    raise 
-            finally:
-                await refund_tokens(tok_id, response.usage.total_tokens, toks)
-
-
-async def refund_tokens(tok_id: str, used: int, reserved: int) -> None:
+                observe_error(e, req=req_bucket, tok=tok_bucket)
+                if not (sent and reached_server(e)):
+                    await req_bucket.credit_by_id(req_id)   # the server never saw it
+                if tok_id is not None:
+                    await tok_bucket.credit_by_id(tok_id)
+                    record_call(reserved=toks, used=None, **tags)
+                print(f"Failed to call generator: {e}")
+                raise
+        output_estimator.observe(stage, MODEL, response.usage.output_tokens)
+        record_call(reserved=toks, used=response.usage.total_tokens,
+                    output=response.usage.output_tokens, cached=cached_tokens(response.usage), **tags)
+        await refund_tokens(tok_bucket, tok_id, response.usage.total_tokens, toks)
+        return response
+
+    return await with_retries(_attempt, label=stage, deadline=deadline)
+
+
+async def refund_tokens(bucket, tok_id: str, used: int, reserved: int) -> None:
     """
-    Refund tokens to the token bucket.
+    Refund surplus tokens to the token bucket, or charge an overrun when the
+    predicted reservation was too small.
     """
     if reserved > used:
         surplus = reserved - used
-        await TOK_BUCKET.credit_by_id(tok_id, surplus)
+        await bucket.credit_by_id(tok_id, surplus)
+    elif used > reserved:
+        await bucket.debit_by_id(tok_id, used - reserved)
     
     
\ No newline at end of file